@@ -0,0 +1,187 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('async_pager')
+
+class Lane:
+    """
+    A contiguous range of post IDs paginated from newest to oldest.
+    cursor is the exclusive upper bound (max_id), floor the exclusive
+    lower bound (since_id).
+    """
+
+    def __init__(self, cursor, floor, done=False):
+        self.cursor = cursor
+        self.floor = floor
+        self.done = done
+        # 已被消费者处理（可安全写入检查点）的进度
+        self.committed_cursor = cursor
+        self.committed_done = done
+
+    def width(self):
+        return self.cursor - self.floor
+
+    def to_dict(self):
+        """Committed state for checkpoints."""
+        return {"cursor": self.committed_cursor, "floor": self.floor, "done": self.committed_done}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["cursor"], data["floor"], data.get("done", False))
+
+    def __repr__(self):
+        return f"Lane(cursor={self.cursor}, floor={self.floor}, done={self.done})"
+
+class PaginationEngine:
+    """
+    Paginates an account timeline concurrently by splitting the ID range.
+
+    Snowflake IDs grow with time, so the history between floor_id and
+    start_id can be cut into lanes that are paged independently with
+    max_id/since_id. Each lane is a producer that fetches its pages in
+    order; a single consumer receives every page through a queue. A
+    semaphore bounds the requests in flight to the proxy's concurrency
+    limit, and when a lane finishes early the widest remaining lane is
+    split in two so the allowed concurrency stays in use. Every cursor is
+    requested at most once. A failed request is retried after a backoff
+    that does not hold a semaphore slot, so other lanes keep fetching.
+
+    Lane progress is committed only after the consumer has handled a
+    page, so a checkpoint taken from lane_state() never points past a
+    page that was not saved.
+    """
+
+    def __init__(self, fetch_page, concurrency=5, page_size=20, max_attempts=3, min_split_width=0, retry_delay=1):
+        # fetch_page(max_id, since_id) -> list of raw posts, newest first (blocking)
+        self.fetch_page = fetch_page
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.max_attempts = max_attempts
+        self.min_split_width = min_split_width
+        self.retry_delay = retry_delay
+        self.requests_made = 0
+        self.failed_lanes = []
+        self._requested = set()
+        self._lanes = []
+        self._tasks = set()
+
+    @staticmethod
+    def make_lanes(start_id, floor_id, count):
+        """Cuts (floor_id, start_id) into count lanes of equal ID width."""
+        step = max(1, (start_id - floor_id) // count)
+        lanes = []
+        upper = start_id
+        for i in range(count):
+            lower = floor_id if i == count - 1 else max(floor_id, upper - step)
+            # max_id 和 since_id 都不包含边界本身，相邻分段需要错开1
+            lanes.append(Lane(upper if i == 0 else upper + 1, lower))
+            upper = lower
+            if lower == floor_id:
+                break
+        return lanes
+
+    async def _fetch(self, lane, semaphore):
+        for attempt in range(self.max_attempts):
+            if attempt:
+                # 退避期间不占用并发名额，其他分段可以继续请求
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            async with semaphore:
+                try:
+                    self.requests_made += 1
+                    return await asyncio.to_thread(self.fetch_page, lane.cursor, lane.floor)
+                except Exception as e:
+                    logger.warning(f"Error fetching max_id={lane.cursor} (attempt {attempt + 1}): {e}")
+        return None
+
+    async def _run_lane(self, lane, semaphore, queue):
+        while not lane.done:
+            if lane.cursor in self._requested:
+                # 已有其他分段请求过这个游标，避免重复付费
+                lane.done = True
+                break
+
+            self._requested.add(lane.cursor)
+            posts = await self._fetch(lane, semaphore)
+
+            if posts is None:
+                logger.error(f"Giving up on {lane}")
+                self.failed_lanes.append(lane)
+                lane.done = True
+                break
+
+            # 分段在请求期间可能被拆分，下界以下的帖子属于新分段
+            page = [post for post in posts if int(post["id"]) > lane.floor]
+            if page:
+                lane.cursor = min(int(post["id"]) for post in page)
+
+            if len(posts) < self.page_size or not page or lane.cursor <= lane.floor + 1:
+                lane.done = True
+
+            await queue.put((lane, page, lane.cursor, lane.done))
+
+        self._split_widest(semaphore, queue)
+
+    def _split_widest(self, semaphore, queue):
+        active = [lane for lane in self._lanes if not lane.done]
+        if not active or len(active) >= self.concurrency:
+            return
+
+        widest = max(active, key=Lane.width)
+        if widest.width() <= max(self.min_split_width, 2):
+            return
+
+        mid = widest.floor + widest.width() // 2
+        new_lane = Lane(mid + 1, widest.floor)
+        widest.floor = mid
+        self._start_lane(new_lane, semaphore, queue)
+
+    def _start_lane(self, lane, semaphore, queue):
+        self._lanes.append(lane)
+        task = asyncio.ensure_future(self._run_lane(lane, semaphore, queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def lane_state(self):
+        """Committed state of every lane, for checkpoints."""
+        return [lane.to_dict() for lane in self._lanes]
+
+    async def run(self, lanes, on_page, on_checkpoint=None, checkpoint_every=20):
+        """
+        Pages every lane to completion. on_page(posts) is called by the
+        consumer for each page, in arrival order; on_checkpoint(lane_state)
+        every checkpoint_every pages and once at the end.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        queue = asyncio.Queue()
+
+        async def consume():
+            pages = 0
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                lane, page, cursor, done = item
+                if page:
+                    on_page(page)
+                lane.committed_cursor = cursor
+                lane.committed_done = done
+                pages += 1
+                if on_checkpoint and pages % checkpoint_every == 0:
+                    on_checkpoint(self.lane_state())
+
+        consumer = asyncio.ensure_future(consume())
+        for lane in lanes:
+            if lane.done:
+                # 从检查点恢复的已完成分段只用于保存状态
+                self._lanes.append(lane)
+            else:
+                self._start_lane(lane, semaphore, queue)
+
+        # 分段完成时可能拆出新分段，等到没有任务为止
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+        await queue.put(None)
+        await consumer
+        if on_checkpoint:
+            on_checkpoint(self.lane_state())
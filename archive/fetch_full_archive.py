@@ -3,8 +3,13 @@ import json
 import os
 import time
 import csv
+import sys
 from tqdm import tqdm  # Import progress bar
 
+# 与抓取脚本共用连接池（本脚本位于 archive/ 子目录）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import get_session, get_metrics
+
 # Load credentials from environment variables
 SCRAPEOPS_API_KEY = os.getenv("SCRAPE_PROXY_KEY")
 SCRAPEOPS_ENDPOINT = "https://proxy.scrapeops.io/v1/"
@@ -19,9 +24,7 @@ def scrape(url, headers=None):
     if not SCRAPEOPS_API_KEY:
         raise ValueError("Missing SCRAPE_PROXY_KEY environment variable")
 
-    session = requests.Session()
-    if headers:
-        session.headers.update(headers)
+    session = get_session()
 
     proxy_params = {
         'api_key': SCRAPEOPS_API_KEY,
@@ -30,7 +33,7 @@ def scrape(url, headers=None):
         'bypass': 'cloudflare_level_1'
     }
 
-    response = session.get(SCRAPEOPS_ENDPOINT, params=proxy_params, timeout=120)
+    response = session.get(SCRAPEOPS_ENDPOINT, params=proxy_params, headers=headers, timeout=120)
     response.raise_for_status()
     
     return response.json()
@@ -161,6 +164,8 @@ def fetch_all_posts():
 
     pbar.close()  # Close tqdm progress bar
     print(f"\n✅ Full archive fetch complete. Saved {len(all_posts)} posts.")
+    metrics = get_metrics()
+    print(f"📡 {metrics['requests']} requests over {metrics['connections_opened']} connections")
 
 if __name__ == "__main__":
     fetch_all_posts()
\ No newline at end of file
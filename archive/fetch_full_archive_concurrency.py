@@ -1,28 +1,40 @@
-import requests
 import json
 import os
-import time
 import csv
-import concurrent.futures
+import sys
+import asyncio
+import argparse
+from datetime import datetime, timezone
 from tqdm import tqdm
 
+# 与抓取脚本共用 HTTP 客户端和存档工具（本脚本位于 archive/ 子目录）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import create_session, get_metrics
+from archive_store import merge_posts
+from id_index import datetime_to_snowflake
+from async_pager import PaginationEngine, Lane
+
 # Load credentials from environment variables
 SCRAPEOPS_API_KEY = os.getenv("SCRAPE_PROXY_KEY")
 SCRAPEOPS_ENDPOINT = "https://proxy.scrapeops.io/v1/"
 OUTPUT_JSON_FILE = "./data/truth_archive_full.json"
 OUTPUT_CSV_FILE = "./data/truth_archive_full.csv"
+CHECKPOINT_FILE = "./data/backfill_checkpoint.json"
+PAGES_FILE = "./data/backfill_pages.jsonl"
+CHECKPOINT_EVERY = 20  # 每处理多少页写一次检查点
 BASE_URL = "https://truthsocial.com/api/v1/accounts/107780257626128497/statuses"
 CONCURRENT_REQUESTS = 5  # ScrapeOps allows 5 concurrent requests
+ACCOUNT_START = datetime(2022, 2, 1, tzinfo=timezone.utc)  # 账号最早的帖子不会早于此时间
+
+# 失败的请求由分页引擎重试（退避时不占用并发名额），会话本身不再重试；
+# fetch_missing_posts 按实际并发数重新创建，连接池不小于同时进行的请求数
+session = create_session(pool_size=CONCURRENT_REQUESTS, max_retries=0)
 
 def scrape(url, headers=None):
     """ Makes a GET request through the ScrapeOps proxy. """
     if not SCRAPEOPS_API_KEY:
         raise ValueError("Missing SCRAPE_PROXY_KEY environment variable")
 
-    session = requests.Session()
-    if headers:
-        session.headers.update(headers)
-
     proxy_params = {
         'api_key': SCRAPEOPS_API_KEY,
         'url': url,
@@ -30,7 +42,7 @@ def scrape(url, headers=None):
         'bypass': 'cloudflare_level_1'
     }
 
-    response = session.get(SCRAPEOPS_ENDPOINT, params=proxy_params, timeout=120)
+    response = session.get(SCRAPEOPS_ENDPOINT, params=proxy_params, headers=headers, timeout=120)
     response.raise_for_status()
     
     return response.json()
@@ -99,71 +111,139 @@ def extract_posts(json_response):
 
     return extracted_data
 
-def fetch_posts_batch(max_ids):
-    """ Fetches multiple pages concurrently given a list of max_ids. """
+def fetch_page(max_id, since_id):
+    """ Fetches one page of posts with id in (since_id, max_id), newest first. """
     headers = {
         'accept': 'application/json, text/plain, */*',
         'referer': 'https://truthsocial.com/@realDonaldTrump'
     }
+    url = (f"{BASE_URL}?exclude_replies=true&only_replies=false&with_muted=true"
+           f"&limit=20&max_id={max_id}&since_id={since_id}")
+    return scrape(url, headers) or []
 
-    results = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS) as executor:
-        future_to_id = {
-            executor.submit(scrape, f"{BASE_URL}?exclude_replies=true&only_replies=false&with_muted=true&limit=20&max_id={max_id}", headers): max_id
-            for max_id in max_ids
-        }
-
-        for future in tqdm(concurrent.futures.as_completed(future_to_id), total=len(max_ids), desc="Fetching posts"):
-            try:
-                response = future.result()
-                new_posts = extract_posts(response)
-                if new_posts:
-                    results.extend(new_posts)
-            except Exception as e:
-                print(f"❌ Error fetching batch {future_to_id[future]}: {e}")
-
-    return results
-
-def fetch_missing_posts():
+def save_checkpoint(lane_state, start_id, floor_id, pages_file):
+    """
+    Atomically writes the committed lane cursors. The pages file is synced
+    first so the checkpoint never refers to pages that are not on disk.
+    """
+    pages_file.flush()
+    os.fsync(pages_file.fileno())
+
+    checkpoint = {
+        "start_id": start_id,
+        "floor_id": floor_id,
+        "lanes": lane_state,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+    tmp_file = f"{CHECKPOINT_FILE}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+def load_checkpoint():
+    """ Loads the checkpoint and every post fetched before the interruption. """
+    with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+
+    fetched = {}
+    if os.path.exists(PAGES_FILE):
+        with open(PAGES_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    post = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 中断时写了一半的最后一行
+                fetched[post["id"]] = post
+
+    return checkpoint, fetched
+
+def fetch_missing_posts(resume=False, concurrency=CONCURRENT_REQUESTS):
     """
     Fetches missing posts, starting from the oldest archived post.
-    Uses concurrent requests for efficiency.
+    The remaining history is split into ID ranges that an asyncio engine
+    pages concurrently, with at most `concurrency` requests in flight
+    (the ScrapeOps concurrency limit).
+
+    Fetched posts are appended to PAGES_FILE as they arrive and the lane
+    cursors are checkpointed every CHECKPOINT_EVERY pages, so an
+    interrupted run continues with resume=True without paying for the
+    pages it already has.
     """
-    existing_posts, oldest_post_id = load_existing_posts()
-    all_posts = existing_posts[:]
-    request_count = 0
-    max_ids = [oldest_post_id] if oldest_post_id else []
+    global session
+    if session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"] != concurrency:
+        session.close()
+        session = create_session(pool_size=concurrency, max_retries=0)
 
-    print("🔄 Fetching older posts with concurrency...")
-
-    with tqdm(desc="Fetching requests", unit="requests") as progress_bar:
-        while max_ids:
-            # Fetch posts in parallel batches
-            new_posts = fetch_posts_batch(max_ids)
+    existing_posts, oldest_post_id = load_existing_posts()
 
-            if not new_posts:
-                print("✅ No more older posts found. Archive is complete.")
-                break
+    if resume:
+        if not os.path.exists(CHECKPOINT_FILE):
+            print(f"❌ No checkpoint found at {CHECKPOINT_FILE}")
+            return
+        checkpoint, fetched = load_checkpoint()
+        start_id, floor_id = checkpoint["start_id"], checkpoint["floor_id"]
+        lanes = [Lane.from_dict(lane) for lane in checkpoint["lanes"]]
+        print(f"📌 Resuming from checkpoint ({checkpoint['updated_at']}) with {len(fetched)} posts already fetched")
+    else:
+        if os.path.exists(CHECKPOINT_FILE):
+            print(f"⚠️ Found an unfinished backfill at {CHECKPOINT_FILE}. Run with --resume, or delete it to start over.")
+            return
+        start_id = int(oldest_post_id) if oldest_post_id else datetime_to_snowflake(datetime.now(timezone.utc))
+        floor_id = datetime_to_snowflake(ACCOUNT_START)
+        lanes = PaginationEngine.make_lanes(start_id, floor_id, concurrency)
+        fetched = {}
+        if os.path.exists(PAGES_FILE):
+            os.remove(PAGES_FILE)
+
+    engine = PaginationEngine(fetch_page, concurrency=concurrency)
+    pending = len([lane for lane in lanes if not lane.done])
+    print(f"🔄 Fetching older posts with {pending} concurrent lanes...")
+
+    with open(PAGES_FILE, 'a', encoding='utf-8') as pages_file, \
+            tqdm(desc="Fetching posts", unit="posts", initial=len(fetched)) as progress_bar:
+        def on_page(raw_posts):
+            new_posts = [post for post in extract_posts(raw_posts) if post["id"] not in fetched]
+            for post in new_posts:
+                fetched[post["id"]] = post
+                pages_file.write(json.dumps(post) + "\n")
+            progress_bar.update(len(new_posts))
 
-            # Sort new posts (most recent first) & extend archive
-            new_posts.sort(key=lambda post: post["created_at"], reverse=True)
-            all_posts.extend(new_posts)
+        def on_checkpoint(lane_state):
+            save_checkpoint(lane_state, start_id, floor_id, pages_file)
 
-            # Prepare next batch of max_ids for concurrent fetching
-            max_ids = [post["id"] for post in new_posts[-CONCURRENT_REQUESTS:]]  # Fetch older posts
-            request_count += len(new_posts)
-            progress_bar.update(len(new_posts))
+        try:
+            asyncio.run(engine.run(lanes, on_page, on_checkpoint, CHECKPOINT_EVERY))
+        except KeyboardInterrupt:
+            on_checkpoint(engine.lane_state())
+            print(f"\n⏸️ Interrupted. Progress saved to {CHECKPOINT_FILE}; continue with --resume.")
+            return
 
-            print(f"🔄 Request batch {request_count} complete. Next max_ids: {max_ids}")
+    print(f"✅ Fetched {len(fetched)} posts in {engine.requests_made} requests.")
+    if engine.failed_lanes:
+        print(f"⚠️ {len(engine.failed_lanes)} ranges failed and were not completed: {engine.failed_lanes}")
+        print(f"⏸️ Progress saved to {CHECKPOINT_FILE}; run again with --resume to retry them.")
+        return
 
-            # Sleep to avoid excessive server load
-            time.sleep(1)
+    # 新抓取的帖子都比存档中的更早，按ID合并保持最新优先
+    all_posts = merge_posts(existing_posts, fetched.values())
 
     # Save updated archive
     save_to_json(all_posts, OUTPUT_JSON_FILE)
     save_to_csv(all_posts, OUTPUT_CSV_FILE)
 
+    # 存档已保存，检查点不再需要
+    os.remove(CHECKPOINT_FILE)
+    os.remove(PAGES_FILE)
+
     print(f"✅ Archive update complete. Total posts saved: {len(all_posts)}.")
+    metrics = get_metrics(session)
+    print(f"📡 {metrics['requests']} requests over {metrics['connections_opened']} connections")
 
 if __name__ == "__main__":
-    fetch_missing_posts()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Backfill older posts into the full archive")
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted backfill from its checkpoint')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENT_REQUESTS,
+                        help='Maximum requests in flight (the proxy plan\'s concurrency limit)')
+    args = parser.parse_args()
+
+    fetch_missing_posts(resume=args.resume, concurrency=args.concurrency)
@@ -0,0 +1,576 @@
+import re
+import json
+import os
+import csv
+import logging
+import argparse
+from id_index import PostIdIndex
+from post import Post
+from sqlite_store import PostDatabase
+
+logger = logging.getLogger('archive_store')
+
+_SEPARATOR_RE = re.compile(r'[\s,]*')
+
+CSV_HEADER = ["id", "created_at", "content", "url", "media", "replies_count", "reblogs_count", "favourites_count"]
+
+def post_to_csv_row(post):
+    """
+    Converts a post (dict or Post) to a CSV row matching CSV_HEADER.
+    """
+    if isinstance(post, Post):
+        return post.to_csv_row()
+    media_urls = "; ".join(post.get("media", []))
+    return [
+        post.get("id"),
+        post.get("created_at"),
+        post.get("content", ""),
+        post.get("url"),
+        media_urls,
+        post.get("replies_count", 0),
+        post.get("reblogs_count", 0),
+        post.get("favourites_count", 0)
+    ]
+
+def _post_id(post):
+    return post.id if isinstance(post, Post) else int(post["id"])
+
+def _insert_position(posts, post_id, lo=0):
+    """
+    Binary search over posts ordered by descending ID: returns the first
+    index at or after lo whose ID is not greater than post_id.
+    """
+    hi = len(posts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _post_id(posts[mid]) > post_id:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def merge_posts(existing_posts, new_posts):
+    """
+    Merges new posts into an archive that is already ordered newest first.
+
+    Posts are ordered by their integer snowflake ID, which increases with
+    creation time. Only the new posts are sorted; each is placed with a
+    binary search and the existing posts between them are copied in bulk,
+    so the cost is O(n + k log n). Records in new_posts replace existing
+    records with the same ID. Posts may be dicts or Post records.
+    """
+    if not isinstance(existing_posts, list):
+        existing_posts = list(existing_posts)
+    new_posts = sorted(new_posts, key=_post_id, reverse=True)
+
+    merged = []
+    start = 0
+    for post in new_posts:
+        post_id = _post_id(post)
+        pos = _insert_position(existing_posts, post_id, start)
+        merged.extend(existing_posts[start:pos])
+        if pos < len(existing_posts) and _post_id(existing_posts[pos]) == post_id:
+            pos += 1  # 替换已有记录
+        merged.append(post)
+        start = pos
+    merged.extend(existing_posts[start:])
+    return merged
+
+def iter_json_array(file_path, buffer_size=1 << 20):
+    """
+    Yields the items of a JSON array file one at a time, reading the file
+    in blocks instead of loading the whole array.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(buffer_size)
+        pos = _SEPARATOR_RE.match(buffer).end()
+        if buffer[pos:pos + 1] != '[':
+            raise ValueError(f"{file_path} is not a JSON array")
+        pos += 1
+        eof = False
+        while True:
+            pos = _SEPARATOR_RE.match(buffer, pos).end()
+            if buffer.startswith(']', pos):
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise
+                # 缓冲区末尾的对象不完整，丢弃已解析部分后继续读取
+                chunk = f.read(buffer_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield item
+
+def iter_jsonl(file_path):
+    """
+    Yields the records of a JSON Lines file, skipping corrupt lines.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # 进程在写入过程中被中断时，最后一行可能不完整
+                logger.warning(f"Skipping corrupt line {line_no} in {file_path}")
+
+def write_json_array(posts, file_path):
+    """
+    Writes posts as a JSON array, one post at a time, atomically.
+    The output is identical to json.dump(posts, f, indent=2).
+    Returns the number of posts written.
+    """
+    count = 0
+    tmp_file = f"{file_path}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for post in posts:
+            f.write(',\n  ' if count else '\n  ')
+            f.write(json.dumps(post, indent=2, default=Post.to_dict).replace('\n', '\n  '))
+            count += 1
+        f.write('\n]' if count else ']')
+    os.replace(tmp_file, file_path)
+    return count
+
+def write_csv(posts, file_path):
+    """
+    Writes a complete CSV file for the given posts (already ordered).
+    posts may be any iterable, so a streamed archive is never held in memory.
+    """
+    logger.info(f"Saving posts to CSV file: {file_path}")
+    tmp_file = f"{file_path}.tmp"
+    with open(tmp_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for post in posts:
+            writer.writerow(post_to_csv_row(post))
+    os.replace(tmp_file, file_path)
+
+class ArchiveStore:
+    """
+    Archive storage with an append-only segment and a compacted snapshot.
+
+    New posts are appended as one JSON object per line to the segment file,
+    so a run with a single new post only writes that post. The snapshot
+    (the JSON array published as truth_archive.json) is rewritten only when
+    the segment is compacted.
+
+    The CSV export works the same way: new rows are appended in
+    chronological order to csv_segment_file and merged into the
+    newest-first csv_file on compaction or export.
+
+    With columns_dir set, new posts are also appended as a part of the
+    optional columnar export (see columnar.ColumnarExport).
+    """
+
+    def __init__(self, snapshot_file, segment_file, index_file=None, csv_file=None, csv_segment_file=None,
+                 append_only=True, compact_threshold=500, columns_dir=None, columns_format="auto"):
+        self.snapshot_file = snapshot_file
+        self.segment_file = segment_file
+        self.index_file = index_file
+        self.csv_file = csv_file
+        self.csv_segment_file = csv_segment_file
+        self.append_only = append_only
+        self.compact_threshold = compact_threshold
+        self.columns = None
+        if columns_dir:
+            # 列式导出默认关闭，只在开启时导入（会导入 pyarrow/numpy）
+            from columnar import ColumnarExport
+            self.columns = ColumnarExport(columns_dir, columns_format)
+        self._segment_count = None
+        self._index = None
+
+    def exists(self):
+        """Whether the archive has any data on disk."""
+        return os.path.exists(self.snapshot_file) or os.path.exists(self.segment_file)
+
+    def _iter_snapshot(self):
+        if not os.path.exists(self.snapshot_file):
+            return iter(())
+        return iter_json_array(self.snapshot_file)
+
+    def _read_segment(self):
+        if not os.path.exists(self.segment_file):
+            self._segment_count = 0
+            return []
+
+        posts = list(iter_jsonl(self.segment_file))
+        self._segment_count = len(posts)
+        return posts
+
+    def segment_count(self):
+        """Number of records waiting in the segment file."""
+        if self._segment_count is None:
+            self._read_segment()
+        return self._segment_count
+
+    def iter_posts(self, as_records=False):
+        """
+        Yields the full archive, newest first, without loading it.
+        The snapshot is parsed incrementally and the (small) segment is
+        merged in by ID; segment records override snapshot records with
+        the same id. With as_records=True posts are yielded as Post
+        records instead of dicts.
+        """
+        posts = self._iter_merged()
+        return map(Post.from_dict, posts) if as_records else posts
+
+    def _iter_merged(self):
+        # 同一帖子在分段中出现多次时，以最后一条记录为准
+        segment_posts = {post["id"]: post for post in self._read_segment()}
+        pending = sorted(segment_posts.values(), key=lambda post: int(post["id"]), reverse=True)
+        pending_ids = [int(post["id"]) for post in pending]
+
+        i = 0
+        for post in self._iter_snapshot():
+            post_id = int(post["id"])
+            while i < len(pending) and pending_ids[i] > post_id:
+                yield pending[i]
+                i += 1
+            if i < len(pending) and pending_ids[i] == post_id:
+                post = pending[i]  # 替换已有记录
+                i += 1
+            yield post
+        yield from pending[i:]
+
+    def load_posts(self, as_records=False):
+        """
+        Loads the full archive, newest first.
+        Prefer iter_posts when the posts are only read once, and
+        as_records=True when they are kept in memory.
+        """
+        return list(self.iter_posts(as_records))
+
+    def posts_newer_than(self, post_id=None, limit=None):
+        """
+        Returns the Post records with an ID greater than post_id (all posts
+        if None), newest first, at most limit of them. Reading stops at the
+        first older post.
+        """
+        posts = []
+        for post in self.iter_posts(as_records=True):
+            if (post_id is not None and post.id <= int(post_id)) or (limit is not None and len(posts) >= limit):
+                break
+            posts.append(post)
+        return posts
+
+    def load_index(self):
+        """
+        Returns the on-disk ID index, rebuilding it if it is missing or
+        older than the archive files.
+        """
+        if self._index is not None:
+            return self._index
+
+        index = PostIdIndex(self.index_file)
+        if index.is_stale(self.snapshot_file, self.segment_file):
+            index.close()
+            index = PostIdIndex.build(self.index_file, (post["id"] for post in self.iter_posts()))
+
+        self._index = index
+        return index
+
+
+    def _touch_index(self):
+        # 快照重写不改变帖子ID集合，刷新索引时间戳以免下次启动时重建
+        if self.index_file and os.path.exists(self.index_file):
+            os.utime(self.index_file)
+
+    def append_posts(self, posts):
+        """
+        Appends new posts to the archive.
+        In append-only mode only the new records are written; otherwise the
+        snapshot is rewritten immediately.
+        """
+        if not posts:
+            return
+
+        # 在写入前打开索引，这样刚写入的文件不会让索引被误判为过期
+        index = self.load_index() if self.index_file else None
+
+        if not self.append_only:
+            all_posts = merge_posts(self.load_posts(), posts)
+            self._write_snapshot(all_posts)
+            if self.csv_file:
+                write_csv(all_posts, self.csv_file)
+            if index is not None:
+                index.add(_post_id(post) for post in posts)
+                self._touch_index()
+            self._append_columns(posts)
+            return
+
+        segment_count = self.segment_count()
+        logger.info(f"Appending {len(posts)} posts to segment file: {self.segment_file}")
+        with open(self.segment_file, 'a', encoding='utf-8') as f:
+            for post in posts:
+                f.write(json.dumps(post, default=Post.to_dict) + "\n")
+        self._segment_count = segment_count + len(posts)
+        if self.csv_file and not os.path.exists(self.csv_file):
+            # 还没有CSV时先完整生成一次，之后只追加新行
+            write_csv(self.iter_posts(), self.csv_file)
+        elif self.csv_segment_file:
+            self._append_csv_rows(posts)
+        if index is not None:
+            index.add(_post_id(post) for post in posts)
+            self._touch_index()
+        self._append_columns(posts)
+
+        if self.compact_threshold and self._segment_count >= self.compact_threshold:
+            self.compact()
+
+    def update_counts(self, posts):
+        """
+        Records new engagement counts for archived posts.
+        In append-only mode the updated records go to the segment, where
+        they override the snapshot, so nothing is rewritten.
+        """
+        self.append_posts(posts)
+
+    def _append_columns(self, posts):
+        if self.columns is None or not self.columns.enabled:
+            return
+        if not self.columns.parts():
+            # 还没有列式导出时先从完整存档生成一次，之后只写新帖子
+            self.columns.rebuild(self.iter_posts())
+        else:
+            self.columns.append(posts)
+
+    def export_columns(self):
+        """Rebuilds the columnar export from the full archive."""
+        if self.columns is None:
+            raise ValueError("ArchiveStore has no columns_dir configured")
+        return self.columns.rebuild(self.iter_posts())
+
+    def _append_csv_rows(self, posts):
+        write_header = not os.path.exists(self.csv_segment_file)
+        with open(self.csv_segment_file, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(CSV_HEADER)
+            for post in sorted(posts, key=_post_id):
+                writer.writerow(post_to_csv_row(post))
+
+    def _iter_csv_rows(self, file_path):
+        with open(file_path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)  # 跳过表头
+            for row in reader:
+                yield row
+
+    def export_csv(self, output_file):
+        """
+        Writes the newest-first CSV view to output_file by merging the
+        chronological CSV segment into the existing CSV, row by row.
+        """
+        if not self.csv_file:
+            raise ValueError("ArchiveStore has no csv_file configured")
+
+        if not os.path.exists(self.csv_file):
+            # 首次生成（或升级前没有CSV），从完整存档写出
+            write_csv(self.iter_posts(), output_file)
+            return
+
+        pending = []
+        if self.csv_segment_file and os.path.exists(self.csv_segment_file):
+            pending = list(self._iter_csv_rows(self.csv_segment_file))
+
+        # 同一帖子的较新记录覆盖旧记录，然后按ID降序与现有CSV合并
+        latest = {}
+        for row in pending:
+            latest[row[0]] = row
+        pending = sorted(latest.values(), key=lambda row: int(row[0]), reverse=True)
+
+        tmp_file = f"{output_file}.tmp"
+        with open(tmp_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            i = 0
+            for row in self._iter_csv_rows(self.csv_file):
+                if row[0] in latest:
+                    continue
+                while i < len(pending) and int(pending[i][0]) > int(row[0]):
+                    writer.writerow(pending[i])
+                    i += 1
+                writer.writerow(row)
+            writer.writerows(pending[i:])
+        os.replace(tmp_file, output_file)
+
+    def _compact_csv(self):
+        if not self.csv_file:
+            return
+        if os.path.exists(self.csv_file) and not (self.csv_segment_file and os.path.exists(self.csv_segment_file)):
+            return
+        self.export_csv(self.csv_file)
+        if self.csv_segment_file and os.path.exists(self.csv_segment_file):
+            os.remove(self.csv_segment_file)
+
+    def _write_snapshot(self, posts):
+        # 逐条写入临时文件再替换，避免中断时留下半个快照
+        count = write_json_array(posts, self.snapshot_file)
+        logger.info(f"Saved {count} posts to JSON file: {self.snapshot_file}")
+
+    def compact(self):
+        """
+        Folds the segment into the snapshot and truncates the segment.
+        """
+        self._compact_csv()
+
+        if not os.path.exists(self.segment_file):
+            self._segment_count = 0
+            return
+
+        logger.info(f"Compacting {self.segment_count()} segment records into {self.snapshot_file}")
+        self._write_snapshot(self.iter_posts())
+        # 快照已包含全部数据；若在此之前中断，重复记录会在加载时按id去重
+        os.remove(self.segment_file)
+        self._segment_count = 0
+        self._touch_index()
+
+class SqliteArchiveStore(ArchiveStore):
+    """
+    Archive storage backed by a SQLite database (sqlite_store.PostDatabase).
+
+    New posts are upserted into the database, and dedup, "newer than" and
+    newest-first reads are indexed queries. truth_archive.json and the CSV
+    are exports, written from an ordered query by compact() and
+    export_csv(). On first use an existing JSON archive (snapshot and
+    segment) is imported into the empty database.
+    """
+
+    def __init__(self, db_file, snapshot_file, segment_file, csv_file=None, csv_segment_file=None,
+                 columns_dir=None, columns_format="auto"):
+        super().__init__(snapshot_file, segment_file, csv_file=csv_file, csv_segment_file=csv_segment_file,
+                         columns_dir=columns_dir, columns_format=columns_format)
+        self.db_file = db_file
+
+    def load_index(self):
+        """
+        Returns the post database, importing the JSON archive into it if
+        the database is still empty.
+        """
+        if self._index is not None:
+            return self._index
+
+        db = PostDatabase(self.db_file)
+        if not len(db) and super().exists():
+            count = db.upsert(super().iter_posts())
+            logger.info(f"Imported {count} posts from {self.snapshot_file} into {self.db_file}")
+        self._index = db
+        return db
+
+    def exists(self):
+        return len(self.load_index()) > 0
+
+    def iter_posts(self, as_records=False):
+        """Yields the full archive, newest first, from the id primary key."""
+        posts = self.load_index().iter_posts()
+        return posts if as_records else map(Post.to_dict, posts)
+
+    def posts_newer_than(self, post_id=None, limit=None):
+        return list(self.load_index().iter_posts(newer_than=post_id, limit=limit))
+
+    def append_posts(self, posts):
+        """Upserts posts into the database; exports are written by compact()."""
+        if not posts:
+            return
+        logger.info(f"Upserting {len(posts)} posts into {self.db_file}")
+        self.load_index().upsert(posts)
+        self._append_columns(posts)
+
+    def update_counts(self, posts):
+        """Updates the engagement counts of archived posts in place."""
+        if not posts:
+            return
+        self.load_index().update_counts(posts)
+        self._append_columns(posts)
+
+    def export_csv(self, output_file):
+        """Writes the newest-first CSV view to output_file."""
+        write_csv(self.iter_posts(as_records=True), output_file)
+
+    def compact(self):
+        """
+        Writes truth_archive.json (and the CSV) from the database and
+        checkpoints the WAL, so the exported files are complete.
+        """
+        db = self.load_index()
+        self._write_snapshot(self.iter_posts())
+        if self.csv_file:
+            self.export_csv(self.csv_file)
+        # 分段文件已导入数据库，快照写出后不再需要
+        for path in (self.segment_file, self.csv_segment_file):
+            if path and os.path.exists(path):
+                os.remove(path)
+        db.checkpoint()
+
+def open_archive_store(snapshot_file=None, segment_file=None, index_file=None, csv_file=None,
+                       csv_segment_file=None, columns_dir=None, db_file=None):
+    """
+    Creates an ArchiveStore using the storage settings from config
+    (a SqliteArchiveStore when storage_mode is "sqlite"); paths left as
+    None are the configured ones. The columnar export is only written
+    when columnar_export is enabled.
+    """
+    # 只在这里读取配置：只用到 merge_posts 等工具函数的脚本（如回填脚本）导入本模块时不会生成 data/config.json
+    import config
+
+    snapshot_file = snapshot_file or config.OUTPUT_JSON_FILE
+    segment_file = segment_file or config.OUTPUT_SEGMENT_FILE
+    index_file = index_file or config.OUTPUT_INDEX_FILE
+    csv_file = csv_file or config.OUTPUT_CSV_FILE
+    csv_segment_file = csv_segment_file or config.OUTPUT_CSV_SEGMENT_FILE
+    columns_dir = columns_dir or config.OUTPUT_COLUMNS_DIR
+    db_file = db_file or config.OUTPUT_DB_FILE
+    columns_dir = columns_dir if config.COLUMNAR_EXPORT != "off" else None
+
+    if config.STORAGE_MODE == "sqlite":
+        return SqliteArchiveStore(
+            db_file,
+            snapshot_file,
+            segment_file,
+            csv_file=csv_file,
+            csv_segment_file=csv_segment_file,
+            columns_dir=columns_dir,
+            columns_format=config.COLUMNAR_EXPORT
+        )
+    return ArchiveStore(
+        snapshot_file,
+        segment_file,
+        index_file=index_file,
+        csv_file=csv_file,
+        csv_segment_file=csv_segment_file,
+        append_only=(config.STORAGE_MODE == "append"),
+        compact_threshold=config.COMPACT_THRESHOLD,
+        columns_dir=columns_dir,
+        columns_format=config.COLUMNAR_EXPORT
+    )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Archive storage maintenance")
+    parser.add_argument('--compact', action='store_true',
+                        help='Fold the append-only segments (or export the SQLite database) into truth_archive.json/csv')
+    parser.add_argument('--export-csv', metavar='PATH', help='Write the newest-first CSV view to PATH without compacting')
+    parser.add_argument('--export-columns', action='store_true',
+                        help='Rebuild the columnar export (Parquet or .npz) from the full archive')
+    args = parser.parse_args()
+
+    if args.compact:
+        open_archive_store().compact()
+    if args.export_csv:
+        open_archive_store().export_csv(args.export_csv)
+    if args.export_columns:
+        store = open_archive_store()
+        if store.columns is None:
+            # 命令行显式要求导出时，即使配置未开启也按 auto 选择格式
+            from columnar import ColumnarExport
+            from config import OUTPUT_COLUMNS_DIR
+            store.columns = ColumnarExport(OUTPUT_COLUMNS_DIR)
+        store.export_columns()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+性能基准脚本 - 用合成数据对比存档处理的不同实现
+
+这个脚本可以:
+1. 对比全量排序与合并插入新帖子的耗时 (merge)
+2. 测量每条帖子的内容规范化耗时 (normalize)
+3. 对比字典与 Post 记录加载存档后的内存占用 (memory)
+4. 对比关注列表合并正则与逐条匹配的吞吐量 (watchlist)
+"""
+
+import os
+import re
+import html
+import time
+import shutil
+import argparse
+import tracemalloc
+from datetime import datetime, timezone
+
+from archive_store import ArchiveStore, merge_posts, open_archive_store, write_json_array
+from normalize import normalize_posts
+from id_index import datetime_to_snowflake, snowflake_to_datetime
+from watchlist import Watchlist
+
+# 合成数据的起点与发帖间隔
+BASE_TIME = datetime(2022, 2, 14, tzinfo=timezone.utc)
+POST_INTERVAL_MS = 7 * 60 * 1000
+
+def make_post(post_id):
+    """生成与抓取结果结构相同的合成帖子"""
+    created_at = snowflake_to_datetime(post_id).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+    return {
+        "id": str(post_id),
+        "created_at": created_at,
+        "content": f"Synthetic post {post_id} for benchmarking the archive.",
+        "url": f"https://truthsocial.com/@realDonaldTrump/{post_id}",
+        "media": [],
+        "replies_count": 100,
+        "reblogs_count": 200,
+        "favourites_count": 300
+    }
+
+def make_posts(count, offset=0):
+    """生成按最新优先排列的合成帖子"""
+    base_id = datetime_to_snowflake(BASE_TIME)
+    ids = [base_id + ((offset + i) * POST_INTERVAL_MS << 16) for i in range(count)]
+    return [make_post(post_id) for post_id in reversed(ids)]
+
+def best_of(func, repeat):
+    """多次运行取最短耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_merge(sizes, new_count=20):
+    """对比 extend + 全量排序 与 merge_posts 合并插入"""
+    print(f"📊 Inserting {new_count} new posts into an archive of N posts")
+    print(f"{'N':>10} {'sort (ms)':>12} {'merge (ms)':>12} {'speedup':>9}")
+
+    for size in sizes:
+        existing = make_posts(size)
+        new_posts = make_posts(new_count, offset=size)
+        repeat = 5 if size <= 100000 else 2
+
+        def full_sort():
+            all_posts = list(existing)
+            all_posts.extend(new_posts)
+            all_posts.sort(key=lambda post: post["created_at"], reverse=True)
+            return all_posts
+
+        def merge():
+            return merge_posts(existing, new_posts)
+
+        assert [p["id"] for p in full_sort()] == [p["id"] for p in merge()]
+
+        sort_time = best_of(full_sort, repeat)
+        merge_time = best_of(merge, repeat)
+        print(f"{size:>10} {sort_time * 1000:>12.1f} {merge_time * 1000:>12.1f} {sort_time / merge_time:>8.1f}x")
+
+def make_raw_status(post):
+    """把存档帖子还原成接口返回的HTML状态，用于规范化基准"""
+    content = html.escape(post.get("content", ""))
+    return {
+        "id": post["id"],
+        "created_at": post.get("created_at"),
+        "content": f'<p>{content} <a href="{post.get("url", "")}" rel="nofollow">link</a></p>',
+        "url": post.get("url"),
+        "media_attachments": [{"url": url} for url in post.get("media", [])],
+        "replies_count": post.get("replies_count", 0),
+        "reblogs_count": post.get("reblogs_count", 0),
+        "favourites_count": post.get("favourites_count", 0)
+    }
+
+def legacy_normalize(posts):
+    """旧实现：每条帖子重新编译正则，并用 unicode_escape 解码"""
+    result = []
+    for post in posts:
+        text = re.sub('<.*?>', '', post.get("content", ""))
+        try:
+            text = text.encode('utf-8').decode('unicode_escape')
+        except Exception:
+            pass
+        result.append(dict(post, content=text.strip()))
+    return result
+
+def bench_normalize(sizes, synthetic=False):
+    """对比旧的逐条清洗与 normalize_posts 批量规范化"""
+    store = open_archive_store()
+    if store.exists() and not synthetic:
+        archive = store.load_posts()
+        print(f"📂 Using the local archive ({len(archive)} posts)")
+        sizes = [len(archive)]
+    else:
+        archive = make_posts(max(sizes))
+        print("📂 Using synthetic posts")
+
+    print(f"{'N':>10} {'legacy (us/post)':>17} {'normalize (us/post)':>20}")
+    for size in sizes:
+        statuses = [make_raw_status(post) for post in archive[:size]]
+        repeat = 3
+
+        legacy_time = best_of(lambda: legacy_normalize(statuses), repeat)
+        new_time = best_of(lambda: normalize_posts(statuses), repeat)
+        print(f"{size:>10} {legacy_time / size * 1e6:>17.2f} {new_time / size * 1e6:>20.2f}")
+
+def measure_memory(func):
+    """返回 func 结果常驻的内存与峰值内存（字节）"""
+    tracemalloc.start()
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+def bench_memory(sizes, bench_dir="./test_data/benchmark"):
+    """对比 load_posts 返回字典与 Post 记录时的内存占用"""
+    print("📊 Memory held by a loaded archive: dicts vs. Post records")
+    print(f"{'N':>10} {'dict (MB)':>10} {'Post (MB)':>10} {'dict B/post':>12} {'Post B/post':>12} {'peak dict/Post (MB)':>20}")
+    os.makedirs(bench_dir, exist_ok=True)
+    try:
+        for size in sizes:
+            snapshot_file = os.path.join(bench_dir, "truth_archive.json")
+            write_json_array(make_posts(size), snapshot_file)
+            store = ArchiveStore(snapshot_file, os.path.join(bench_dir, "truth_archive.jsonl"))
+
+            dict_mem, dict_peak = measure_memory(lambda: store.load_posts())
+            post_mem, post_peak = measure_memory(lambda: store.load_posts(as_records=True))
+            print(f"{size:>10} {dict_mem / 1e6:>10.1f} {post_mem / 1e6:>10.1f} {dict_mem // size:>12} "
+                  f"{post_mem // size:>12} {f'{dict_peak / 1e6:.1f} / {post_peak / 1e6:.1f}':>20}")
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+def make_watchlist(archive, count):
+    """从存档内容中取 count 个不同的词作关键词（不够时补合成词），外加两条正则"""
+    words = []
+    seen = set()
+    for post in archive:
+        for word in re.findall(r"[A-Za-z]{5,}", post.get("content") or ""):
+            if len(words) < count and word.lower() not in seen:
+                seen.add(word.lower())
+                words.append(word)
+    words.extend(f"keyword{i}" for i in range(count - len(words)))
+    return {"keywords": words, "patterns": [r"/\$[A-Z]{2,5}\b/", r"/\b\d+%/"]}
+
+def naive_match(patterns, text):
+    """旧做法：每条规则单独扫描一遍帖子"""
+    return [pattern for pattern in patterns if pattern.search(text)]
+
+def bench_watchlist(sizes, synthetic=False, pattern_counts=(10, 100, 1000)):
+    """对比关注列表（关键词合并成一个字典树正则）与逐条规则匹配的吞吐量"""
+    store = open_archive_store()
+    if store.exists() and not synthetic:
+        archive = store.load_posts()
+        print(f"📂 Using the local archive ({len(archive)} posts)")
+    else:
+        archive = make_posts(max(sizes))
+        print("📂 Using synthetic posts")
+    contents = [post.get("content") or "" for post in archive]
+    megabytes = sum(len(content.encode("utf-8")) for content in contents) / 1e6
+
+    print(f"📊 Matching {len(contents)} posts ({megabytes:.1f} MB) against the watchlist")
+    print(f"{'patterns':>9} {'naive (posts/s)':>16} {'combined (posts/s)':>19} {'combined (MB/s)':>16} {'speedup':>9}")
+    for count in pattern_counts:
+        groups = make_watchlist(archive, count)
+        watchlist = Watchlist(groups)
+        patterns = [
+            re.compile(pattern[1:-1] if pattern.startswith("/") else r"(?<!\w)" + re.escape(pattern) + r"(?!\w)",
+                       re.IGNORECASE)
+            for group in groups.values() for pattern in group
+        ]
+
+        naive_time = best_of(lambda: [naive_match(patterns, content) for content in contents], 1)
+        combined_time = best_of(lambda: [watchlist.match(content) for content in contents], 3)
+        print(f"{len(watchlist):>9} {len(contents) / naive_time:>16.0f} {len(contents) / combined_time:>19.0f} "
+              f"{megabytes / combined_time:>16.1f} {naive_time / combined_time:>8.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="存档处理性能基准")
+    parser.add_argument('--bench', choices=['all', 'merge', 'normalize', 'memory', 'watchlist'],
+                      default='all', help='基准类型: merge=合并插入, normalize=内容规范化, memory=记录内存占用, watchlist=关注列表匹配')
+    parser.add_argument('--sizes', default="10000,100000,1000000",
+                      help='存档规模，逗号分隔')
+    parser.add_argument('--synthetic', action='store_true',
+                      help='normalize/watchlist 基准使用合成数据而不是本地存档')
+
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    if args.bench in ['all', 'merge']:
+        bench_merge(sizes)
+
+    if args.bench in ['all', 'normalize']:
+        bench_normalize(sizes, synthetic=args.synthetic)
+
+    if args.bench in ['all', 'memory']:
+        bench_memory(sizes)
+
+    if args.bench in ['all', 'watchlist']:
+        bench_watchlist(sizes, synthetic=args.synthetic)
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,114 @@
 import os
 import json
-import re
 import csv
+import argparse
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 
-# Try to import ftfy to robustly fix encoding issues
-try:
-    import ftfy
-    def fix_unicode(text):
-        return ftfy.fix_text(text)
-except ImportError:
-    # Fallback: attempt a simple conversion if ftfy isn't installed
-    def fix_unicode(text):
-        try:
-            return text.encode('latin-1').decode('utf-8')
-        except Exception:
-            return text
+from normalize import clean_posts
+from archive_store import CSV_HEADER, post_to_csv_row, iter_json_array
 
-def clean_html(text):
-    """Remove HTML tags from the text."""
-    return re.sub(r'<.*?>', '', text)
+DEFAULT_CHUNK_SIZE = 1000
 
-def process_post(post):
-    """Clean a post's content by stripping HTML and fixing Unicode issues."""
-    raw = post.get("content", "")
-    # First remove HTML tags, then fix any encoding issues
-    clean_text = fix_unicode(clean_html(raw)).strip()
-    post["content"] = clean_text
-    return post
+def iter_chunks(posts, chunk_size):
+    """Groups an iterable of posts into lists of chunk_size."""
+    posts = iter(posts)
+    while True:
+        chunk = list(islice(posts, chunk_size))
+        if not chunk:
+            return
+        yield chunk
 
-def load_archive(file_path):
-    """Load posts from a JSON archive."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def render_chunk(chunk):
+    """
+    Cleans a chunk and serializes it for output, so the expensive work
+    happens in the worker. Returns (posts as JSON array items, CSV rows).
+    """
+    posts = clean_posts(chunk)
+    # 与 json.dump(indent=2) 的数组元素格式保持一致
+    items = ",\n  ".join(json.dumps(post, indent=2, ensure_ascii=False).replace("\n", "\n  ") for post in posts)
+    return items, [post_to_csv_row(post) for post in posts]
 
-def save_json(data, file_path):
-    """Save cleaned data to a JSON file using actual Unicode characters."""
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def render_chunks(chunks, workers):
+    """
+    Renders chunks on a process pool and yields the results in input
+    order. At most two chunks per worker are in flight, so memory stays
+    bounded however large the archive is.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield render_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(render_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def scrub_archive(input_file, output_json_file, output_csv_file, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams the archive through the cleaner and writes JSON and CSV output
+    in the original order. The JSON output is identical to
+    json.dump(posts, f, indent=2, ensure_ascii=False).
+    Both outputs are written to temporary files that replace the targets
+    only once the whole archive has been cleaned, so a bad input or a
+    crash leaves the previous outputs (or an input scrubbed in place)
+    untouched. Returns the number of posts written.
+    """
+    workers = workers or os.cpu_count() or 1
+    count = 0
+    tmp_json_file = f"{output_json_file}.tmp"
+    tmp_csv_file = f"{output_csv_file}.tmp"
+    try:
+        with open(tmp_json_file, 'w', encoding='utf-8') as json_file, \
+                open(tmp_csv_file, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(CSV_HEADER)
+            json_file.write('[')
 
-def save_csv(data, file_path):
-    """Save cleaned data to a CSV file."""
-    with open(file_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            "id", "created_at", "content", "url", "media",
-            "replies_count", "reblogs_count", "favourites_count"
-        ])
-        for post in data:
-            media_urls = "; ".join(post.get("media", []))
-            writer.writerow([
-                post.get("id"),
-                post.get("created_at"),
-                post.get("content", ""),
-                post.get("url"),
-                media_urls,
-                post.get("replies_count", 0),
-                post.get("reblogs_count", 0),
-                post.get("favourites_count", 0)
-            ])
+            for items, rows in render_chunks(iter_chunks(iter_json_array(input_file), chunk_size), workers):
+                json_file.write(',\n  ' if count else '\n  ')
+                json_file.write(items)
+                writer.writerows(rows)
+                count += len(rows)
+
+            json_file.write('\n]' if count else ']')
+    except BaseException:
+        for tmp_file in (tmp_json_file, tmp_csv_file):
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        raise
+
+    os.replace(tmp_json_file, output_json_file)
+    os.replace(tmp_csv_file, output_csv_file)
+    return count
 
 def main():
-    # Define input and output file paths
-    INPUT_JSON_FILE = "./src/data/truth_archive.json"
-    OUTPUT_JSON_FILE = "./src/data/truth_archive_scrubbed.json"
-    OUTPUT_CSV_FILE = "./src/data/truth_archive_scrubbed.csv"
-    
+    parser = argparse.ArgumentParser(description="Clean post content in an archive")
+    parser.add_argument('--input', default="./src/data/truth_archive.json", help='Input JSON archive')
+    parser.add_argument('--output-json', default="./src/data/truth_archive_scrubbed.json", help='Output JSON file')
+    parser.add_argument('--output-csv', default="./src/data/truth_archive_scrubbed.csv", help='Output CSV file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes (1 cleans in this process)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Posts sent to a worker at a time')
+    args = parser.parse_args()
+
     try:
-        posts = load_archive(INPUT_JSON_FILE)
-    except Exception as e:
-        print(f"Error reading {INPUT_JSON_FILE}: {e}")
+        count = scrub_archive(args.input, args.output_json, args.output_csv,
+                              workers=args.workers, chunk_size=args.chunk_size)
+    except (IOError, ValueError) as e:
+        print(f"Error reading {args.input}: {e}")
         return
 
-    # Process each post to clean its content
-    cleaned_posts = [process_post(post) for post in posts]
-    
-    # Save cleaned data to new JSON and CSV files
-    save_json(cleaned_posts, OUTPUT_JSON_FILE)
-    save_csv(cleaned_posts, OUTPUT_CSV_FILE)
-    
-    print("Archive scrubbed successfully.")
-    print(f"JSON output: {OUTPUT_JSON_FILE}")
-    print(f"CSV output:  {OUTPUT_CSV_FILE}")
+    print(f"Archive scrubbed successfully ({count} posts).")
+    print(f"JSON output: {args.output_json}")
+    print(f"CSV output:  {args.output_csv}")
 
 if __name__ == "__main__":
     main()
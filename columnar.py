@@ -0,0 +1,217 @@
+import os
+import re
+import logging
+
+from post import Post, parse_timestamp
+
+logger = logging.getLogger('columnar')
+
+PARQUET = "parquet"
+NPZ = "npz"
+COUNT_COLUMNS = ("replies_count", "reblogs_count", "favourites_count")
+STRING_COLUMNS = ("content", "url", "media")
+_PART_RE = re.compile(r'^part-(\d+)\.(parquet|npz)$')
+
+# 列式导出是可选功能，优先使用 pyarrow 写 Parquet，其次用 numpy 写 .npz。
+# 两者导入都要上百毫秒，只在导出开启后用到时才导入，不拖慢每次抓取的启动
+def _pyarrow():
+    """(pyarrow, pyarrow.parquet), or (None, None) if pyarrow is not installed."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None, None
+    return pa, pq
+
+def _numpy():
+    """The numpy module, or None if it is not installed."""
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    return np
+
+def resolve_format(preferred="auto"):
+    """
+    Returns the export format to use for preferred ("auto", "parquet" or
+    "npz"), or None if the libraries it needs are not installed.
+    """
+    if preferred in ("auto", PARQUET) and _pyarrow()[1] is not None:
+        return PARQUET
+    if preferred in ("auto", NPZ) and _numpy() is not None:
+        return NPZ
+    logger.warning(f"Columnar export ({preferred}) needs pyarrow or numpy; skipping it")
+    return None
+
+def _post_columns(posts):
+    columns = {name: [] for name in ("id", "created_at") + STRING_COLUMNS + COUNT_COLUMNS}
+    for post in posts:
+        if isinstance(post, Post):
+            post_id, timestamp = post.id, post.timestamp
+        else:
+            post_id = int(post["id"])
+            timestamp = parse_timestamp(post.get("created_at"), post_id)
+        columns["id"].append(post_id)
+        columns["created_at"].append(int(timestamp * 1000))
+        columns["content"].append(post.get("content") or "")
+        columns["url"].append(post.get("url") or "")
+        columns["media"].append(list(post.get("media") or []))
+        for name in COUNT_COLUMNS:
+            columns[name].append(int(post.get(name) or 0))
+    return columns
+
+def _encode_strings(values):
+    # Arrow 风格的字符串列：所有UTF-8字节拼接在一起，加一个偏移数组
+    np = _numpy()
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _decode_strings(data, offsets):
+    raw = data.tobytes()
+    return [raw[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+class ColumnarExport:
+    """
+    Columnar copy of the archive for analysis, stored as numbered part
+    files in one directory.
+
+    Parquet parts (with pyarrow) can be read directly by pandas, DuckDB or
+    Spark. Without pyarrow, parts are NumPy .npz files: numeric columns as
+    arrays and each string column as one UTF-8 byte array plus int64
+    offsets. Columns: id (uint64), created_at (ms since epoch, UTC), content,
+    url, media (list of URLs), replies/reblogs/favourites counts (int64).
+
+    Each archive append writes only the new posts as a new part, so the
+    export never reprocesses the archive. A later part supersedes earlier
+    rows with the same id; load() applies that, and compact() folds the
+    parts into one once there are more than max_parts.
+    """
+
+    def __init__(self, directory, fmt="auto", max_parts=32):
+        self.directory = directory
+        self.format = resolve_format(fmt)
+        self.max_parts = max_parts
+
+    @property
+    def enabled(self):
+        return self.format is not None
+
+    def parts(self):
+        """Part files of the current format, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        numbered = []
+        for name in os.listdir(self.directory):
+            match = _PART_RE.match(name)
+            if match and match.group(2) == self.format:
+                numbered.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return [path for _, path in sorted(numbered)]
+
+    def _next_part(self):
+        parts = self.parts()
+        number = int(_PART_RE.match(os.path.basename(parts[-1])).group(1)) + 1 if parts else 0
+        return os.path.join(self.directory, f"part-{number:06d}.{self.format}")
+
+    def _write_part(self, columns):
+        os.makedirs(self.directory, exist_ok=True)
+        part_file = self._next_part()
+        tmp_file = f"{part_file}.tmp"
+        if self.format == PARQUET:
+            pa, pq = _pyarrow()
+            table = pa.table({
+                "id": pa.array(columns["id"], type=pa.uint64()),
+                "created_at": pa.array(columns["created_at"], type=pa.timestamp('ms', tz='UTC')),
+                "content": pa.array(columns["content"], type=pa.string()),
+                "url": pa.array(columns["url"], type=pa.string()),
+                "media": pa.array(columns["media"], type=pa.list_(pa.string())),
+                **{name: pa.array(columns[name], type=pa.int64()) for name in COUNT_COLUMNS}
+            })
+            pq.write_table(table, tmp_file)
+        else:
+            np = _numpy()
+            arrays = {
+                "id": np.array(columns["id"], dtype=np.uint64),
+                "created_at": np.array(columns["created_at"], dtype=np.int64),
+                **{name: np.array(columns[name], dtype=np.int64) for name in COUNT_COLUMNS}
+            }
+            for name in STRING_COLUMNS:
+                values = columns[name]
+                if name == "media":
+                    values = ["; ".join(urls) for urls in values]
+                arrays[f"{name}_data"], arrays[f"{name}_offsets"] = _encode_strings(values)
+            # 写入文件对象，避免 numpy 自动追加 .npz 后缀
+            with open(tmp_file, 'wb') as f:
+                np.savez(f, **arrays)
+        os.replace(tmp_file, part_file)
+        return part_file
+
+    def _read_part(self, part_file):
+        if self.format == PARQUET:
+            _, pq = _pyarrow()
+            columns = pq.read_table(part_file).to_pydict()
+            columns["created_at"] = [int(value.timestamp() * 1000) for value in columns["created_at"]]
+            return columns
+
+        with _numpy().load(part_file) as arrays:
+            columns = {name: arrays[name].tolist() for name in ("id", "created_at") + COUNT_COLUMNS}
+            for name in STRING_COLUMNS:
+                columns[name] = _decode_strings(arrays[f"{name}_data"], arrays[f"{name}_offsets"])
+        columns["media"] = [value.split("; ") if value else [] for value in columns["media"]]
+        return columns
+
+    def append(self, posts):
+        """Writes posts (dicts or Post records) as a new part."""
+        if not self.enabled or not posts:
+            return None
+        part_file = self._write_part(_post_columns(posts))
+        logger.info(f"Wrote {len(posts)} posts to columnar part {part_file}")
+        if len(self.parts()) > self.max_parts:
+            self.compact()
+        return part_file
+
+    def load(self):
+        """
+        Reads every part and returns a dict of column lists, newest first,
+        with one row per post id (the latest written).
+        """
+        merged = None
+        for part_file in self.parts():
+            columns = self._read_part(part_file)
+            if merged is None:
+                merged = columns
+            else:
+                for name, values in columns.items():
+                    merged[name].extend(values)
+        if merged is None:
+            return _post_columns([])
+
+        latest = {}
+        for row, post_id in enumerate(merged["id"]):
+            latest[post_id] = row  # 后写入的分片覆盖之前的记录
+        rows = [latest[post_id] for post_id in sorted(latest, reverse=True)]
+        return {name: [values[row] for row in rows] for name, values in merged.items()}
+
+    def rebuild(self, posts):
+        """Replaces all parts with a single part holding posts."""
+        if not self.enabled:
+            return None
+        old_parts = self.parts()
+        part_file = self._write_part(_post_columns(posts))
+        for old_part in old_parts:
+            os.remove(old_part)
+        logger.info(f"Rebuilt columnar export: {part_file}")
+        return part_file
+
+    def compact(self):
+        """Folds all parts into one, keeping the latest row per id."""
+        parts = self.parts()
+        if len(parts) <= 1:
+            return
+        columns = self.load()
+        # 新分片编号最大，写入后中断也不会被旧分片覆盖
+        part_file = self._write_part(columns)
+        for old_part in parts:
+            os.remove(old_part)
+        logger.info(f"Compacted {len(parts)} columnar parts into {part_file}")
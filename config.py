@@ -1,6 +1,5 @@
 import json
 import os
-import logging
 
 # 确保日志目录存在
 os.makedirs("./data/logs", exist_ok=True)
@@ -12,11 +11,34 @@ CONFIG_FILE = "./data/config.json"
 DEFAULT_CONFIG = {
     "scrape_proxy_key": "",
     "lark_webhook_url": "",
+    "lark_priority_webhook_url": "",  # 关注列表命中时发送到的webhook，留空则使用 lark_webhook_url
     "health_check_url": "",
     "archive_url": "",  # 移除远程URL
     "use_local_archive": True,  # 添加使用本地存档的标志
     "base_url": "https://truthsocial.com/api/v1/accounts/107780257626128497/statuses",
-    "error_threshold": 5
+    "error_threshold": 5,
+    "storage_mode": "append",  # append: 追加写入分段文件; json: 每次重写完整JSON; sqlite: 写入SQLite数据库
+    "compact_threshold": 500,  # 分段文件累积多少条记录后合并到快照
+    "poll_interval": 60,  # 常驻模式 (scrape.py --daemon) 的轮询间隔（秒）
+    "http_pool_size": 10,  # 每个主机保持的长连接数
+    "http_max_retries": 3,  # 连接错误和 429/5xx 的重试次数
+    "http_backoff_factor": 1,  # 重试退避系数（秒），按 1, 2, 4... 递增
+    "adaptive_polling": False,  # 根据历史发帖时段自动调整轮询间隔
+    "min_poll_interval": 60,  # 自适应轮询的最短间隔（秒）
+    "max_poll_interval": 1800,  # 自适应轮询的最长间隔（秒）
+    "adaptive_target_posts": 0.05,  # 两次轮询之间预期出现的帖子数
+    "max_proxy_requests_per_day": 1000,  # 每天最多发出的代理请求数
+    "columnar_export": "off",  # 列式导出: off / auto / parquet / npz
+    "engagement_refresh": False,  # 定期重新抓取近期帖子的回复/转发/点赞数
+    "refresh_requests_per_day": 200,  # 互动数刷新每天最多发出的代理请求数
+    "engagement_history": False,  # 记录每次抓取到的互动数，生成增长曲线
+    "lark_batch_notifications": False,  # 多条新帖子合并成一张Lark卡片发送
+    "search_index": False,  # 抓取新帖子时增量更新全文检索索引（search.py）
+    "watchlist": {},  # 关注列表: {"分组": ["关键词", "/正则/"]}，命中的帖子单独发送高优先级通知
+    "near_duplicates": False,  # 用 MinHash 标记与旧帖子几乎相同的新帖子
+    "near_duplicate_threshold": 0.8,  # 判定为疑似重复的最低相似度（Jaccard 估计值）
+    "media_mirror": False,  # 把帖子的图片和视频下载到 data/media（按 SHA-256 存放）
+    "media_workers": 4  # 同时下载的媒体文件数
 }
 
 def load_config():
@@ -72,15 +94,51 @@ config = load_config()
 # 导出配置变量，方便其他模块直接使用
 SCRAPEOPS_API_KEY = config.get("scrape_proxy_key")
 LARK_WEBHOOK_URL = config.get("lark_webhook_url")
+LARK_PRIORITY_WEBHOOK_URL = config.get("lark_priority_webhook_url") or LARK_WEBHOOK_URL
 HEALTH_CHECK_URL = config.get("health_check_url")
 ARCHIVE_URL = config.get("archive_url")
 BASE_URL = config.get("base_url")
 ERROR_THRESHOLD = config.get("error_threshold", 5)
 USE_LOCAL_ARCHIVE = config.get("use_local_archive", True)
+STORAGE_MODE = config.get("storage_mode", "append")
+COMPACT_THRESHOLD = config.get("compact_threshold", 500)
+POLL_INTERVAL = config.get("poll_interval", 60)
+HTTP_POOL_SIZE = config.get("http_pool_size", 10)
+HTTP_MAX_RETRIES = config.get("http_max_retries", 3)
+HTTP_BACKOFF_FACTOR = config.get("http_backoff_factor", 1)
+ADAPTIVE_POLLING = config.get("adaptive_polling", False)
+MIN_POLL_INTERVAL = config.get("min_poll_interval", 60)
+MAX_POLL_INTERVAL = config.get("max_poll_interval", 1800)
+ADAPTIVE_TARGET_POSTS = config.get("adaptive_target_posts", 0.05)
+MAX_PROXY_REQUESTS_PER_DAY = config.get("max_proxy_requests_per_day", 1000)
+COLUMNAR_EXPORT = config.get("columnar_export", "off")
+ENGAGEMENT_REFRESH = config.get("engagement_refresh", False)
+REFRESH_REQUESTS_PER_DAY = config.get("refresh_requests_per_day", 200)
+ENGAGEMENT_HISTORY = config.get("engagement_history", False)
+LARK_BATCH_NOTIFICATIONS = config.get("lark_batch_notifications", False)
+SEARCH_INDEX = config.get("search_index", False)
+WATCHLIST = config.get("watchlist", {})
+NEAR_DUPLICATES = config.get("near_duplicates", False)
+NEAR_DUPLICATE_THRESHOLD = config.get("near_duplicate_threshold", 0.8)
+MEDIA_MIRROR = config.get("media_mirror", False)
+MEDIA_WORKERS = config.get("media_workers", 4)
 
 # 常量配置
 SCRAPEOPS_ENDPOINT = "https://proxy.scrapeops.io/v1/"
 OUTPUT_JSON_FILE = "./data/truth_archive.json"
+OUTPUT_SEGMENT_FILE = "./data/truth_archive.jsonl"
+OUTPUT_INDEX_FILE = "./data/truth_archive.ids"
 OUTPUT_CSV_FILE = "./data/truth_archive.csv"
+OUTPUT_CSV_SEGMENT_FILE = "./data/truth_archive_incremental.csv"
+OUTPUT_COLUMNS_DIR = "./data/truth_archive_columns"
+OUTPUT_DB_FILE = "./data/truth_archive.db"
 ERROR_COUNT_FILE = "./data/error_count.txt"
-LAST_ALERT_FILE = "./data/last_alert.txt" 
\ No newline at end of file
+LAST_ALERT_FILE = "./data/last_alert.txt"
+POLL_STATE_FILE = "./data/poll_scheduler.json"
+REFRESH_STATE_FILE = "./data/engagement_refresh.json"
+OUTPUT_ENGAGEMENT_DIR = "./data/engagement"
+OUTPUT_SEARCH_DIR = "./data/search_index"
+OUTPUT_NEAR_DUPLICATES_DB = "./data/near_duplicates.db"
+OUTPUT_MEDIA_DIR = "./data/media"
+NOTIFICATION_OUTBOX_FILE = "./data/notification_outbox.db"
+LAST_NOTIFIED_ID_FILE = "./data/last_notified_id.txt" 
\ No newline at end of file
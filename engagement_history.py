@@ -0,0 +1,104 @@
+import os
+import mmap
+import time
+import struct
+import logging
+import argparse
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from id_index import snowflake_to_datetime
+from config import OUTPUT_ENGAGEMENT_DIR
+
+logger = logging.getLogger('engagement_history')
+
+# post_id, observed_at (epoch seconds), replies, reblogs, favourites
+RECORD = struct.Struct('<QIIII')
+
+class EngagementHistory:
+    """
+    Time series of engagement counts, one fixed-width record per
+    observation of a post.
+
+    Records are 24 bytes (RECORD) appended to one file per month of post
+    creation (the month comes from the snowflake ID), e.g.
+    engagement/2025-03.bin. Appending is a single write per partition, and
+    series() for one post only scans its month's file, memory-mapped,
+    rather than the whole history. Within a file records are in the order
+    they were observed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def partition_file(self, post_id):
+        created = snowflake_to_datetime(post_id)
+        return os.path.join(self.directory, f"{created:%Y-%m}.bin")
+
+    def record(self, posts, observed_at=None):
+        """
+        Appends the current counts of posts (dicts or Post records),
+        observed at observed_at (epoch seconds, default now).
+        Returns the number of records written.
+        """
+        observed_at = int(observed_at if observed_at is not None else time.time())
+        partitions = defaultdict(bytearray)
+        count = 0
+        for post in posts:
+            post_id = int(post["id"])
+            partitions[self.partition_file(post_id)] += RECORD.pack(
+                post_id,
+                observed_at,
+                int(post.get("replies_count") or 0),
+                int(post.get("reblogs_count") or 0),
+                int(post.get("favourites_count") or 0)
+            )
+            count += 1
+        if not partitions:
+            return 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        for path, data in partitions.items():
+            self._append(path, data)
+        return count
+
+    @staticmethod
+    def _append(path, data):
+        # 上次写入被中断时会留下不完整的记录，先截掉再追加，保证记录对齐
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % RECORD.size:
+                logger.warning(f"Truncating {size % RECORD.size} trailing bytes in {path}")
+                os.truncate(path, size - size % RECORD.size)
+        with open(path, 'ab') as f:
+            f.write(data)
+
+    def series(self, post_id):
+        """
+        Returns the observations of one post, oldest first, as
+        (observed_at, replies, reblogs, favourites) tuples.
+        """
+        post_id = int(post_id)
+        path = self.partition_file(post_id)
+        if not os.path.exists(path):
+            return []
+        size = os.path.getsize(path)
+        usable = size - size % RECORD.size
+        if usable == 0:
+            return []
+
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), usable, access=mmap.ACCESS_READ) as data:
+            observations = [record[1:] for record in RECORD.iter_unpack(data) if record[0] == post_id]
+        observations.sort(key=lambda observation: observation[0])
+        return observations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the engagement history of a post as CSV")
+    parser.add_argument('post_id', help='Post ID')
+    parser.add_argument('--dir', default=OUTPUT_ENGAGEMENT_DIR, help='Engagement history directory')
+    args = parser.parse_args()
+
+    print("observed_at,replies_count,reblogs_count,favourites_count")
+    for observed_at, replies, reblogs, favourites in EngagementHistory(args.dir).series(args.post_id):
+        observed = datetime.fromtimestamp(observed_at, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        print(f"{observed},{replies},{reblogs},{favourites}")
@@ -0,0 +1,165 @@
+import os
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+
+from id_index import datetime_to_snowflake
+from normalize import normalize_posts
+from post import Post
+
+logger = logging.getLogger('engagement_refresh')
+
+# (帖子年龄上限, 刷新间隔)，单位秒：刚发布时频繁刷新，之后逐渐变少
+REFRESH_SCHEDULE = (
+    (6 * 3600, 15 * 60),
+    (24 * 3600, 2 * 3600),
+    (7 * 24 * 3600, 12 * 3600),
+)
+
+COUNT_FIELDS = ("replies_count", "reblogs_count", "favourites_count")
+
+def refresh_interval(age, schedule=REFRESH_SCHEDULE):
+    """
+    Seconds between refreshes for a post age seconds old, or None once the
+    post is older than the last tier and no longer refreshed.
+    """
+    for max_age, interval in schedule:
+        if age < max_age:
+            return interval
+    return None
+
+class EngagementRefresher:
+    """
+    Re-fetches the engagement counts of recent posts.
+
+    New posts are only extracted once, so their counts would otherwise
+    freeze at first sight. Each post is refreshed on a decaying schedule
+    (REFRESH_SCHEDULE) until it is a week old. Due posts are covered by
+    timeline pages: one request with max_id just above the newest due post
+    returns the counts of a whole page of posts, so a day of posts costs
+    about one request. Requests are capped per run and per UTC day.
+
+    Only posts whose counts changed are written back, through the store's
+    update_counts(). With history (an EngagementHistory), every fetched
+    count is also recorded there, changed or not. The time of the last
+    refresh per post and the daily request count are kept in state_file.
+    """
+
+    def __init__(self, state_file, fetch_page, max_requests_per_day=200, max_pages_per_run=3,
+                 schedule=REFRESH_SCHEDULE, history=None):
+        # fetch_page(max_id) -> list of raw API statuses with IDs below max_id, newest first
+        self.state_file = state_file
+        self.fetch_page = fetch_page
+        self.max_requests_per_day = max_requests_per_day
+        self.max_pages_per_run = max_pages_per_run
+        self.schedule = schedule
+        self.history = history
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (ValueError, IOError) as e:
+                logger.warning(f"Error reading engagement refresh state: {e}")
+        return {}
+
+    def _save_state(self):
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def _requests_today(self, now):
+        if self.state.get("budget_date") != now.date().isoformat():
+            return 0
+        return self.state.get("requests_today", 0)
+
+    def _record_requests(self, count, now):
+        today = now.date().isoformat()
+        if self.state.get("budget_date") != today:
+            self.state["budget_date"] = today
+            self.state["requests_today"] = 0
+        self.state["requests_today"] += count
+
+    def due_posts(self, recent_posts, now):
+        """
+        Returns the posts in recent_posts (Post records) whose refresh is
+        due, newest first.
+        """
+        refreshed = self.state.get("refreshed", {})
+        due = []
+        for post in recent_posts:
+            interval = refresh_interval(now.timestamp() - post.timestamp, self.schedule)
+            if interval is None:
+                continue
+            # 从未刷新过的帖子以发布时间为基准（抓取通常在发布后几分钟内）
+            last = refreshed.get(str(post.id), post.timestamp)
+            if now.timestamp() - last >= interval:
+                due.append(post)
+        return sorted(due, key=lambda post: post.id, reverse=True)
+
+    def run(self, store, now=None):
+        """
+        Refreshes the due posts of store within the request budget.
+        Returns (requests made, list of Post records with updated counts).
+        """
+        now = now or datetime.now(timezone.utc)
+        max_age = self.schedule[-1][0]
+        recent = store.posts_newer_than(datetime_to_snowflake(now - timedelta(seconds=max_age)))
+        due = self.due_posts(recent, now)
+        if not due:
+            return 0, []
+
+        budget = min(self.max_pages_per_run, self.max_requests_per_day - self._requests_today(now))
+        if budget <= 0:
+            logger.warning("Daily engagement refresh budget exhausted; skipping refresh")
+            return 0, []
+
+        archived = {post.id: post for post in recent}
+        # 刷新时间只在成功完成后写回状态，失败时这些帖子下次仍然到期
+        refreshed = dict(self.state.get("refreshed", {}))
+        requests_made = 0
+        updated = []
+        observed = []
+        try:
+            while due and requests_made < budget:
+                max_id = due[0].id + 1
+                requests_made += 1
+                page = self.fetch_page(max_id)
+                for data in normalize_posts(page):
+                    post = archived.get(int(data["id"]))
+                    if post is None:
+                        continue
+                    observed.append(data)
+                    counts = [data.get(field, 0) for field in COUNT_FIELDS]
+                    if counts != [getattr(post, field) for field in COUNT_FIELDS]:
+                        # 保留存档中的内容（可能已被清洗），只更新计数
+                        record = Post.from_dict(post.to_dict())
+                        record.replies_count, record.reblogs_count, record.favourites_count = counts
+                        updated.append(record)
+
+                # 这一页覆盖了 [最后一条, max_id) 的ID范围，没有返回的帖子（已删除等）也视为已刷新；
+                # 空页说明更早的帖子都不在时间线上了
+                floor = int(page[-1]["id"]) if page else 0
+                for post in due:
+                    if post.id >= floor:
+                        refreshed[str(post.id)] = now.timestamp()
+                due = [post for post in due if post.id < floor]
+
+            if updated:
+                store.update_counts(updated)
+            if self.history is not None:
+                self.history.record(observed, observed_at=now.timestamp())
+            # 超过刷新期限的帖子不再需要记录
+            self.state["refreshed"] = {
+                post_id: ts for post_id, ts in refreshed.items() if int(post_id) in archived
+            }
+        finally:
+            # 中途失败时已经发出的请求也计入每日预算
+            self._record_requests(requests_made, now)
+            self._save_state()
+        logger.info(f"Engagement refresh: {requests_made} requests, {len(updated)} posts with new counts, "
+                    f"{len(due)} still due")
+        return requests_made, updated
@@ -24,6 +24,13 @@ EOF
 echo "配置文件已生成:"
 cat /app/data/config.json | sed 's/"[^"]*key[^"]*": "[^"]*"/"key": "***"/g; s/"[^"]*url[^"]*": "http[^"]*"/"url": "***"/g'
 
+# 常驻模式：由scrape.py自行调度轮询，不再每分钟启动新进程
+if [ "${RUN_MODE}" = "daemon" ]; then
+    echo "===> 容器初始化完成 <==="
+    echo "以常驻模式启动抓取程序..."
+    exec /usr/local/bin/python /app/scrape.py --daemon
+fi
+
 # 设置crontab并启动cron服务
 echo "设置crontab..."
 # 确保已将crontab文件加载到root用户
@@ -1,8 +1,8 @@
-import requests
 import json
 import os
 import time
 from datetime import datetime, timedelta
+from http_client import get_session
 
 # 健康检查URL - 如果爬虫出现问题，将发送通知到此URL
 HEALTH_CHECK_URL = os.getenv("HEALTH_CHECK_URL")
@@ -35,7 +35,7 @@ def send_health_alert(status, message):
     }
     
     try:
-        response = requests.post(
+        response = get_session().post(
             HEALTH_CHECK_URL,
             headers={"Content-Type": "application/json"},
             data=json.dumps(payload),
@@ -71,7 +71,7 @@ def test_target_site_access():
             'bypass': 'cloudflare_level_1'
         }
         
-        response = requests.get(SCRAPEOPS_ENDPOINT, params=proxy_params, timeout=60)
+        response = get_session().get(SCRAPEOPS_ENDPOINT, params=proxy_params, timeout=60)
         
         if response.status_code == 200:
             print("✅ Target site is accessible")
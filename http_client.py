@@ -0,0 +1,110 @@
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger('http_client')
+
+# 与 config.py 的默认配置相同；本模块不导入 config，导入时不会创建 data/ 或写配置文件
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 1
+
+_session = None
+_session_settings = {}
+_session_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {}
+
+def _record_timing(response, *args, **kwargs):
+    """Response hook: accumulates request timings per host."""
+    host = urlsplit(response.url).netloc
+    elapsed = response.elapsed.total_seconds()
+    with _metrics_lock:
+        stats = _metrics.setdefault(host, {"requests": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["requests"] += 1
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR):
+    """
+    Creates a keep-alive session with a bounded connection pool and a
+    retry policy for connection errors and transient HTTP errors.
+    POST requests are only retried when the connection could not be made,
+    so webhooks are not delivered twice.
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(_record_timing)
+    return session
+
+def configure_session(**settings):
+    """
+    Sets the create_session arguments used for the shared session, e.g.
+    from data/config.json. Entry points that do not load the config (the
+    health check, the backfill scripts) get the defaults. Takes effect
+    only before the session is first used.
+    """
+    with _session_lock:
+        _session_settings.update(settings)
+
+def get_session():
+    """
+    Returns the process-wide session shared by scraping, Lark
+    notifications and health alerts.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session(**_session_settings)
+        return _session
+
+def _connections_opened(session):
+    opened = 0
+    for adapter in set(session.adapters.values()):
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+    return opened
+
+def get_metrics(session=None):
+    """
+    Returns per-host request timings plus the number of TCP connections
+    opened so far by session (default: the shared session); requests minus
+    connections is the number of handshakes saved by keep-alive.
+    """
+    session = session or _session
+    with _metrics_lock:
+        hosts = {
+            host: dict(stats, avg_seconds=stats["total_seconds"] / stats["requests"])
+            for host, stats in _metrics.items()
+        }
+    return {
+        "hosts": hosts,
+        "requests": sum(stats["requests"] for stats in hosts.values()),
+        "connections_opened": _connections_opened(session) if session is not None else 0
+    }
+
+def log_metrics(log=logger):
+    """Logs a one-line summary per host."""
+    metrics = get_metrics()
+    for host, stats in metrics["hosts"].items():
+        log.info(
+            f"HTTP {host}: {stats['requests']} requests, "
+            f"avg {stats['avg_seconds']:.3f}s, max {stats['max_seconds']:.3f}s"
+        )
+    if metrics["requests"]:
+        log.info(f"HTTP connections opened: {metrics['connections_opened']} for {metrics['requests']} requests")
@@ -0,0 +1,138 @@
+import os
+import mmap
+import bisect
+import logging
+from array import array
+from datetime import datetime, timezone
+
+logger = logging.getLogger('id_index')
+
+def snowflake_to_datetime(post_id):
+    """
+    Returns the creation time encoded in a snowflake ID
+    (milliseconds since the Unix epoch in the bits above the low 16).
+    """
+    return datetime.fromtimestamp((int(post_id) >> 16) / 1000, tz=timezone.utc)
+
+def datetime_to_snowflake(dt):
+    """
+    Returns the smallest snowflake ID that could have been created at dt.
+    Naive datetimes are treated as UTC.
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000) << 16
+
+class PostIdIndex:
+    """
+    Sorted array of 64-bit post IDs, memory-mapped from disk.
+
+    Truth Social IDs are snowflakes, so they fit in an unsigned 64-bit
+    integer and grow over time. Membership is a binary search over the
+    mapped file; nothing is parsed at startup. The file is a local cache in
+    native byte order and can always be rebuilt from the archive.
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self._file = None
+        self._mmap = None
+        self._ids = ()
+        self.open()
+
+    def open(self):
+        """Maps the index file into memory (an empty or missing file maps to no IDs)."""
+        self.close()
+        if not os.path.exists(self.index_file):
+            return
+
+        size = os.path.getsize(self.index_file)
+        usable = size - size % 8
+        if usable == 0:
+            return
+        if usable != size:
+            # 追加过程中被中断会留下不完整的记录，忽略尾部
+            logger.warning(f"Ignoring {size - usable} trailing bytes in {self.index_file}")
+
+        self._file = open(self.index_file, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), usable, access=mmap.ACCESS_READ)
+        self._ids = memoryview(self._mmap).cast('Q')
+
+    def close(self):
+        if isinstance(self._ids, memoryview):
+            self._ids.release()
+        self._ids = ()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def newest(self):
+        """The largest (newest) indexed ID, or None if the index is empty."""
+        return self._ids[-1] if len(self._ids) else None
+
+    def __contains__(self, post_id):
+        try:
+            post_id = int(post_id)
+        except (TypeError, ValueError):
+            return False
+        pos = bisect.bisect_left(self._ids, post_id)
+        return pos < len(self._ids) and self._ids[pos] == post_id
+
+    def add(self, post_ids):
+        """
+        Adds IDs to the index.
+        New IDs are normally newer than everything indexed, so they are
+        appended to the file; anything else falls back to a full rewrite.
+        """
+        new_ids = sorted({int(post_id) for post_id in post_ids if post_id not in self})
+        if not new_ids:
+            return
+
+        if not len(self._ids) or new_ids[0] > self._ids[-1]:
+            with open(self.index_file, 'ab') as f:
+                f.write(array('Q', new_ids).tobytes())
+        else:
+            merged = sorted(set(self._ids.tolist()) | set(new_ids))
+            self.close()
+            self._write(self.index_file, merged)
+
+        self.open()
+
+    @staticmethod
+    def _write(index_file, sorted_ids):
+        tmp_file = f"{index_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(array('Q', sorted_ids).tobytes())
+        os.replace(tmp_file, index_file)
+
+    @classmethod
+    def build(cls, index_file, post_ids):
+        """Writes a fresh index for the given IDs and opens it."""
+        sorted_ids = sorted({int(post_id) for post_id in post_ids})
+        logger.info(f"Building ID index with {len(sorted_ids)} entries: {index_file}")
+        cls._write(index_file, sorted_ids)
+        return cls(index_file)
+
+    def is_stale(self, *source_files):
+        """
+        Whether any source file was modified after the index was written.
+        Only meaningful for an index built on this machine: the file is
+        kept out of git (see .gitignore), since a checkout sets mtimes in
+        checkout order.
+        """
+        if not os.path.exists(self.index_file):
+            return True
+        index_mtime = os.path.getmtime(self.index_file)
+        return any(
+            os.path.exists(path) and os.path.getmtime(path) > index_mtime
+            for path in source_files
+        )
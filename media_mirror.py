@@ -0,0 +1,216 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from http_client import get_session, configure_session
+from archive_store import open_archive_store
+from config import OUTPUT_MEDIA_DIR, MEDIA_WORKERS, HTTP_POOL_SIZE, HTTP_MAX_RETRIES, HTTP_BACKOFF_FACTOR
+
+logger = logging.getLogger('media_mirror')
+
+# 帖子中记录本地文件路径的字段，与 media 一一对应，下载失败的位置为 None
+MEDIA_FILES_FIELD = "media_files"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    downloaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_sha256 ON media (sha256);
+"""
+
+def _file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _content_range_size(response):
+    """The complete size from a 416 response's "Content-Range: bytes */<size>" header, or None."""
+    value = (response.headers.get("Content-Range") or "").strip()
+    unit, _, size = value.partition(" */")
+    return int(size) if unit == "bytes" and size.isdigit() else None
+
+class MediaMirror:
+    """
+    Mirrors post media into a content-addressed local store.
+
+    Files are stored under their SHA-256, e.g. media/3f/a2/3fa2....jpg,
+    so the same image attached to several posts (or served from several
+    CDN URLs) is kept once. media.db maps each downloaded URL to its
+    file, so a URL is only fetched once.
+
+    Downloads run on a pool of at most `workers` threads sharing the
+    keep-alive session. Each download streams into partial/<url hash>.part;
+    an interrupted download resumes from the partial file with an HTTP
+    Range request (servers that ignore Range send the whole file again).
+    """
+
+    def __init__(self, directory, workers=4, session=None, chunk_size=1 << 20, timeout=60):
+        self.directory = directory
+        self.partial_dir = os.path.join(directory, "partial")
+        self.workers = workers
+        self.session = session
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "media.db"))
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def content_path(self, digest, url):
+        extension = os.path.splitext(urlsplit(url).path)[1].lower()
+        if not extension[1:].isalnum() or len(extension) > 6:
+            extension = ""
+        return os.path.join(self.directory, digest[:2], digest[2:4], digest + extension)
+
+    def known_paths(self, urls):
+        """{url: path} for the URLs already mirrored."""
+        urls = list(urls)
+        paths = {}
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            query = f"SELECT url, path FROM media WHERE url IN ({','.join('?' * len(chunk))})"
+            paths.update(self._conn.execute(query, chunk).fetchall())
+        return paths
+
+    def download(self, url):
+        """
+        Downloads one URL (resuming a partial download) into the content
+        store. Returns (sha256, path, size). Runs on worker threads, so it
+        does not touch the database.
+        """
+        part_file = os.path.join(self.partial_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + ".part")
+        session = self.session or get_session()
+        while True:
+            offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            with session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if offset and response.status_code == 416:
+                    # 416 表示续传起点已在文件末尾之后；只有分段文件与服务器上的文件一样大时才算完整
+                    if _content_range_size(response) == offset:
+                        break
+                    logger.info(f"Partial download of {url} does not match the file on the server; restarting")
+                    os.remove(part_file)
+                    continue
+                response.raise_for_status()
+                resumed = offset and response.status_code == 206
+                if offset:
+                    logger.info(f"{'Resuming' if resumed else 'Restarting'} download of {url} at {offset} bytes")
+                with open(part_file, 'ab' if resumed else 'wb') as f:
+                    for chunk in response.iter_content(self.chunk_size):
+                        f.write(chunk)
+            break
+
+        digest = _file_sha256(part_file)
+        path = self.content_path(digest, url)
+        size = os.path.getsize(part_file)
+        if os.path.exists(path):
+            # 相同内容已经存在（其他帖子或其他URL），只保留一份
+            os.remove(part_file)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(part_file, path)
+        return digest, path, size
+
+    def mirror(self, posts):
+        """
+        Downloads the media of posts (dicts or Post records) that is not
+        mirrored yet and records the local paths in each post's
+        "media_files" field, aligned with "media" (None where a download
+        failed; it is retried next time). Returns the posts whose
+        media_files changed.
+        """
+        posts = [post for post in posts if post.get("media")]
+        urls = {url for post in posts for url in post.get("media") if url}
+        paths = self.known_paths(urls)
+        missing = sorted(urls - paths.keys())
+
+        if missing:
+            logger.info(f"Downloading {len(missing)} media files with {self.workers} workers")
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self.download, url): url for url in missing}
+                for future in as_completed(futures):
+                    url = futures[future]
+                    try:
+                        digest, path, size = future.result()
+                    except Exception as e:
+                        logger.warning(f"Failed to download {url}: {e}")
+                        continue
+                    paths[url] = self._record(url, digest, path, size)
+
+        updated = []
+        for post in posts:
+            media_files = [paths.get(url) for url in post.get("media")]
+            if media_files == post.get(MEDIA_FILES_FIELD):
+                continue
+            post[MEDIA_FILES_FIELD] = media_files
+            updated.append(post)
+        return updated
+
+    def _record(self, url, digest, path, size):
+        """Records a downloaded URL; returns the path to use for it."""
+        row = self._conn.execute("SELECT path FROM media WHERE sha256 = ? LIMIT 1", (digest,)).fetchone()
+        if row and row[0] != path:
+            # 同一内容以不同扩展名下载过，沿用已有的文件
+            referenced = self._conn.execute("SELECT 1 FROM media WHERE path = ? LIMIT 1", (path,)).fetchone()
+            if not referenced and os.path.exists(path):
+                os.remove(path)
+            path = row[0]
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media (url, sha256, path, size, downloaded_at) VALUES (?, ?, ?, ?, ?)",
+                (url, digest, path, size, time.time())
+            )
+        return path
+
+def needs_mirroring(post):
+    """True if some of the post's media has no local file yet."""
+    media = post.get("media") or []
+    media_files = post.get(MEDIA_FILES_FIELD) or []
+    return bool(media) and (len(media_files) != len(media) or None in media_files)
+
+def backfill(mirror, store, batch_size=200):
+    """
+    Mirrors the media of every archived post that is missing local files,
+    writing the updated records back in batches. Returns the number of
+    posts updated.
+    """
+    updated = 0
+    # 先收集需要下载的帖子，避免边读存档边写入
+    pending = [post for post in store.iter_posts(as_records=True) if needs_mirroring(post)]
+    logger.info(f"{len(pending)} archived posts have media to mirror")
+    for i in range(0, len(pending), batch_size):
+        batch = mirror.mirror(pending[i:i + batch_size])
+        store.append_posts(batch)
+        updated += len(batch)
+    return updated
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Mirror post media into a content-addressed local store")
+    parser.add_argument('--backfill', action='store_true', help='Mirror the media of every archived post')
+    parser.add_argument('--dir', default=OUTPUT_MEDIA_DIR, help='Media directory')
+    parser.add_argument('--workers', type=int, default=MEDIA_WORKERS, help='Concurrent downloads')
+    args = parser.parse_args()
+    configure_session(pool_size=HTTP_POOL_SIZE, max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR)
+
+    if args.backfill:
+        mirror = MediaMirror(args.dir, workers=args.workers)
+        try:
+            print(f"Updated {backfill(mirror, open_archive_store())} posts")
+        finally:
+            mirror.close()
+    else:
+        parser.print_help()
@@ -0,0 +1,238 @@
+import csv
+import zlib
+import random
+import sqlite3
+import hashlib
+import logging
+import argparse
+import functools
+from array import array
+
+from text_index import tokenize
+from config import OUTPUT_NEAR_DUPLICATES_DB
+
+logger = logging.getLogger('near_duplicates')
+
+# 帖子中记录疑似重复的字段，只在找到时出现
+NEAR_DUPLICATE_FIELD = "near_duplicate"
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE_SIZE = 3
+
+# 哈希 h(x) = (a * x + b) mod p，p = 2^31 - 1，乘积不超过 64 位
+_PRIME = (1 << 31) - 1
+_rng = random.Random(20250301)
+# 固定种子，保证不同进程算出的签名一致
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_HASHES)]
+
+@functools.lru_cache(maxsize=None)
+def _numpy_permutations():
+    """
+    (numpy, a, b) with the permutation coefficients as column vectors, or
+    None if numpy is not installed. numpy only speeds up signing (the
+    results are identical) and is imported on first use, not at startup.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    coefficients = np.array(_PERMUTATIONS, dtype=np.uint64)
+    return np, coefficients[:, :1], coefficients[:, 1:]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    post_id INTEGER PRIMARY KEY,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    bucket INTEGER NOT NULL,
+    post_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket);
+"""
+
+def minhash_signature(text, min_tokens=10):
+    """
+    MinHash signature (NUM_HASHES 32-bit values) of the word 3-shingles of
+    text, or None when text has fewer than min_tokens tokens: short posts
+    ("Thank you!") are too generic to call duplicates.
+    """
+    tokens = tokenize(text)
+    if len(tokens) < max(min_tokens, 1):
+        return None
+    shingles = {
+        zlib.crc32(" ".join(tokens[i:i + SHINGLE_SIZE]).encode('utf-8')) % _PRIME
+        for i in range(max(len(tokens) - SHINGLE_SIZE + 1, 1))
+    }
+    numpy_permutations = _numpy_permutations()
+    if numpy_permutations is not None:
+        np, a, b = numpy_permutations
+        values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))[None, :]
+        return array('I', ((a * values + b) % _PRIME).min(axis=1).astype(np.uint32).tobytes())
+    return array('I', (min((a * shingle + b) % _PRIME for shingle in shingles) for a, b in _PERMUTATIONS))
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(signature, other)) / NUM_HASHES
+
+def _bucket_keys(signature):
+    # 每个带（ROWS 个值）哈希成一个桶；两个签名只要有一个带完全相同就成为候选
+    keys = []
+    for band in range(BANDS):
+        data = bytes([band]) + signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        keys.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True))
+    return keys
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of post content for near-duplicate detection.
+
+    Each post's cleaned content is reduced to a MinHash signature of its
+    word 3-shingles; the signature is split into BANDS bands of ROWS values
+    and each band is stored as a bucket key in SQLite. A lookup only
+    compares the posts that share a bucket with the query (indexed
+    SELECTs), not the whole archive. With 16 bands of 4 rows, pairs with a
+    similarity of 0.8 become candidates with probability > 0.999, and
+    candidates are kept only if their estimated similarity reaches
+    threshold.
+    """
+
+    def __init__(self, db_file, threshold=0.8, min_tokens=10):
+        self.db_file = db_file
+        self.threshold = threshold
+        self.min_tokens = min_tokens
+        self._conn = sqlite3.connect(db_file)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def signature(self, post_id):
+        row = self._conn.execute("SELECT signature FROM signatures WHERE post_id = ?", (int(post_id),)).fetchone()
+        return array('I', row[0]) if row else None
+
+    def add(self, posts):
+        """
+        Indexes posts (dicts or Post records). Posts already indexed or
+        too short to sign are skipped. Returns the number added.
+        """
+        added = 0
+        with self._conn:
+            for post in posts:
+                signature = minhash_signature(post.get("content"), self.min_tokens)
+                if signature is not None:
+                    added += self._insert(int(post["id"]), signature)
+        return added
+
+    def _insert(self, post_id, signature):
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO signatures (post_id, signature) VALUES (?, ?)", (post_id, signature.tobytes())
+        )
+        if not cursor.rowcount:
+            return 0
+        self._conn.executemany(
+            "INSERT INTO buckets (bucket, post_id) VALUES (?, ?)", [(key, post_id) for key in _bucket_keys(signature)]
+        )
+        return 1
+
+    def find(self, signature, before=None):
+        """
+        Returns (post_id, similarity) of the most similar indexed post at
+        or above threshold, or None. before restricts the search to older
+        posts (smaller IDs).
+        """
+        keys = _bucket_keys(signature)
+        query = f"SELECT DISTINCT post_id FROM buckets WHERE bucket IN ({','.join('?' * len(keys))})"
+        best = None
+        for (post_id,) in self._conn.execute(query, keys).fetchall():
+            if before is not None and post_id >= before:
+                continue
+            score = similarity(signature, self.signature(post_id))
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (post_id, score)
+        return best
+
+    def tag(self, posts):
+        """
+        Flags posts (dicts or Post records) that nearly duplicate an
+        earlier post, recording {"id", "similarity"} in their
+        "near_duplicate" field, then indexes them. Posts are processed
+        oldest first, so a repost within the same batch is matched too.
+        Returns the flagged posts.
+        """
+        flagged = []
+        for post in sorted(posts, key=lambda post: int(post["id"])):
+            post_id = int(post["id"])
+            signature = minhash_signature(post.get("content"), self.min_tokens)
+            if signature is None:
+                continue
+            match = self.find(signature, before=post_id)
+            if match is not None:
+                value = {"id": str(match[0]), "similarity": round(match[1], 2)}
+                post[NEAR_DUPLICATE_FIELD] = value
+                flagged.append(post)
+            with self._conn:
+                self._insert(post_id, signature)
+        if flagged:
+            logger.info(f"{len(flagged)} posts are near-duplicates of earlier posts")
+        return flagged
+
+    def rebuild(self, posts):
+        """Replaces the index with the signatures of posts."""
+        with self._conn:
+            self._conn.execute("DELETE FROM signatures")
+            self._conn.execute("DELETE FROM buckets")
+        added = self.add(posts)
+        logger.info(f"Indexed {added} post signatures for near-duplicate detection")
+        return added
+
+def near_duplicate_of(post):
+    """The near-duplicate flag recorded on a post ({"id", "similarity"}), or None."""
+    return post.get(NEAR_DUPLICATE_FIELD) or None
+
+def export_pairs(index, posts, path):
+    """
+    Writes a CSV of every post in posts that nearly duplicates an older
+    post: id, created_at, near_duplicate_of, similarity, content.
+    Returns the number of rows.
+    """
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "created_at", "near_duplicate_of", "similarity", "content"])
+        for post in posts:
+            signature = index.signature(post["id"])
+            match = index.find(signature, before=int(post["id"])) if signature is not None else None
+            if match is not None:
+                writer.writerow([post["id"], post.get("created_at"), match[0], f"{match[1]:.2f}", post.get("content")])
+                count += 1
+    return count
+
+if __name__ == "__main__":
+    from archive_store import open_archive_store
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Near-duplicate detection over the archived posts")
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the signature index from the full archive')
+    parser.add_argument('--export', metavar='PATH',
+                        help='Write a CSV of every archived post that nearly duplicates an older one')
+    parser.add_argument('--db', default=OUTPUT_NEAR_DUPLICATES_DB, help='Signature database')
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex(args.db)
+    try:
+        if args.rebuild or (args.export and len(index) == 0):
+            index.rebuild(open_archive_store().iter_posts(as_records=True))
+        if args.export:
+            rows = export_pairs(index, open_archive_store().iter_posts(as_records=True), args.export)
+            print(f"Wrote {rows} near-duplicate posts to {args.export}")
+        if not (args.rebuild or args.export):
+            parser.print_help()
+    finally:
+        index.close()
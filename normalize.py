@@ -0,0 +1,176 @@
+import re
+import html
+import logging
+
+from post import Post
+
+logger = logging.getLogger('normalize')
+
+# 帖子中记录链接和提及的字段，只在有内容时出现
+LINKS_FIELD = "links"
+MENTIONS_FIELD = "mentions"
+
+# 所有正则只编译一次，避免每条帖子重复编译
+_TAG_RE = re.compile(r'<[^>]*>')
+# 与 html.unescape 相同的字符引用写法（包括不带分号的 &amp）
+_CHARREF_RE = re.compile(r'&(#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)')
+_ANCHOR_RE = re.compile(r'<a\s[^>]*>', re.IGNORECASE)
+_HREF_RE = re.compile(r'href\s*=\s*"([^"]*)"', re.IGNORECASE)
+_CLASS_RE = re.compile(r'class\s*=\s*"([^"]*)"', re.IGNORECASE)
+_MENTION_RE = re.compile(r'(?<![\w@/])@(\w{1,30})')
+_UNICODE_ESCAPE_RE = re.compile(r'\\u([dD][89abAB][0-9a-fA-F]{2})\\u([dD][c-fC-F][0-9a-fA-F]{2})|\\u([0-9a-fA-F]{4})')
+# UTF-8 字节被当作 latin-1/cp1252 解码后留下的典型乱码（如 "â€™"、"Ã©"）
+_CONTINUATION = '[\u0080-¿ŒœŠšŸŽžƒˆ˜–—‘-„†-•…‰‹›€™]'
+_MOJIBAKE_RE = re.compile(f'[Â-ß]{_CONTINUATION}|[à-ï]{_CONTINUATION}{{2}}|[ð-ô]{_CONTINUATION}{{3}}')
+# 能用 cp1252 编码的连续字符；乱码只会出现在这样的一段之内，中文等其他字符把文本分成独立的段
+_CP1252_RUN_RE = re.compile('[\x00-\xffŒœŠšŸŽžƒˆ˜–—‘-„†-•…‰‹›€™]+')
+# 修复结果中出现这些字符（C1控制字符、IPA、希腊、西里尔、叙利亚等文字）时，原文多半本来就是正确的
+_UNLIKELY_RE = re.compile('[\u0080-\u009f\u0250-\u1fff]')
+
+def _decode_escape(match):
+    if match.group(3):
+        return chr(int(match.group(3), 16))
+    high = int(match.group(1), 16)
+    low = int(match.group(2), 16)
+    return chr(0x10000 + ((high - 0xD800) << 10) + (low - 0xDC00))
+
+def _fix_mojibake(text):
+    """
+    Re-decodes a run of text as UTF-8 that was read as cp1252/latin-1.
+    The result is kept only if the round trip is strict, leaves fewer
+    mojibake sequences and only produces characters such posts contain
+    (Latin, punctuation, CJK, emoji): "CAFÉ”" would otherwise become
+    "CAFɔ". Repeats while that holds, for text mis-decoded twice.
+    """
+    markers = len(_MOJIBAKE_RE.findall(text))
+    for encoding in ('cp1252', 'latin-1'):
+        try:
+            fixed = text.encode(encoding).decode('utf-8')
+        except UnicodeError:
+            continue
+        if len(_MOJIBAKE_RE.findall(fixed)) < markers and not _UNLIKELY_RE.search(fixed):
+            # 被错误解码了两次的文本还要再修复一层，结果才不会在下次规范化时改变
+            return _fix_mojibake(fixed)
+    return text
+
+try:
+    import ftfy
+except ImportError:
+    ftfy = None
+
+def fix_unicode(text):
+    """
+    Repairs literal \\uXXXX escapes and UTF-8 text that was decoded with
+    the wrong codec. Uses ftfy when it is installed; the fallback only
+    re-decodes runs of cp1252 text that contain mojibake and decode
+    cleanly as a whole, so correct non-ASCII text is left alone.
+    """
+    if '\\u' in text:
+        text = _UNICODE_ESCAPE_RE.sub(_decode_escape, text)
+    if text.isascii():
+        return text
+    if ftfy is not None:
+        return ftfy.fix_text(text)
+    if not _MOJIBAKE_RE.search(text):
+        return text
+    return _CP1252_RUN_RE.sub(lambda run: _fix_mojibake(run.group(0)), text)
+
+def clean_html(raw_html):
+    """
+    Removes HTML tags and decodes entities (&amp;, &#39;, ...).
+    """
+    text = _TAG_RE.sub('', raw_html)
+    return html.unescape(text) if '&' in text else text
+
+def _escape_charref(match):
+    ref = match.group(0)
+    return '&amp;' + ref[1:] if html.unescape(ref) != ref else ref
+
+def _escape_tag(match):
+    return match.group(0).replace('<', '&lt;').replace('>', '&gt;')
+
+def protect_markup(text):
+    """
+    Re-escapes the parts of decoded text that clean_html would otherwise
+    read as markup: a tag-like <...> (from &lt;...&gt;) and an & that
+    starts a character reference (from &amp;). Everything else, such as
+    "a < b" or "AT&T", stays as plain text.
+    """
+    if '&' in text:
+        text = _CHARREF_RE.sub(_escape_charref, text)
+    if '<' in text:
+        text = _TAG_RE.sub(_escape_tag, text)
+    return text
+
+def normalize_text(raw_html):
+    """
+    Plain text for a post's HTML content. Idempotent: archived content
+    normalized again (clean_archive.py) comes out unchanged, because
+    decoded text that looks like markup is kept escaped.
+    """
+    return protect_markup(fix_unicode(clean_html(raw_html or ""))).strip()
+
+def extract_links(raw_html):
+    """
+    Returns the link targets in a post's HTML, in order, without the
+    mention and hashtag links Truth Social adds around @names and #tags.
+    """
+    links = []
+    for anchor in _ANCHOR_RE.findall(raw_html or ""):
+        href = _HREF_RE.search(anchor)
+        if not href:
+            continue
+        css_class = _CLASS_RE.search(anchor)
+        if css_class and ('mention' in css_class.group(1) or 'hashtag' in css_class.group(1)):
+            continue
+        links.append(html.unescape(href.group(1)))
+    return links
+
+def extract_mentions(text):
+    """Returns the @usernames mentioned in plain text, in order."""
+    return _MENTION_RE.findall(text or "")
+
+def normalize_post(post):
+    """
+    Converts a status from the Truth Social API into an archive record.
+    The link targets and @mentions of the post are added as "links" and
+    "mentions" when it has any.
+    """
+    content = normalize_text(post.get("content", ""))
+    record = {
+        "id": post.get("id"),  # Needed for pagination
+        "created_at": post.get("created_at"),
+        "content": content,
+        "url": post.get("url"),
+        "media": [media.get("url", "") for media in post.get("media_attachments", [])],  # Store media in an array
+        "replies_count": post.get("replies_count", 0),  # Number of replies
+        "reblogs_count": post.get("reblogs_count", 0),  # Number of reblogs (shares)
+        "favourites_count": post.get("favourites_count", 0)  # Number of likes
+    }
+    # 链接只能从原始HTML中取得，提及从清洗后的文本中取
+    links = extract_links(post.get("content"))
+    if links:
+        record[LINKS_FIELD] = links
+    mentions = extract_mentions(content)
+    if mentions:
+        record[MENTIONS_FIELD] = mentions
+    return record
+
+def normalize_posts(posts, skip_ids=()):
+    """
+    Converts a batch of API statuses in one pass, skipping IDs in skip_ids
+    (a set, dict or ID index of posts that are already archived).
+    """
+    return [normalize_post(post) for post in posts if post.get("id") not in skip_ids]
+
+def clean_posts(posts):
+    """
+    Re-normalizes the content of already archived records (dicts or Post
+    records) in place and returns them.
+    """
+    for post in posts:
+        if isinstance(post, Post):
+            post.content = normalize_text(post.content)
+        else:
+            post["content"] = normalize_text(post.get("content", ""))
+    return posts
@@ -0,0 +1,149 @@
+import json
+import time
+import sqlite3
+import logging
+
+from post import Post
+
+logger = logging.getLogger('notification_outbox')
+
+PENDING = "pending"
+DELIVERED = "delivered"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    post_id INTEGER PRIMARY KEY,
+    post TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    delivered_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+def select_unnotified(posts, last_notified_id, limit=None):
+    """
+    Returns the posts newer than last_notified_id from posts, which must be
+    ordered newest first (as fetch_posts returns them), at most limit of
+    them. IDs are compared as integers and the scan stops at the first
+    post that is not newer, so the cost is O(new posts).
+    """
+    selected = []
+    for post in posts:
+        if limit is not None and len(selected) >= limit:
+            break
+        if last_notified_id is not None and int(post["id"]) <= int(last_notified_id):
+            break
+        selected.append(post)
+    return selected
+
+class NotificationOutbox:
+    """
+    Persistent queue of posts waiting to be notified.
+
+    The scraper enqueues new posts as it stores them, so the notifier
+    never has to search the archive for what is new. Each post is a row
+    keyed by its ID: enqueueing a post twice is a no-op, and a delivered
+    post stays marked as delivered, so a post is never notified twice
+    unless the process dies between the webhook accepting it and ack().
+
+    A failed send is retried with exponential backoff (base_delay,
+    doubling up to max_delay) and given up after max_attempts. Delivered
+    and failed rows are kept for retention seconds for inspection.
+    """
+
+    def __init__(self, db_file, max_attempts=8, base_delay=30, max_delay=3600, retention=30 * 24 * 3600):
+        self.db_file = db_file
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retention = retention
+        self._conn = sqlite3.connect(db_file)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def enqueue(self, posts, now=None):
+        """
+        Queues posts (dicts or Post records) for notification.
+        Posts already in the outbox are skipped. Returns the number queued.
+        """
+        now = now or time.time()
+        rows = [
+            (int(post["id"]), json.dumps(post, default=Post.to_dict), now, now)
+            for post in posts
+        ]
+        with self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO outbox (post_id, post, next_attempt, enqueued_at) VALUES (?, ?, ?, ?)", rows
+            )
+            queued = self._conn.total_changes - before
+        if queued:
+            logger.info(f"Queued {queued} posts for notification")
+        return queued
+
+    def due(self, now=None, limit=None):
+        """Pending posts whose next attempt is due, as Post records, newest first."""
+        now = now or time.time()
+        query = "SELECT post FROM outbox WHERE status = ? AND next_attempt <= ? ORDER BY post_id DESC"
+        params = [PENDING, now]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return [Post.from_dict(json.loads(row[0])) for row in self._conn.execute(query, params)]
+
+    def newest_id(self):
+        """The newest post ID ever queued, or None if the outbox is empty."""
+        return self._conn.execute("SELECT MAX(post_id) FROM outbox").fetchone()[0]
+
+    def pending_count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def ack(self, post_ids, now=None):
+        """Marks posts as delivered."""
+        now = now or time.time()
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE outbox SET status = ?, delivered_at = ?, attempts = attempts + 1, last_error = NULL "
+                "WHERE post_id = ?",
+                [(DELIVERED, now, int(post_id)) for post_id in post_ids]
+            )
+
+    def fail(self, post_ids, error, now=None):
+        """
+        Records a failed attempt for posts and schedules the retry, or
+        gives up on posts that have used all their attempts.
+        """
+        now = now or time.time()
+        with self._conn:
+            for post_id in post_ids:
+                row = self._conn.execute("SELECT attempts FROM outbox WHERE post_id = ?", (int(post_id),)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                if attempts >= self.max_attempts:
+                    logger.error(f"Giving up on notification for post {post_id} after {attempts} attempts: {error}")
+                    status, next_attempt = FAILED, now
+                else:
+                    delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                    logger.warning(f"Notification for post {post_id} failed ({error}); retrying in {delay}s")
+                    status, next_attempt = PENDING, now + delay
+                self._conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE post_id = ?",
+                    (status, attempts, next_attempt, str(error), int(post_id))
+                )
+
+    def prune(self, now=None):
+        """Deletes delivered and failed rows older than the retention period."""
+        now = now or time.time()
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM outbox WHERE status != ? AND enqueued_at < ?", (PENDING, now - self.retention)
+            )
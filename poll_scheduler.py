@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger('poll_scheduler')
+
+HOURS_PER_WEEK = 168
+MODEL_MAX_AGE = 24 * 3600  # 每天重新拟合一次发帖频率
+
+def hour_of_week(dt):
+    """Bucket index (0-167) of a UTC datetime, Monday 00:00 first."""
+    return dt.weekday() * 24 + dt.hour
+
+class PostingRateModel:
+    """
+    Posting rate (posts per hour) for each of the 168 hours of the week,
+    learned from post creation times.
+    """
+
+    def __init__(self, rates=None, fitted_at=None, post_count=0):
+        self.rates = rates or [0.0] * HOURS_PER_WEEK
+        self.fitted_at = fitted_at
+        self.post_count = post_count
+
+    @classmethod
+    def fit(cls, created_times, prior=0.5):
+        """
+        Fits the model from UTC datetimes. Each bucket gets a small prior so
+        hours that never had a post are not treated as impossible, and
+        neighbouring hours are blended to smooth out noise.
+        """
+        counts = [0] * HOURS_PER_WEEK
+        first = last = None
+        total = 0
+        for created in created_times:
+            counts[hour_of_week(created)] += 1
+            first = created if first is None or created < first else first
+            last = created if last is None or created > last else last
+            total += 1
+
+        if not total:
+            return cls(fitted_at=time.time())
+
+        weeks = max(1.0, (last - first).total_seconds() / (7 * 24 * 3600))
+        raw = [(count + prior) / weeks for count in counts]
+        rates = [
+            0.25 * raw[(i - 1) % HOURS_PER_WEEK] + 0.5 * raw[i] + 0.25 * raw[(i + 1) % HOURS_PER_WEEK]
+            for i in range(HOURS_PER_WEEK)
+        ]
+        return cls(rates, fitted_at=time.time(), post_count=total)
+
+    def rate_at(self, dt):
+        return self.rates[hour_of_week(dt)]
+
+    def to_dict(self):
+        return {"rates": self.rates, "fitted_at": self.fitted_at, "post_count": self.post_count}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("rates"), data.get("fitted_at"), data.get("post_count", 0))
+
+class AdaptivePollScheduler:
+    """
+    Chooses the time until the next poll from the learned posting rate.
+
+    The interval is sized so that about target_posts posts are expected
+    between polls: short when posting is likely, long overnight. Intervals
+    are clamped to [min_interval, max_interval]. If following the schedule
+    for the rest of the (UTC) day would exceed max_requests_per_day, all
+    intervals are stretched proportionally to fit what is left.
+    """
+
+    def __init__(self, state_file, min_interval=60, max_interval=1800, target_posts=0.05, max_requests_per_day=1000):
+        self.state_file = state_file
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_posts = target_posts
+        self.max_requests_per_day = max_requests_per_day
+        self.state = self._load_state()
+        self.model = PostingRateModel.from_dict(self.state.get("model", {}))
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (ValueError, IOError) as e:
+                logger.warning(f"Error reading poll scheduler state: {e}")
+        return {}
+
+    def _save_state(self):
+        self.state["model"] = self.model.to_dict()
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def ensure_model(self, created_times_factory):
+        """
+        Refits the model if it is missing or older than a day.
+        created_times_factory() returns an iterable of UTC datetimes.
+        """
+        if self.model.fitted_at and time.time() - self.model.fitted_at < MODEL_MAX_AGE:
+            return
+        self.model = PostingRateModel.fit(created_times_factory())
+        logger.info(f"Fitted posting-rate model from {self.model.post_count} posts")
+        self._save_state()
+
+    def base_interval(self, dt):
+        """Interval in seconds for dt, from the posting rate only."""
+        rate = self.model.rate_at(dt)
+        if rate <= 0:
+            return self.max_interval
+        interval = self.target_posts / rate * 3600
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _requests_today(self, now):
+        if self.state.get("budget_date") != now.date().isoformat():
+            return 0
+        return self.state.get("requests_today", 0)
+
+    def _projected_requests(self, now, end_of_day):
+        # 按当前节奏逐小时估算到当天结束还会发出的请求数
+        projected = 0.0
+        cursor = now
+        while cursor < end_of_day:
+            hour_end = min(end_of_day, cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1))
+            projected += (hour_end - cursor).total_seconds() / self.base_interval(cursor)
+            cursor = hour_end
+        return projected
+
+    def next_interval(self, now=None):
+        """Seconds to wait before the next poll."""
+        now = now or datetime.now(timezone.utc)
+        interval = self.base_interval(now)
+
+        end_of_day = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        remaining = self.max_requests_per_day - self._requests_today(now)
+        if remaining <= 0:
+            logger.warning("Daily proxy request budget exhausted; waiting for the next day")
+            return (end_of_day - now).total_seconds()
+
+        projected = self._projected_requests(now, end_of_day)
+        if projected > remaining:
+            interval *= projected / remaining
+        return interval
+
+    def should_poll(self, now=None, slack=30):
+        """
+        For cron mode: whether enough time has passed since the last poll.
+        slack absorbs cron's one-minute granularity so a 60s interval is
+        not rounded up to two minutes.
+        """
+        now = now or datetime.now(timezone.utc)
+        last_poll = self.state.get("last_poll")
+        if last_poll is None:
+            return True
+        return now.timestamp() - last_poll >= self.next_interval(now) - slack
+
+    def record_poll(self, requests_made, now=None):
+        """Records a finished poll and the proxy requests it used."""
+        now = now or datetime.now(timezone.utc)
+        today = now.date().isoformat()
+        if self.state.get("budget_date") != today:
+            self.state["budget_date"] = today
+            self.state["requests_today"] = 0
+        self.state["requests_today"] += requests_made
+        self.state["last_poll"] = now.timestamp()
+        self._save_state()
@@ -0,0 +1,144 @@
+from datetime import datetime, timezone
+
+# 存档记录的字段顺序，与JSON和CSV输出一致
+FIELDS = ("id", "created_at", "content", "url", "media", "replies_count", "reblogs_count", "favourites_count")
+
+def parse_timestamp(created_at, post_id=0):
+    """
+    Returns created_at ("2025-03-09T10:41:28.605Z") as seconds since the
+    epoch, falling back to the time encoded in the snowflake ID.
+    """
+    try:
+        created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        return created.timestamp()
+    except (AttributeError, ValueError):
+        return (int(post_id) >> 16) / 1000
+
+class Post:
+    """
+    Compact archive record.
+
+    A dict per post carries a hash table for eight keys; with __slots__ the
+    fields are stored inline, the ID is an int and media is a tuple. The
+    creation time is parsed once into timestamp, while created_at keeps the
+    original string so records round-trip unchanged. Fields the archive
+    may carry beyond FIELDS are kept in extra.
+
+    Post also supports post["key"], post.get("key") and post["key"] = value
+    with the values a JSON record would have ("id" as a string), so code
+    written for dicts can take either. Serialize with to_dict(), or pass
+    default=Post.to_dict to json.dump.
+    """
+
+    __slots__ = ("id", "created_at", "timestamp", "content", "url", "media",
+                 "replies_count", "reblogs_count", "favourites_count", "extra")
+
+    def __init__(self, id, created_at=None, content="", url=None, media=(),
+                 replies_count=0, reblogs_count=0, favourites_count=0, extra=None):
+        self.id = int(id)
+        self.created_at = created_at
+        self.timestamp = parse_timestamp(created_at, self.id)
+        self.content = content
+        self.url = url
+        self.media = tuple(media)
+        self.replies_count = replies_count
+        self.reblogs_count = reblogs_count
+        self.favourites_count = favourites_count
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {key: value for key, value in data.items() if key not in FIELDS}
+        return cls(
+            data["id"],
+            data.get("created_at"),
+            data.get("content", ""),
+            data.get("url"),
+            data.get("media") or (),
+            data.get("replies_count", 0),
+            data.get("reblogs_count", 0),
+            data.get("favourites_count", 0),
+            extra
+        )
+
+    def to_dict(self):
+        data = {
+            "id": str(self.id),
+            "created_at": self.created_at,
+            "content": self.content,
+            "url": self.url,
+            "media": list(self.media),
+            "replies_count": self.replies_count,
+            "reblogs_count": self.reblogs_count,
+            "favourites_count": self.favourites_count
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def to_csv_row(self):
+        """Row matching archive_store.CSV_HEADER."""
+        return [
+            str(self.id),
+            self.created_at,
+            self.content,
+            self.url,
+            "; ".join(self.media),
+            self.replies_count,
+            self.reblogs_count,
+            self.favourites_count
+        ]
+
+    def created(self):
+        """Creation time as an aware UTC datetime."""
+        return datetime.fromtimestamp(self.timestamp, tz=timezone.utc)
+
+    def __getitem__(self, key):
+        if key == "id":
+            return str(self.id)
+        if key == "media":
+            return list(self.media)
+        if key in FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        """
+        post["key"] = value, as for a dict record: archive fields are set
+        on the record, any other key (e.g. "watchlist") is stored in extra.
+        """
+        if key == "id":
+            self.id = int(value)
+        elif key == "created_at":
+            self.created_at = value
+            self.timestamp = parse_timestamp(value, self.id)
+        elif key == "media":
+            self.media = tuple(value)
+        elif key in FIELDS:
+            setattr(self, key, value)
+        else:
+            self.extra = dict(self.extra or {}, **{key: value})
+
+    def __eq__(self, other):
+        if not isinstance(other, Post):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Post(id={self.id}, created_at={self.created_at!r})"
+
+def as_post(post):
+    """Returns post as a Post, converting dicts."""
+    return post if isinstance(post, Post) else Post.from_dict(post)
@@ -3,24 +3,72 @@ import json
 import os
 import time
 import csv
-import re
+import signal
 import logging
-from datetime import datetime, timedelta
-from send_lark_notification import check_and_notify
+import argparse
+import threading
+from datetime import datetime
+from send_lark_notification import check_and_notify, read_last_notified_id
+from notification_outbox import NotificationOutbox, select_unnotified
+from archive_store import open_archive_store, merge_posts, CSV_HEADER, post_to_csv_row
+from id_index import PostIdIndex, snowflake_to_datetime
+from sqlite_store import PostDatabase
+from poll_scheduler import AdaptivePollScheduler
+from engagement_refresh import EngagementRefresher
+from engagement_history import EngagementHistory
+from text_index import TextIndex
+from watchlist import load_watchlist, watchlist_matches
+from near_duplicates import NearDuplicateIndex
+from media_mirror import MediaMirror
+from http_client import get_session, configure_session, log_metrics
+from normalize import normalize_posts
+from post import Post
 from config import (
     SCRAPEOPS_API_KEY, 
     SCRAPEOPS_ENDPOINT, 
     OUTPUT_JSON_FILE, 
+    OUTPUT_SEGMENT_FILE,
+    OUTPUT_INDEX_FILE,
     OUTPUT_CSV_FILE,
+    OUTPUT_CSV_SEGMENT_FILE,
+    OUTPUT_COLUMNS_DIR,
+    OUTPUT_DB_FILE,
     ARCHIVE_URL, 
     BASE_URL, 
     HEALTH_CHECK_URL, 
     ERROR_THRESHOLD,
     ERROR_COUNT_FILE,
     LAST_ALERT_FILE,
-    USE_LOCAL_ARCHIVE
+    USE_LOCAL_ARCHIVE,
+    POLL_INTERVAL,
+    ADAPTIVE_POLLING,
+    MIN_POLL_INTERVAL,
+    MAX_POLL_INTERVAL,
+    ADAPTIVE_TARGET_POSTS,
+    MAX_PROXY_REQUESTS_PER_DAY,
+    POLL_STATE_FILE,
+    ENGAGEMENT_REFRESH,
+    REFRESH_REQUESTS_PER_DAY,
+    REFRESH_STATE_FILE,
+    ENGAGEMENT_HISTORY,
+    OUTPUT_ENGAGEMENT_DIR,
+    NOTIFICATION_OUTBOX_FILE,
+    SEARCH_INDEX,
+    OUTPUT_SEARCH_DIR,
+    WATCHLIST,
+    NEAR_DUPLICATES,
+    NEAR_DUPLICATE_THRESHOLD,
+    OUTPUT_NEAR_DUPLICATES_DB,
+    MEDIA_MIRROR,
+    MEDIA_WORKERS,
+    OUTPUT_MEDIA_DIR,
+    HTTP_POOL_SIZE,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_FACTOR
 )
 
+configure_session(pool_size=HTTP_POOL_SIZE, max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR)
+
 # 确保所有必要的目录都存在
 DATA_DIR = "./data"
 LOG_DIR = "./data/logs"
@@ -28,7 +76,10 @@ os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
 
 # 配置日志
-log_file = f"{LOG_DIR}/scraper_{datetime.now().strftime('%Y%m%d')}.log"
+def get_log_file():
+    return f"{LOG_DIR}/scraper_{datetime.now().strftime('%Y%m%d')}.log"
+
+log_file = get_log_file()
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s [%(levelname)s] %(message)s',
@@ -39,6 +90,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger('trump_scraper')
 
+# 时间线接口的请求头和查询参数
+TIMELINE_HEADERS = {
+    'accept': 'application/json, text/plain, */*',
+    'referer': 'https://truthsocial.com/@realDonaldTrump'
+}
+TIMELINE_PARAMS = {
+    "exclude_replies": "true",
+    "only_replies": "false",
+    "with_muted": "true",
+    "limit": "20"
+}
+
+def timeline_url(params):
+    return f"{BASE_URL}?{'&'.join([f'{k}={v}' for k, v in params.items()])}"
+
 def send_health_alert(status, message):
     """
     发送健康状态警报，但每天只发送一次
@@ -74,7 +140,7 @@ def send_health_alert(status, message):
     }
     
     try:
-        response = requests.post(
+        response = get_session().post(
             HEALTH_CHECK_URL,
             headers={"Content-Type": "application/json"},
             data=json.dumps(payload),
@@ -136,9 +202,7 @@ def scrape(url, headers=None):
     if not SCRAPEOPS_API_KEY:
         raise ValueError("Missing scrape_proxy_key in config file")
 
-    session = requests.Session()
-    if headers:
-        session.headers.update(headers)
+    session = get_session()
 
     proxy_params = {
         'api_key': SCRAPEOPS_API_KEY,
@@ -147,37 +211,48 @@ def scrape(url, headers=None):
     }
 
     logger.info(f"Making request to: {url}")
-    response = session.get(SCRAPEOPS_ENDPOINT, params=proxy_params, timeout=120)
+    response = session.get(SCRAPEOPS_ENDPOINT, params=proxy_params, headers=headers, timeout=120)
     response.raise_for_status()
     logger.info(f"Request successful, received {len(response.text)} bytes")
 
     return response.json()
 
+def get_archive_store():
+    """
+    Returns the archive store for the configured output files.
+    """
+    return open_archive_store(OUTPUT_JSON_FILE, OUTPUT_SEGMENT_FILE, OUTPUT_INDEX_FILE,
+                              OUTPUT_CSV_FILE, OUTPUT_CSV_SEGMENT_FILE, OUTPUT_COLUMNS_DIR, OUTPUT_DB_FILE)
+
 def load_existing_posts():
     """
-    Loads existing posts from the archive.
+    Loads the IDs of existing posts from the archive.
+    For the local archive this is the memory-mapped ID index (or, with
+    storage_mode "sqlite", the post database), so startup does not parse
+    the archive itself. Returns a container supporting `in`.
+    Errors loading the local index are raised; only a remote archive
+    that cannot be loaded falls back to an empty dict.
     """
+    # 首先检查是否使用本地存档
+    if USE_LOCAL_ARCHIVE:
+        # 本地索引加载失败时直接抛出：用空集合代替会把整页帖子当作新帖子重复存档
+        store = get_archive_store()
+        if not store.exists():
+            logger.info(f"Local archive file not found: {OUTPUT_JSON_FILE}. Starting with empty archive.")
+        # 空存档也返回索引，常驻进程之后会在其上看到新写入的ID
+        logger.info("Loading existing post IDs from the archive index")
+        existing_posts = store.load_index()
+        logger.info(f"Loaded {len(existing_posts)} existing post IDs from local index")
+        return existing_posts
+
     try:
-        # 首先检查是否使用本地存档
-        if USE_LOCAL_ARCHIVE:
-            if os.path.exists(OUTPUT_JSON_FILE):
-                logger.info(f"Loading existing posts from local file: {OUTPUT_JSON_FILE}")
-                with open(OUTPUT_JSON_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                existing_posts = {post["id"]: post for post in data}
-                logger.info(f"Loaded {len(existing_posts)} existing posts from local file")
-                return existing_posts
-            else:
-                logger.info(f"Local archive file not found: {OUTPUT_JSON_FILE}. Starting with empty archive.")
-                return {}
-        
         # 如果不使用本地存档且设置了远程URL，则从远程获取
-        elif ARCHIVE_URL:
+        if ARCHIVE_URL:
             logger.info(f"Loading existing posts from remote URL: {ARCHIVE_URL}")
-            response = requests.get(ARCHIVE_URL, timeout=30)
+            response = get_session().get(ARCHIVE_URL, timeout=30)
             response.raise_for_status()
             data = response.json()
-            existing_posts = {post["id"]: post for post in data}
+            existing_posts = {post["id"]: Post.from_dict(post) for post in data}
             logger.info(f"Loaded {len(existing_posts)} existing posts from remote URL")
             return existing_posts
         
@@ -193,111 +268,135 @@ def load_existing_posts():
 def append_to_json_file(data, file_path):
     """
     Saves the full dataset to JSON (array format).
+    Kept for full exports; the scraper itself writes through the archive store.
     """
     logger.info(f"Saving {len(data)} posts to JSON file: {file_path}")
     with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+        json.dump(data, f, indent=2, default=Post.to_dict)
 
 def append_to_csv_file(data, file_path):
     """
     Saves the dataset to a CSV file, including engagement metrics.
+    Kept for full exports; the local archive appends rows through the archive store.
     """
     logger.info(f"Saving {len(data)} posts to CSV file: {file_path}")
     with open(file_path, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
-        writer.writerow(["id", "created_at", "content", "url", "media", "replies_count", "reblogs_count", "favourites_count"])
+        writer.writerow(CSV_HEADER)
         for post in data:
-            media_urls = "; ".join(post.get("media", []))
-            writer.writerow([
-                post.get("id"),
-                post.get("created_at"),
-                post.get("content", ""),
-                post.get("url"),
-                media_urls,
-                post.get("replies_count", 0),
-                post.get("reblogs_count", 0),
-                post.get("favourites_count", 0)
-            ])
+            writer.writerow(post_to_csv_row(post))
+
+# 关注列表只编译一次，每条新帖子只扫描一遍
+watchlist = load_watchlist(WATCHLIST)
 
-def clean_html(raw_html):
+def extract_posts(json_response, existing_posts):
     """
-    Removes HTML tags from a string.
-    This strips unwanted markup like anchor tags.
+    Extracts relevant data from the JSON response, including engagement metrics.
+    Post content is normalized by normalize.normalize_posts in one pass;
+    the new posts are returned as compact Post records. Posts matching the
+    watchlist are tagged with their matches (see watchlist.py).
     """
-    return re.sub('<.*?>', '', raw_html)
+    extracted_data = [Post.from_dict(post) for post in normalize_posts(json_response, skip_ids=existing_posts)]
+    watchlist.tag(extracted_data)
+    logger.info(f"Extracted {len(extracted_data)} new posts")
+    return extracted_data
 
-def fix_unicode(text):
+def newest_known_id(existing_posts):
+    """
+    Returns the newest archived post ID, or None if nothing is archived yet.
     """
-    Ensures that escaped Unicode sequences (e.g., \u2026, \u2014)
-    are converted to their proper characters.
+    if isinstance(existing_posts, (PostIdIndex, PostDatabase)):
+        return existing_posts.newest()
+    post_ids = [int(post_id) for post_id in existing_posts if str(post_id).isdigit()]
+    return max(post_ids) if post_ids else None
+
+def queue_notifications(new_posts, max_notifications=5):
     """
+    Queues new posts (newest first) in the notification outbox. Called
+    before the posts are archived: once they are archived the next run's
+    since_id skips them, so a crash in between must not lose them.
+    Queueing is idempotent (INSERT OR IGNORE).
+
+    Posts are taken from the in-memory result of fetch_posts: only those
+    newer than the newest post already queued (or, before the outbox
+    existed, last_notified_id) are selected, stopping at the first one
+    already seen. At most max_notifications are queued, so a first run or
+    a long outage does not flood the channel; posts matching the watchlist
+    are queued regardless.
+    """
+    outbox = NotificationOutbox(NOTIFICATION_OUTBOX_FILE)
     try:
-        return text.encode('utf-8').decode('unicode_escape')
-    except Exception:
-        return text
+        last_notified_id = outbox.newest_id()
+        if last_notified_id is None:
+            last_notified_id = read_last_notified_id()
+        unnotified = select_unnotified(new_posts, last_notified_id)
+        outbox.enqueue(
+            unnotified[:max_notifications] + [post for post in unnotified[max_notifications:] if watchlist_matches(post)]
+        )
+    finally:
+        outbox.close()
 
-def extract_posts(json_response, existing_posts):
+def send_notifications():
     """
-    Extracts relevant data from the JSON response, including engagement metrics.
-    Applies clean_html and fix_unicode to the post content.
+    Sends everything in the notification outbox that is due: the posts
+    queued by this run and retries of earlier failures.
     """
-    extracted_data = []
-    
-    for post in json_response:
-        post_id = post.get("id")
-        if post_id in existing_posts:
-            continue  # Skip duplicates
-
-        media_urls = [media.get("url", "") for media in post.get("media_attachments", [])]
-
-        extracted_data.append({
-            "id": post_id,  # Needed for pagination
-            "created_at": post.get("created_at"),
-            "content": fix_unicode(clean_html(post.get("content", ""))).strip(),
-            "url": post.get("url"),
-            "media": media_urls,  # Store media in an array
-            "replies_count": post.get("replies_count", 0),  # Number of replies
-            "reblogs_count": post.get("reblogs_count", 0),  # Number of reblogs (shares)
-            "favourites_count": post.get("favourites_count", 0)  # Number of likes
-        })
+    outbox = NotificationOutbox(NOTIFICATION_OUTBOX_FILE)
+    try:
+        pending = outbox.pending_count()
+    finally:
+        outbox.close()
 
-    logger.info(f"Extracted {len(extracted_data)} new posts")
-    return extracted_data
+    if pending:
+        logger.info("Sending notifications for new posts...")
+        check_and_notify(NOTIFICATION_OUTBOX_FILE)
 
-def fetch_posts(max_pages=3):
+def fetch_posts(max_pages=3, existing_posts=None):
     """
     Fetches posts with pagination up to a specified number of pages.
+    existing_posts may be passed in by a long-running caller that keeps the
+    ID index in memory; otherwise it is loaded from the archive.
+    Returns the number of proxy requests made.
+
+    The newest archived ID is sent as since_id, so the API returns only
+    posts we don't have yet: with nothing new the first response is an
+    empty list, and a page shorter than the limit means we have caught up.
     """
     logger.info("Starting post fetch operation")
-    headers = {
-        'accept': 'application/json, text/plain, */*',
-        'referer': 'https://truthsocial.com/@realDonaldTrump'
-    }
-    
-    params = {
-        "exclude_replies": "true",
-        "only_replies": "false",
-        "with_muted": "true",
-        "limit": "20"
-    }
+    headers = TIMELINE_HEADERS
+    params = dict(TIMELINE_PARAMS)
 
-    existing_posts = load_existing_posts()
-    all_posts = list(existing_posts.values())  # Start with existing data
+    if existing_posts is None:
+        try:
+            existing_posts = load_existing_posts()
+        except Exception as e:
+            logger.error(f"Could not load existing posts, skipping this poll: {e}", exc_info=True)
+            update_error_count(success=False)
+            return 0
+    since_id = newest_known_id(existing_posts)
+    if since_id is not None:
+        params["since_id"] = str(since_id)
+    page_size = int(params["limit"])
     page_count = 0
+    requests_made = 0
     new_posts = []
-    found_new_posts = False
+    caught_up = False
     success = False
 
     try:
         while page_count < max_pages:
-            url = f"{BASE_URL}?{'&'.join([f'{k}={v}' for k, v in params.items()])}"
+            url = timeline_url(params)
             logger.info(f"Fetching page {page_count+1}/{max_pages}: {url}")
 
             try:
+                requests_made += 1
                 response = scrape(url, headers=headers)
                 if not response:  # Ensure response is valid
-                    logger.warning(f"Empty response from {url}. Skipping.")
-                    continue
+                    # 带 since_id 时空列表就是"没有新帖子"；继续循环只会无限重复同一个请求
+                    logger.info(f"Empty response from {url}. Caught up, exiting pagination.")
+                    success = True
+                    caught_up = True
+                    break
 
                 current_page_posts = extract_posts(response, existing_posts)
                 if not current_page_posts:
@@ -306,26 +405,49 @@ def fetch_posts(max_pages=3):
                     break  # No more new posts
 
                 new_posts.extend(current_page_posts)
-                found_new_posts = True
-                params["max_id"] = current_page_posts[-1]["id"]  # Get older posts
+                params["max_id"] = current_page_posts[-1].id  # Get older posts
                 page_count += 1
                 success = True  # 至少有一页抓取成功就算成功
 
+                if since_id is not None and len(response) < page_size:
+                    # since_id 和 max_id 之间已经没有更多帖子
+                    logger.info("Caught up with the archive. Exiting pagination.")
+                    caught_up = True
+                    break
+
             except requests.exceptions.RequestException as e:
                 logger.error(f"Error fetching posts: {e}")
                 success = False
                 break
+
+        if since_id is not None and page_count >= max_pages and not caught_up:
+            # 新帖子超过 max_pages 页，更早的部分需要回填脚本补齐
+            logger.warning(f"More than {max_pages} pages of new posts; run the backfill to fetch the rest")
                 
         if new_posts:
             logger.info(f"Found {len(new_posts)} new posts in total")
-            all_posts.extend(new_posts)  # Merge new posts
-            
-            # 排序帖子（按创建时间降序）
-            all_posts.sort(key=lambda post: post["created_at"], reverse=True)
+
+            # 在写入存档和通知之前标记疑似重复，标记随帖子一起保存
+            if NEAR_DUPLICATES:
+                flag_near_duplicates(new_posts)
             
-            # 保存到文件
-            append_to_json_file(all_posts, OUTPUT_JSON_FILE)
-            append_to_csv_file(all_posts, OUTPUT_CSV_FILE)
+            # 先放入通知队列再存档：存档之后下次运行的 since_id 会跳过这些帖子，
+            # 两步之间进程退出也不会漏发通知
+            queue_notifications(new_posts)
+
+            # 保存到文件（本地存档的JSON和CSV都只追加新帖子）
+            if USE_LOCAL_ARCHIVE:
+                get_archive_store().append_posts(new_posts)
+                if isinstance(existing_posts, PostIdIndex):
+                    # 常驻进程复用同一个索引，重新映射以包含刚写入的ID
+                    existing_posts.open()
+            else:
+                # 远程存档不在本地，需要写出完整数据集
+                all_posts = merge_posts(existing_posts.values(), new_posts)
+                append_to_json_file(all_posts, OUTPUT_JSON_FILE)
+                append_to_csv_file(all_posts, OUTPUT_CSV_FILE)
+                # 常驻进程会复用这个字典，需要加入新帖子
+                existing_posts.update((post["id"], post) for post in new_posts)
             
             logger.info(f"Scraping complete. {len(new_posts)} new posts added.")
 
@@ -333,12 +455,25 @@ def fetch_posts(max_pages=3):
             with open("./data/last_success.txt", "w") as f:
                 f.write(str(int(time.time())))
             logger.info("Updated last success timestamp")
-
-            # 立即调用通知功能
-            logger.info("Sending notifications for new posts...")
-            check_and_notify()
         else:
             logger.info("Scraping complete. No new posts found.")
+
+        # 发送队列中的新帖子；没有新帖子时也会重试之前失败的通知
+        send_notifications()
+
+        # 以下步骤在通知之后进行，各自处理异常：帖子已经存档，失败时不能让通知被跳过
+        if new_posts:
+            # 新帖子的首次互动数也是时间序列的第一个观测点
+            record_engagement(new_posts)
+            if SEARCH_INDEX and USE_LOCAL_ARCHIVE:
+                update_search_index(new_posts)
+            # 首次运行时签名索引在这里由完整存档建立，不推迟通知
+            if NEAR_DUPLICATES and USE_LOCAL_ARCHIVE:
+                build_near_duplicate_index()
+
+        # 通知发出后再下载媒体，大文件不会推迟通知
+        if MEDIA_MIRROR and USE_LOCAL_ARCHIVE and new_posts:
+            mirror_media(new_posts)
             
         # 更新错误计数（成功时重置为0）
         update_error_count(success=success)
@@ -349,9 +484,251 @@ def fetch_posts(max_pages=3):
         # 更新错误计数
         update_error_count(success=False)
     
+    log_metrics(logger)
     logger.info("Fetch operation completed")
+    return requests_made
+
+def fetch_timeline_page(max_id):
+    """
+    Fetches one timeline page of posts older than max_id (raw API statuses).
+    """
+    return scrape(timeline_url(dict(TIMELINE_PARAMS, max_id=max_id)), headers=TIMELINE_HEADERS) or []
+
+def get_engagement_history():
+    """
+    Returns the engagement time-series store, or None when
+    engagement_history is off.
+    """
+    return EngagementHistory(OUTPUT_ENGAGEMENT_DIR) if ENGAGEMENT_HISTORY else None
+
+def record_engagement(new_posts):
+    """
+    Records the engagement counts of new posts as the first point of their
+    time series (see engagement_history.py), when engagement_history is on.
+    Failures are logged, not raised.
+    """
+    try:
+        history = get_engagement_history()
+        if history is not None:
+            history.record(new_posts)
+    except Exception as e:
+        # 时间序列写入失败不影响抓取和通知，也不计入错误次数
+        logger.warning(f"Recording engagement history failed: {e}")
+
+def update_search_index(new_posts):
+    """
+    Adds new posts to the full-text search index (see search.py). The
+    first time the index is built from the full archive, which already
+    contains the new posts. Failures are logged, not raised; run
+    `search.py --rebuild` to repair the index.
+    """
+    try:
+        index = TextIndex(OUTPUT_SEARCH_DIR)
+        if index.segments():
+            index.add(new_posts)
+        else:
+            index.rebuild(get_archive_store().iter_posts(as_records=True))
+    except Exception as e:
+        # 索引更新失败不影响抓取和通知，也不计入错误次数
+        logger.warning(f"Search index update failed: {e}")
+
+def flag_near_duplicates(new_posts):
+    """
+    Flags new posts that nearly duplicate an earlier post (see
+    near_duplicates.py) and adds them to the signature index. Runs before
+    archiving, so the flags are saved with the posts. While the index has
+    not been built from the local archive yet, nothing is flagged:
+    build_near_duplicate_index builds it after the notifications are sent.
+    Failures are logged, not raised.
+    """
+    try:
+        index = NearDuplicateIndex(OUTPUT_NEAR_DUPLICATES_DB, threshold=NEAR_DUPLICATE_THRESHOLD)
+        try:
+            if len(index) == 0 and USE_LOCAL_ARCHIVE and get_archive_store().exists():
+                return
+            index.tag(new_posts)
+        finally:
+            index.close()
+    except Exception as e:
+        # 标记失败时帖子照常存档和通知，只是没有疑似重复标记，也不计入错误次数
+        logger.warning(f"Near-duplicate check failed: {e}")
+
+def build_near_duplicate_index():
+    """
+    Builds the near-duplicate signature index from the local archive
+    (which already contains the new posts) if it is still empty. Failures
+    are logged, not raised; `near_duplicates.py --rebuild` builds it too.
+    """
+    try:
+        index = NearDuplicateIndex(OUTPUT_NEAR_DUPLICATES_DB, threshold=NEAR_DUPLICATE_THRESHOLD)
+        try:
+            if len(index) == 0:
+                index.rebuild(get_archive_store().iter_posts(as_records=True))
+        finally:
+            index.close()
+    except Exception as e:
+        logger.warning(f"Building the near-duplicate index failed: {e}")
+
+def mirror_media(new_posts):
+    """
+    Downloads the media of new posts into the content-addressed store
+    (see media_mirror.py) and writes the local paths back to the archive.
+    Failed downloads are logged and retried by `media_mirror.py --backfill`;
+    other failures are logged, not raised.
+    """
+    try:
+        mirror = MediaMirror(OUTPUT_MEDIA_DIR, workers=MEDIA_WORKERS)
+        try:
+            updated = mirror.mirror(new_posts)
+            if updated:
+                get_archive_store().append_posts(updated)
+        finally:
+            mirror.close()
+    except Exception as e:
+        # 媒体目录或数据库无法打开、下载失败都不影响抓取，也不计入错误次数
+        logger.warning(f"Media mirroring failed: {e}")
+
+def refresh_engagement():
+    """
+    Re-fetches the engagement counts of recent posts that are due for a
+    refresh (see engagement_refresh.py). Returns the number of proxy
+    requests made.
+    """
+    if not USE_LOCAL_ARCHIVE:
+        return 0
+    refresher = EngagementRefresher(REFRESH_STATE_FILE, fetch_timeline_page,
+                                    max_requests_per_day=REFRESH_REQUESTS_PER_DAY,
+                                    history=get_engagement_history())
+    try:
+        requests_made, _ = refresher.run(get_archive_store())
+        return requests_made
+    except Exception as e:
+        # 刷新失败不影响新帖子的抓取，也不计入错误次数
+        logger.warning(f"Engagement refresh failed: {e}")
+        return 0
+
+def get_poll_scheduler():
+    """
+    Returns the adaptive poll scheduler, refitting its posting-rate model
+    from the ID index (snowflake IDs encode the creation time) when stale.
+    """
+    scheduler = AdaptivePollScheduler(
+        POLL_STATE_FILE,
+        min_interval=MIN_POLL_INTERVAL,
+        max_interval=MAX_POLL_INTERVAL,
+        target_posts=ADAPTIVE_TARGET_POSTS,
+        max_requests_per_day=MAX_PROXY_REQUESTS_PER_DAY
+    )
+    if USE_LOCAL_ARCHIVE:
+        scheduler.ensure_model(
+            lambda: (snowflake_to_datetime(post_id) for post_id in get_archive_store().load_index())
+        )
+    return scheduler
+
+def rotate_log_file():
+    """
+    Points the file log handler at today's log file (the daemon outlives a day).
+    """
+    global log_file
+    current = get_log_file()
+    if current == log_file:
+        return
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, logging.FileHandler):
+            root_logger.removeHandler(handler)
+            handler.close()
+            new_handler = logging.FileHandler(current)
+            new_handler.setFormatter(handler.formatter)
+            root_logger.addHandler(new_handler)
+    log_file = current
+
+def run_daemon(interval=POLL_INTERVAL, max_pages=3, adaptive=ADAPTIVE_POLLING, refresh=ENGAGEMENT_REFRESH):
+    """
+    Polls in a loop inside one process instead of being started by cron.
+    The ID index, pooled HTTP session and config stay in memory between polls.
+    With adaptive=True the wait between polls comes from the adaptive
+    scheduler instead of the fixed interval. With refresh=True each poll is
+    followed by an engagement refresh of the recent posts that are due.
+    SIGINT/SIGTERM finish the current poll and then exit.
+    """
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down after the current poll")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    if adaptive:
+        logger.info("=== Scraper daemon started with adaptive polling ===")
+    else:
+        logger.info(f"=== Scraper daemon started, polling every {interval}s ===")
+    existing_posts = None
+    scheduler = get_poll_scheduler() if adaptive else None
+
+    while not stop_event.is_set():
+        started = time.monotonic()
+        rotate_log_file()
+        if existing_posts is None:
+            # 索引在整个进程中复用；加载失败时下次轮询重试，不用空集合代替
+            try:
+                existing_posts = load_existing_posts()
+            except Exception as e:
+                logger.error(f"Could not load existing posts, retrying in {interval}s: {e}", exc_info=True)
+                update_error_count(success=False)
+                stop_event.wait(interval)
+                continue
+        requests_made = fetch_posts(max_pages=max_pages, existing_posts=existing_posts)
+        if refresh:
+            requests_made += refresh_engagement()
+
+        if scheduler:
+            scheduler.record_poll(requests_made)
+            scheduler.ensure_model(
+                lambda: (snowflake_to_datetime(post_id) for post_id in existing_posts)
+            )
+            wait = scheduler.next_interval()
+            logger.info(f"Next poll in {wait:.0f}s")
+        else:
+            wait = interval
+
+        # 按固定节奏轮询，扣除本次抓取耗时
+        elapsed = time.monotonic() - started
+        stop_event.wait(max(0, wait - elapsed))
+
+    logger.info("=== Scraper daemon stopped ===")
 
 if __name__ == "__main__":
-    logger.info(f"=== Trump Truth Social Scraper started at {datetime.now().isoformat()} ===")
-    fetch_posts(max_pages=3)
-    logger.info(f"=== Scraper run completed at {datetime.now().isoformat()} ===")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Trump Truth Social scraper")
+    parser.add_argument('--daemon', action='store_true', help='Keep running and poll on an internal schedule instead of exiting after one run')
+    parser.add_argument('--interval', type=int, default=POLL_INTERVAL, help='Seconds between polls in daemon mode')
+    parser.add_argument('--max-pages', type=int, default=3, help='Maximum pages to fetch per poll')
+    parser.add_argument('--adaptive', action='store_true', default=ADAPTIVE_POLLING,
+                        help='Poll more often when posts are likely and less overnight, within the daily request budget')
+    parser.add_argument('--refresh', action='store_true', default=ENGAGEMENT_REFRESH,
+                        help='After each poll, re-fetch the engagement counts of recent posts that are due')
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon(interval=args.interval, max_pages=args.max_pages, adaptive=args.adaptive, refresh=args.refresh)
+    elif args.adaptive:
+        # cron仍然每分钟启动，但只在调度器认为到期时才真正发出请求
+        scheduler = get_poll_scheduler()
+        if scheduler.should_poll():
+            logger.info(f"=== Trump Truth Social Scraper started at {datetime.now().isoformat()} ===")
+            requests_made = fetch_posts(max_pages=args.max_pages)
+            if args.refresh:
+                requests_made += refresh_engagement()
+            scheduler.record_poll(requests_made)
+            logger.info(f"=== Scraper run completed at {datetime.now().isoformat()} ===")
+        else:
+            logger.info("Adaptive polling: next poll not due yet, skipping this run")
+    else:
+        logger.info(f"=== Trump Truth Social Scraper started at {datetime.now().isoformat()} ===")
+        fetch_posts(max_pages=args.max_pages)
+        if args.refresh:
+            refresh_engagement()
+        logger.info(f"=== Scraper run completed at {datetime.now().isoformat()} ===")
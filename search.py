@@ -0,0 +1,95 @@
+import re
+import time
+import logging
+import argparse
+from datetime import datetime
+
+from text_index import TextIndex, tokenize
+from archive_store import open_archive_store
+from id_index import datetime_to_snowflake, snowflake_to_datetime
+from config import OUTPUT_SEARCH_DIR
+
+logger = logging.getLogger('search')
+
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+def parse_query(query):
+    """
+    Splits a query into phrases (token lists). Quoted text is one phrase;
+    every other word is a term, or a phrase if it tokenizes to several
+    tokens (e.g. covid-19).
+    """
+    phrases = []
+    for quoted, word in _QUERY_RE.findall(query):
+        tokens = tokenize(quoted or word)
+        if tokens:
+            phrases.append(tokens)
+    return phrases
+
+def search(query, since=None, until=None, limit=None, index_dir=OUTPUT_SEARCH_DIR):
+    """
+    Returns the IDs of posts matching every term and phrase in query,
+    newest first. since/until (datetimes, naive means UTC) restrict the
+    creation time to [since, until).
+    """
+    post_ids = TextIndex(index_dir).search(
+        parse_query(query),
+        min_id=datetime_to_snowflake(since) if since else None,
+        max_id=datetime_to_snowflake(until) if until else None
+    )
+    return post_ids[:limit] if limit is not None else post_ids
+
+def load_posts(post_ids, store=None):
+    """
+    Returns the archived posts with the given IDs, newest first. The
+    archive is streamed newest first and reading stops once all are found.
+    """
+    wanted = set(post_ids)
+    posts = []
+    if not wanted:
+        return posts
+    for post in (store or open_archive_store()).iter_posts():
+        if int(post["id"]) in wanted:
+            posts.append(post)
+            if len(posts) == len(wanted):
+                break
+    return posts
+
+def rebuild_index(index_dir=OUTPUT_SEARCH_DIR, store=None):
+    """Rebuilds the search index from the full archive."""
+    TextIndex(index_dir).rebuild((store or open_archive_store()).iter_posts(as_records=True))
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description="Full-text search over the archived posts")
+    parser.add_argument('query', nargs='?', help='Terms and "quoted phrases"; posts must match all of them')
+    parser.add_argument('--since', type=_parse_date, help='Only posts created on or after this date (YYYY-MM-DD, UTC)')
+    parser.add_argument('--until', type=_parse_date, help='Only posts created before this date (YYYY-MM-DD, UTC)')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum number of results (default 20)')
+    parser.add_argument('--content', action='store_true', help='Print the content of the matching posts')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from the full archive')
+    parser.add_argument('--dir', default=OUTPUT_SEARCH_DIR, help='Search index directory')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild_index(args.dir)
+    if args.query:
+        started = time.perf_counter()
+        matches = search(args.query, since=args.since, until=args.until, index_dir=args.dir)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"{len(matches)} posts match ({elapsed_ms:.1f} ms)")
+
+        post_ids = matches[:args.limit]
+        contents = {}
+        if args.content:
+            contents = {int(post["id"]): post.get("content") for post in load_posts(post_ids)}
+        for post_id in post_ids:
+            created = snowflake_to_datetime(post_id).strftime("%Y-%m-%d %H:%M")
+            print(f"{post_id}  {created}  https://truthsocial.com/@realDonaldTrump/{post_id}")
+            if post_id in contents:
+                print(f"    {contents[post_id]}")
+    elif not args.rebuild:
+        parser.print_help()
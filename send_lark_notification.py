@@ -1,10 +1,24 @@
-import requests
 import json
 import os
 import time
 import logging
+import threading
 from datetime import datetime
-from config import LARK_WEBHOOK_URL
+from config import (
+    LARK_WEBHOOK_URL,
+    LARK_PRIORITY_WEBHOOK_URL,
+    LARK_BATCH_NOTIFICATIONS,
+    NOTIFICATION_OUTBOX_FILE,
+    LAST_NOTIFIED_ID_FILE,
+    HTTP_POOL_SIZE,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_FACTOR
+)
+from notification_outbox import NotificationOutbox
+from watchlist import watchlist_matches
+from http_client import get_session, configure_session
+
+configure_session(pool_size=HTTP_POOL_SIZE, max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR)
 
 # 确保所有必要的目录都存在
 DATA_DIR = "./data"
@@ -24,189 +38,312 @@ logging.basicConfig(
 )
 logger = logging.getLogger('lark_notifier')
 
-def send_lark_notification(post):
+class TokenBucket:
     """
-    向Lark发送通知
-    
-    Args:
-        post (dict): 单个Trump的帖子数据
-    
-    Returns:
-        bool: 发送是否成功
+    Rate limiter: up to capacity requests at once, refilled at rate per
+    second. acquire() sleeps only when the bucket is empty, so a burst
+    within Lark's limit is sent without waiting.
     """
-    if not LARK_WEBHOOK_URL:
-        logger.warning("Missing lark_webhook_url in config file")
-        return False
-    
-    # 准备媒体内容部分
-    media_content = ""
-    if post.get("media") and len(post["media"]) > 0:
-        media_content = "\n\n🖼 *附带媒体文件*: " + post["media"][0]
-    
-    # 格式化创建时间
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+            self.tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+
+# Lark 自定义机器人限流为每秒5次、每分钟100次
+_rate_limiter = TokenBucket(rate=100 / 60, capacity=5)
+
+# 合并通知时每张卡片最多包含的帖子数
+BATCH_SIZE = 5
+
+def format_created_at(post):
+    """格式化帖子的创建时间"""
     try:
         created_at = datetime.fromisoformat(post["created_at"].replace('Z', '+00:00'))
-        formatted_time = created_at.strftime("%Y-%m-%d %H:%M:%S UTC")
+        return created_at.strftime("%Y-%m-%d %H:%M:%S UTC")
     except Exception as e:
         logger.warning(f"Error parsing date {post['created_at']}: {e}")
-        formatted_time = post["created_at"]
-    
-    logger.info(f"Preparing notification for post ID: {post.get('id')}")
-    
-    # 构建Lark消息卡片
-    message = {
-        "msg_type": "interactive",
-        "card": {
-            "config": {
-                "wide_screen_mode": True
-            },
-            "header": {
-                "title": {
-                    "tag": "plain_text",
-                    "content": "🚨 特朗普发布了新推文"
-                },
-                "template": "blue"
-            },
-            "elements": [
+        return post["created_at"]
+
+def _post_elements(post):
+    """单条帖子在卡片中的内容、互动数和原文按钮"""
+    # 准备媒体内容部分
+    media_content = ""
+    if post.get("media") and len(post["media"]) > 0:
+        media_content = "\n\n🖼 *附带媒体文件*: " + post["media"][0]
+
+    # 与旧帖子几乎相同时注明原帖（标记由 near_duplicates.py 写入，这里直接读取，不加载签名计算模块）
+    duplicate_content = ""
+    duplicate = post.get("near_duplicate")
+    if duplicate:
+        duplicate_content = (
+            f"\n🔁 **疑似重复**: 与[之前的帖子](https://truthsocial.com/@realDonaldTrump/{duplicate['id']})"
+            f"相似度 {duplicate['similarity']:.0%}"
+        )
+
+    formatted_time = format_created_at(post)
+    return [
+        {
+            "tag": "div",
+            "text": {
+                "tag": "lark_md",
+                "content": f"**发布时间**: {formatted_time}{duplicate_content}\n\n{post.get('content', '')}{media_content}"
+            }
+        },
+        {
+            "tag": "hr"
+        },
+        {
+            "tag": "div",
+            "fields": [
                 {
-                    "tag": "div",
+                    "is_short": True,
                     "text": {
                         "tag": "lark_md",
-                        "content": f"**发布时间**: {formatted_time}\n\n{post.get('content', '')}{media_content}"
+                        "content": f"**回复**: {post.get('replies_count', 0)}"
                     }
                 },
                 {
-                    "tag": "hr"
+                    "is_short": True,
+                    "text": {
+                        "tag": "lark_md",
+                        "content": f"**转发**: {post.get('reblogs_count', 0)}"
+                    }
                 },
                 {
-                    "tag": "div",
-                    "fields": [
-                        {
-                            "is_short": True,
-                            "text": {
-                                "tag": "lark_md",
-                                "content": f"**回复**: {post.get('replies_count', 0)}"
-                            }
-                        },
-                        {
-                            "is_short": True,
-                            "text": {
-                                "tag": "lark_md",
-                                "content": f"**转发**: {post.get('reblogs_count', 0)}"
-                            }
-                        },
-                        {
-                            "is_short": True,
-                            "text": {
-                                "tag": "lark_md",
-                                "content": f"**点赞**: {post.get('favourites_count', 0)}"
-                            }
-                        }
-                    ]
-                },
+                    "is_short": True,
+                    "text": {
+                        "tag": "lark_md",
+                        "content": f"**点赞**: {post.get('favourites_count', 0)}"
+                    }
+                }
+            ]
+        },
+        {
+            "tag": "action",
+            "actions": [
                 {
-                    "tag": "action",
-                    "actions": [
-                        {
-                            "tag": "button",
-                            "text": {
-                                "tag": "plain_text",
-                                "content": "查看原文"
-                            },
-                            "url": post.get("url", ""),
-                            "type": "default"
-                        }
-                    ]
+                    "tag": "button",
+                    "text": {
+                        "tag": "plain_text",
+                        "content": "查看原文"
+                    },
+                    "url": post.get("url", ""),
+                    "type": "default"
                 }
             ]
         }
+    ]
+
+def _card_message(title, elements, template="blue"):
+    return {
+        "msg_type": "interactive",
+        "card": {
+            "config": {
+                "wide_screen_mode": True
+            },
+            "header": {
+                "title": {
+                    "tag": "plain_text",
+                    "content": title
+                },
+                "template": template
+            },
+            "elements": elements
+        }
     }
-    
-    # 发送请求到Lark
+
+def build_post_card(post):
+    """构建单条帖子的Lark消息卡片"""
+    return _card_message("🚨 特朗普发布了新推文", _post_elements(post))
+
+def build_watchlist_card(post):
+    """构建关注列表命中帖子的高优先级卡片：红色标题，列出命中的分组和关键词"""
+    matches = watchlist_matches(post)
+    terms = [pattern for patterns in matches.values() for pattern in patterns]
+    summary = "\n".join(f"**{group}**: {', '.join(patterns)}" for group, patterns in matches.items())
+    elements = [
+        {
+            "tag": "div",
+            "text": {
+                "tag": "lark_md",
+                "content": summary
+            }
+        },
+        {
+            "tag": "hr"
+        }
+    ]
+    return _card_message(f"⚠️ 关注列表命中: {', '.join(terms)}", elements + _post_elements(post), template="red")
+
+def build_batch_card(posts):
+    """
+    把多条帖子合并成一张Lark消息卡片，按传入顺序排列，帖子之间用分隔线隔开
+    """
+    if len(posts) == 1:
+        return build_post_card(posts[0])
+    elements = []
+    for post in posts:
+        if elements:
+            elements.append({"tag": "hr"})
+        elements.extend(_post_elements(post))
+    return _card_message(f"🚨 特朗普发布了 {len(posts)} 条新推文", elements)
+
+def post_lark_message(message, description, webhook_url=None):
+    """
+    把消息发送到Lark webhook（默认 lark_webhook_url），发送前经过限流
+
+    Returns:
+        bool: 发送是否成功
+    """
+    webhook_url = webhook_url or LARK_WEBHOOK_URL
+    if not webhook_url:
+        logger.warning("Missing lark_webhook_url in config file")
+        return False
+
+    _rate_limiter.acquire()
     try:
-        logger.info(f"Sending notification to Lark for post ID: {post.get('id')}")
-        response = requests.post(
-            LARK_WEBHOOK_URL,
+        logger.info(f"Sending notification to Lark for {description}")
+        response = get_session().post(
+            webhook_url,
             headers={"Content-Type": "application/json"},
             data=json.dumps(message),
             timeout=10
         )
-        
+
         if response.status_code == 200:
-            logger.info(f"Successfully sent notification for post {post.get('id')}")
+            logger.info(f"Successfully sent notification for {description}")
             return True
         else:
             logger.error(f"Failed to send notification: {response.status_code} - {response.text}")
             return False
-            
+
     except Exception as e:
         logger.error(f"Error sending notification: {str(e)}")
         return False
 
-def check_and_notify():
+def send_lark_notification(post):
+    """
+    向Lark发送通知
+    
+    Args:
+        post (dict | Post): 单个Trump的帖子数据，存档字典或 Post 记录均可
+    
+    Returns:
+        bool: 发送是否成功
+    """
+    logger.info(f"Preparing notification for post ID: {post.get('id')}")
+    return post_lark_message(build_post_card(post), f"post {post.get('id')}")
+
+def send_priority_notification(post):
+    """
+    把命中关注列表的帖子单独发送高优先级卡片（lark_priority_webhook_url，
+    未配置时发送到 lark_webhook_url）
+
+    Returns:
+        bool: 发送是否成功
+    """
+    logger.info(f"Preparing watchlist notification for post ID: {post.get('id')}")
+    return post_lark_message(build_watchlist_card(post), f"watchlist post {post.get('id')}",
+                             webhook_url=LARK_PRIORITY_WEBHOOK_URL)
+
+def send_batch_notification(posts):
+    """
+    把多条帖子合并成一张卡片，只发送一次请求
+
+    Args:
+        posts (list): 帖子列表（字典或 Post 记录），最新的在前
+
+    Returns:
+        bool: 发送是否成功
+    """
+    post_ids = ", ".join(str(post.get("id")) for post in posts)
+    logger.info(f"Preparing batch notification for {len(posts)} posts: {post_ids}")
+    return post_lark_message(build_batch_card(posts), f"{len(posts)} posts ({post_ids})")
+
+def read_last_notified_id(last_id_file=LAST_NOTIFIED_ID_FILE):
+    """读取 last_notified_id.txt 中的ID（整数），没有记录时返回 None"""
+    if not os.path.exists(last_id_file):
+        return None
+    with open(last_id_file, "r") as f:
+        last_notified_id = f.read().strip()
+    return int(last_notified_id) if last_notified_id.isdigit() else None
+
+def _update_last_notified_id(post_ids, last_id_file=LAST_NOTIFIED_ID_FILE):
+    """把已送达的最大ID记录到 last_notified_id.txt（只增不减）"""
+    newest = max(int(post_id) for post_id in post_ids)
+    last_notified_id = read_last_notified_id(last_id_file)
+    if last_notified_id is not None and last_notified_id >= newest:
+        return
+    with open(last_id_file, "w") as f:
+        f.write(str(newest))
+    logger.info(f"Updated last notified ID to: {newest}")
+
+def check_and_notify(outbox_file=NOTIFICATION_OUTBOX_FILE, last_id_file=LAST_NOTIFIED_ID_FILE):
     """
-    检查最新帖子并发送通知
+    发送通知队列中到期的帖子
+
+    新帖子由抓取程序直接放入队列（notification_outbox.py），这里不再读取存档。
+    命中关注列表的帖子最先发送，每条一张高优先级卡片，不参与合并。
+    每条帖子送达后单独确认；发送失败的帖子按指数退避重试，超过次数后放弃。
     """
     logger.info("Starting notification check process")
+    outbox = NotificationOutbox(outbox_file)
     try:
-        # 读取存储的最后通知的ID
-        last_notified_id = ""
-        last_id_file = "./data/last_notified_id.txt"
-        
-        if os.path.exists(last_id_file):
-            with open(last_id_file, "r") as f:
-                last_notified_id = f.read().strip()
-                logger.info(f"Last notified post ID: {last_notified_id}")
-        else:
-            logger.info("No previous notification record found")
-        
-        # 加载当前存档
-        archive_file = "./data/truth_archive.json"
-        
-        if not os.path.exists(archive_file):
-            logger.error(f"Archive file not found: {archive_file}")
-            return
-            
-        with open(archive_file, "r", encoding="utf-8") as f:
-            archive = json.load(f)
-        
-        logger.info(f"Loaded archive with {len(archive)} posts")
-        
-        if not archive or len(archive) == 0:
-            logger.warning("Empty archive, no posts to notify about")
+        posts = outbox.due()
+        if not posts:
+            logger.info("No new posts to notify about")
             return
-            
-        # 找出需要通知的新帖子（按创建时间降序排序）
-        new_posts = []
-        for post in archive:
-            if not last_notified_id or post["id"] > last_notified_id:
-                new_posts.append(post)
-                
-        # 按创建时间降序排序
-        new_posts.sort(key=lambda p: p["created_at"], reverse=True)
-        
-        if new_posts:
-            logger.info(f"Found {len(new_posts)} new posts to notify about")
-            
-            # 最多通知5条，防止首次运行时发送过多
-            notify_posts = new_posts[:5]
-            logger.info(f"Will notify about {len(notify_posts)} posts (limited to max 5)")
-            
-            for post in notify_posts:
-                success = send_lark_notification(post)
-                if success and notify_posts.index(post) == 0:
-                    # 保存最新通知的ID
-                    with open(last_id_file, "w") as f:
-                        f.write(post["id"])
-                    logger.info(f"Updated last notified ID to: {post['id']}")
-                    
-                # 避免频繁发送通知
-                time.sleep(1)
+
+        logger.info(f"Found {len(posts)} posts to notify about")
+        delivered = []
+        priority = [post for post in posts if watchlist_matches(post)]
+        posts = [post for post in posts if not watchlist_matches(post)]
+        for post in priority:
+            if send_priority_notification(post):
+                outbox.ack([post.id])
+                delivered.append(post.id)
+            else:
+                outbox.fail([post.id], "watchlist notification failed")
+
+        if LARK_BATCH_NOTIFICATIONS:
+            # 每张卡片最多合并 BATCH_SIZE 条帖子，一次请求发送，整批确认或整批重试
+            for i in range(0, len(posts), BATCH_SIZE):
+                batch = [post.id for post in posts[i:i + BATCH_SIZE]]
+                if send_batch_notification(posts[i:i + BATCH_SIZE]):
+                    outbox.ack(batch)
+                    delivered.extend(batch)
+                else:
+                    outbox.fail(batch, "batch notification failed")
         else:
-            logger.info("No new posts to notify about")
-            
+            for post in posts:
+                # 发送频率由令牌桶限制，不再固定等待1秒
+                if send_lark_notification(post):
+                    outbox.ack([post.id])
+                    delivered.append(post.id)
+                else:
+                    outbox.fail([post.id], "notification failed")
+
+        if delivered:
+            _update_last_notified_id(delivered, last_id_file)
+        outbox.prune()
+
     except Exception as e:
         logger.error(f"Error in check_and_notify: {str(e)}", exc_info=True)
+    finally:
+        outbox.close()
     
     logger.info("Notification check process completed")
 
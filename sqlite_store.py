@@ -0,0 +1,165 @@
+import json
+import sqlite3
+import logging
+
+from post import Post, as_post
+
+logger = logging.getLogger('sqlite_store')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT,
+    created_ms INTEGER NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    url TEXT,
+    media TEXT NOT NULL DEFAULT '[]',
+    replies_count INTEGER NOT NULL DEFAULT 0,
+    reblogs_count INTEGER NOT NULL DEFAULT 0,
+    favourites_count INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS posts_created_at ON posts (created_ms);
+"""
+
+_COLUMNS = "id, created_at, created_ms, content, url, media, replies_count, reblogs_count, favourites_count, extra"
+
+_UPSERT = f"""
+INSERT INTO posts ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    created_at = excluded.created_at,
+    created_ms = excluded.created_ms,
+    content = excluded.content,
+    url = excluded.url,
+    media = excluded.media,
+    replies_count = excluded.replies_count,
+    reblogs_count = excluded.reblogs_count,
+    favourites_count = excluded.favourites_count,
+    extra = excluded.extra
+"""
+
+def _to_row(post):
+    post = as_post(post)
+    return (
+        post.id,
+        post.created_at,
+        int(post.timestamp * 1000),
+        post.content or "",
+        post.url,
+        json.dumps(list(post.media)),
+        post.replies_count or 0,
+        post.reblogs_count or 0,
+        post.favourites_count or 0,
+        json.dumps(post.extra) if post.extra else None
+    )
+
+def _from_row(row):
+    post_id, created_at, _, content, url, media, replies, reblogs, favourites, extra = row
+    return Post(post_id, created_at, content, url, json.loads(media),
+                replies, reblogs, favourites, json.loads(extra) if extra else None)
+
+class PostDatabase:
+    """
+    SQLite table of posts keyed by snowflake ID.
+
+    The ID is the INTEGER PRIMARY KEY, so the table itself is a B-tree
+    ordered by ID: membership, "newer than" and newest-first scans are
+    index lookups rather than passes over the archive. created_ms (the
+    creation time in ms) has its own index for date-range queries.
+    Writes are upserts on id, so re-fetched posts replace their record.
+
+    The database runs in WAL mode, so a long-running scraper and a
+    notifier process can read while the other writes. Like PostIdIndex
+    it supports `in`, len(), iteration over IDs (ascending) and newest().
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._conn = None
+        self.open()
+
+    def open(self):
+        """Opens the database, creating the table and indexes if needed."""
+        self.close()
+        self._conn = sqlite3.connect(self.db_file)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 只在检查点时同步，断电最多丢失最后一次提交
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def __iter__(self):
+        for (post_id,) in self._conn.execute("SELECT id FROM posts ORDER BY id"):
+            yield post_id
+
+    def __contains__(self, post_id):
+        try:
+            post_id = int(post_id)
+        except (TypeError, ValueError):
+            return False
+        return self._conn.execute("SELECT 1 FROM posts WHERE id = ?", (post_id,)).fetchone() is not None
+
+    def newest(self):
+        """The largest (newest) stored ID, or None if the table is empty."""
+        return self._conn.execute("SELECT MAX(id) FROM posts").fetchone()[0]
+
+    def upsert(self, posts):
+        """
+        Inserts or replaces posts (dicts or Post records) in one transaction.
+        posts may be any iterable. Returns the number of posts written.
+        """
+        with self._conn:
+            cursor = self._conn.executemany(_UPSERT, map(_to_row, posts))
+        return cursor.rowcount
+
+    def update_counts(self, posts):
+        """
+        Updates only the engagement counts of stored posts, in one
+        transaction. Returns the number of rows changed.
+        """
+        rows = ((post.get("replies_count", 0), post.get("reblogs_count", 0), post.get("favourites_count", 0),
+                 int(post["id"])) for post in posts)
+        with self._conn:
+            cursor = self._conn.executemany(
+                "UPDATE posts SET replies_count = ?, reblogs_count = ?, favourites_count = ? WHERE id = ?", rows
+            )
+        return cursor.rowcount
+
+    def iter_posts(self, newer_than=None, since=None, until=None, limit=None):
+        """
+        Yields Post records newest first.
+        newer_than bounds the ID (exclusive); since/until bound the creation
+        time as aware datetimes (since inclusive, until exclusive).
+        """
+        conditions, params = [], []
+        if newer_than is not None:
+            conditions.append("id > ?")
+            params.append(int(newer_than))
+        if since is not None:
+            conditions.append("created_ms >= ?")
+            params.append(int(since.timestamp() * 1000))
+        if until is not None:
+            conditions.append("created_ms < ?")
+            params.append(int(until.timestamp() * 1000))
+
+        query = f"SELECT {_COLUMNS} FROM posts"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+
+        for row in self._conn.execute(query, params):
+            yield _from_row(row)
+
+    def checkpoint(self):
+        """Folds the WAL file back into the database file."""
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
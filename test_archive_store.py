@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+"""
+存档存储测试脚本 - 测试追加写入的存档存储
+
+这个脚本可以:
+1. 测试新帖子只追加到分段文件
+2. 测试分段合并到快照
+3. 测试中断写入后的容错
+4. 测试帖子ID索引
+5. 测试增量CSV写入与合并导出
+6. 测试按ID合并插入新帖子
+7. 测试流式读取存档
+8. 测试 Post 记录的序列化与存储
+9. 测试列式导出的增量写入与合并
+10. 测试 SQLite 存储后端
+"""
+
+import os
+import sys
+import csv
+import json
+import shutil
+import subprocess
+import logging
+import argparse
+from datetime import datetime, timezone
+
+from archive_store import ArchiveStore, SqliteArchiveStore, merge_posts, write_csv, write_json_array, iter_json_array, post_to_csv_row
+from id_index import PostIdIndex
+from post import Post
+from columnar import ColumnarExport, resolve_format, PARQUET, NPZ
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('archive_store_test')
+
+TEST_DIR = "./test_data/archive_store"
+
+def make_post(post_id, created_at):
+    """生成测试帖子"""
+    return {
+        "id": str(post_id),
+        "created_at": created_at,
+        "content": f"测试帖子 {post_id}",
+        "url": f"https://truthsocial.com/@realDonaldTrump/{post_id}",
+        "media": [],
+        "replies_count": 1,
+        "reblogs_count": 2,
+        "favourites_count": 3
+    }
+
+SNAPSHOT_POSTS = [
+    make_post(114130744626893259, "2025-03-09T05:09:17.893Z"),
+    make_post(114130123456789012, "2025-03-09T02:31:05.000Z"),
+]
+
+NEW_POSTS = [
+    make_post(114132050804394743, "2025-03-09T10:41:28.605Z"),
+]
+
+def make_store(compact_threshold=500, with_index=False):
+    """在干净的测试目录中创建存档存储"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    os.makedirs(TEST_DIR, exist_ok=True)
+
+    snapshot_file = f"{TEST_DIR}/truth_archive.json"
+    with open(snapshot_file, "w", encoding="utf-8") as f:
+        json.dump(SNAPSHOT_POSTS, f, indent=2)
+
+    index_file = f"{TEST_DIR}/truth_archive.ids" if with_index else None
+    return ArchiveStore(snapshot_file, f"{TEST_DIR}/truth_archive.jsonl",
+                        index_file=index_file, compact_threshold=compact_threshold)
+
+def test_append_only_writes_new_posts():
+    """测试追加写入不会重写快照"""
+    logger.info("===== 测试追加写入 =====")
+    store = make_store()
+    snapshot_mtime = os.path.getmtime(store.snapshot_file)
+
+    store.append_posts(NEW_POSTS)
+
+    segment_size = os.path.getsize(store.segment_file)
+    logger.info(f"分段文件大小: {segment_size} 字节")
+    assert os.path.getmtime(store.snapshot_file) == snapshot_mtime
+    assert store.segment_count() == 1
+
+    posts = store.load_posts()
+    logger.info(f"加载到 {len(posts)} 条帖子，最新: {posts[0]['id']}")
+    assert [post["id"] for post in posts] == [
+        "114132050804394743", "114130744626893259", "114130123456789012"
+    ]
+
+def test_compaction():
+    """测试分段合并到快照"""
+    logger.info("===== 测试分段合并 =====")
+    store = make_store(compact_threshold=2)
+
+    store.append_posts(NEW_POSTS)
+    assert os.path.exists(store.segment_file)
+
+    # 更新已有帖子的记录，第二条记录触发合并
+    updated = dict(SNAPSHOT_POSTS[0], favourites_count=99)
+    store.append_posts([updated])
+
+    assert not os.path.exists(store.segment_file)
+    with open(store.snapshot_file, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    logger.info(f"合并后快照包含 {len(snapshot)} 条帖子")
+    assert len(snapshot) == 3
+    assert snapshot[1]["favourites_count"] == 99
+
+def test_truncated_segment():
+    """测试分段文件最后一行不完整时的容错"""
+    logger.info("===== 测试中断写入容错 =====")
+    store = make_store()
+    store.append_posts(NEW_POSTS)
+
+    with open(store.segment_file, "a", encoding="utf-8") as f:
+        f.write('{"id": "1141')
+
+    posts = ArchiveStore(store.snapshot_file, store.segment_file).load_posts()
+    logger.info(f"容错加载到 {len(posts)} 条帖子")
+    assert len(posts) == 3
+
+def test_id_index():
+    """测试帖子ID索引的构建、查询和追加"""
+    logger.info("===== 测试帖子ID索引 =====")
+    store = make_store(with_index=True)
+
+    index = store.load_index()
+    logger.info(f"索引包含 {len(index)} 个ID")
+    assert len(index) == 2
+    assert "114130744626893259" in index
+    assert "114132050804394743" not in index
+    assert "not-a-number" not in index
+
+    assert index.newest() == 114130744626893259
+
+    store.append_posts(NEW_POSTS)
+    assert "114132050804394743" in index
+    assert index.newest() == 114132050804394743
+    assert os.path.getsize(store.index_file) == 3 * 8
+
+    # 新的存储实例应直接复用磁盘上的索引而不是重建
+    reopened = ArchiveStore(store.snapshot_file, store.segment_file, index_file=store.index_file)
+    assert not PostIdIndex(store.index_file).is_stale(store.snapshot_file, store.segment_file)
+    assert "114132050804394743" in reopened.load_index()
+
+    # 比现有ID更早的帖子需要重写索引
+    index.add(["114000000000000000"])
+    assert "114000000000000000" in index
+    assert len(index) == 4
+    index.close()
+    reopened.load_index().close()
+
+def test_incremental_csv():
+    """测试CSV只追加新行，并在导出时按最新优先合并"""
+    logger.info("===== 测试增量CSV =====")
+    store = make_store()
+    store.csv_file = f"{TEST_DIR}/truth_archive.csv"
+    store.csv_segment_file = f"{TEST_DIR}/truth_archive_incremental.csv"
+    write_csv(SNAPSHOT_POSTS, store.csv_file)
+    csv_mtime = os.path.getmtime(store.csv_file)
+
+    store.append_posts(NEW_POSTS)
+    store.append_posts([dict(SNAPSHOT_POSTS[1], replies_count=42)])
+    assert os.path.getmtime(store.csv_file) == csv_mtime
+
+    export_file = f"{TEST_DIR}/export.csv"
+    store.export_csv(export_file)
+    with open(export_file, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    logger.info(f"导出CSV包含 {len(rows) - 1} 行")
+    assert [row[0] for row in rows[1:]] == [
+        "114132050804394743", "114130744626893259", "114130123456789012"
+    ]
+    assert rows[3][5] == "42"
+
+    store.compact()
+    assert not os.path.exists(store.csv_segment_file)
+    with open(store.csv_file, "r", newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f)) == rows
+
+def test_merge_posts():
+    """测试合并插入保持ID降序并替换重复记录"""
+    logger.info("===== 测试合并插入 =====")
+    existing = [make_post(post_id, "") for post_id in (900, 700, 500, 300)]
+    new_posts = [make_post(post_id, "") for post_id in (100, 1000, 600)]
+    new_posts.append(dict(make_post(700, ""), replies_count=7))
+
+    merged = merge_posts(existing, new_posts)
+    logger.info(f"合并结果: {[post['id'] for post in merged]}")
+    assert [post["id"] for post in merged] == ["1000", "900", "700", "600", "500", "300", "100"]
+    assert merged[2]["replies_count"] == 7
+    assert merge_posts([], new_posts)[0]["id"] == "1000"
+
+def test_streaming_read():
+    """测试流式读取与一次性加载结果一致，且可以提前停止"""
+    logger.info("===== 测试流式读取 =====")
+    store = make_store()
+    store.append_posts(NEW_POSTS)
+    store.append_posts([dict(SNAPSHOT_POSTS[1], replies_count=9)])
+
+    posts = list(store.iter_posts())
+    assert [post["id"] for post in posts] == [
+        "114132050804394743", "114130744626893259", "114130123456789012"
+    ]
+    assert posts[2]["replies_count"] == 9
+    assert store.load_posts() == posts
+    assert next(store.iter_posts())["id"] == "114132050804394743"
+
+    # 逐条写出的快照与 json.dump 完全一致，并可用小缓冲区读回
+    json_file = os.path.join(TEST_DIR, "stream.json")
+    write_json_array(posts, json_file)
+    with open(json_file, "r", encoding="utf-8") as f:
+        assert f.read() == json.dumps(posts, indent=2)
+    assert list(iter_json_array(json_file, buffer_size=16)) == posts
+
+    write_json_array([], json_file)
+    assert list(iter_json_array(json_file)) == []
+
+def test_post_records():
+    """测试 Post 记录与字典可以互换使用"""
+    logger.info("===== 测试 Post 记录 =====")
+    data = dict(NEW_POSTS[0], media=["https://static-assets-1.truthsocial.com/a.jpg"], tags=["tariffs"])
+    post = Post.from_dict(data)
+    assert post.id == 114132050804394743
+    assert post.created().isoformat() == "2025-03-09T10:41:28.605000+00:00"
+    assert post.to_dict() == data
+    assert post["id"] == data["id"] and post.get("tags") == ["tariffs"] and post.get("missing") is None
+    assert post.to_csv_row() == post_to_csv_row(data)
+    assert not hasattr(post, "__dict__")
+
+    # 与字典相同的赋值：存档字段写到记录上，其他字段放入 extra
+    updated = dict(data)
+    record = Post.from_dict(data)
+    for key, value in [("watchlist", {"countries": ["China"]}), ("media", ["https://example.com/b.jpg"]),
+                       ("replies_count", 7), ("created_at", "2025-03-10T00:00:00.000Z")]:
+        record[key] = updated[key] = value
+    assert record.to_dict() == updated and Post.from_dict(updated) == record
+    assert record.media == ("https://example.com/b.jpg",) and record.timestamp > post.timestamp
+
+    # 无法解析的时间回退到雪花ID中的时间
+    assert abs(Post(114132050804394743, "bad").timestamp - post.timestamp) < 1
+
+    store = make_store()
+    store.append_posts([post])
+    records = store.load_posts(as_records=True)
+    assert records[0] == post
+    assert [record.id for record in records] == [int(p["id"]) for p in store.load_posts()]
+    assert merge_posts(records, [Post.from_dict(SNAPSHOT_POSTS[0])])[1].id == 114130744626893259
+
+def test_columnar_export():
+    """测试列式导出只追加新帖子，读取时以最新记录为准"""
+    logger.info("===== 测试列式导出 =====")
+    # 导出默认关闭，导入存档模块时不加载 pyarrow/numpy
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, archive_store; print(sorted({'pyarrow', 'numpy'} & set(sys.modules)))"],
+        capture_output=True, text=True, check=True
+    ).stdout.strip()
+    assert loaded == "[]", loaded
+
+    formats = [fmt for fmt in (PARQUET, NPZ) if resolve_format(fmt) == fmt]
+    if not formats:
+        logger.warning("未安装 pyarrow 或 numpy，跳过列式导出测试")
+        return
+
+    for fmt in formats:
+        logger.info(f"格式: {fmt}")
+        store = make_store()
+        store.columns = ColumnarExport(f"{TEST_DIR}/columns", fmt, max_parts=3)
+
+        # 首次写入时从完整存档生成
+        store.append_posts(NEW_POSTS)
+        assert len(store.columns.parts()) == 1
+        columns = store.columns.load()
+        assert columns["id"] == [114132050804394743, 114130744626893259, 114130123456789012]
+        assert columns["created_at"][0] == 1741516888605
+        assert columns["replies_count"] == [1, 1, 1]
+
+        # 之后只写新帖子，同一帖子以后写入的记录为准
+        media = ["https://static-assets-1.truthsocial.com/a.jpg", "https://static-assets-1.truthsocial.com/b.mp4"]
+        store.append_posts([dict(SNAPSHOT_POSTS[1], replies_count=9, content="更新 ✓", media=media)])
+        assert len(store.columns.parts()) == 2
+        columns = store.columns.load()
+        assert columns["replies_count"] == [1, 1, 9]
+        assert columns["content"][2] == "更新 ✓"
+        assert columns["media"][2] == media and columns["media"][0] == []
+
+        # 分片超过上限后自动合并
+        store.append_posts([make_post(114132050804394800, "2025-03-09T10:41:30.000Z")])
+        store.append_posts([make_post(114132050804394900, "2025-03-09T10:41:31.000Z")])
+        assert len(store.columns.parts()) == 1
+        assert store.columns.load()["id"][:2] == [114132050804394900, 114132050804394800]
+        assert store.columns.load()["replies_count"][-1] == 9
+
+def test_sqlite_store():
+    """测试 SQLite 存储：导入JSON存档、按ID更新、索引查询和导出"""
+    logger.info("===== 测试 SQLite 存储 =====")
+    json_store = make_store()
+    json_store.append_posts(NEW_POSTS)
+    store = SqliteArchiveStore(f"{TEST_DIR}/truth_archive.db", json_store.snapshot_file, json_store.segment_file,
+                               csv_file=f"{TEST_DIR}/truth_archive.csv")
+
+    # 首次打开时导入现有的快照和分段
+    db = store.load_index()
+    assert store.exists() and len(db) == 3
+    assert "114132050804394743" in db and "114000000000000000" not in db and "not-a-number" not in db
+    assert db.newest() == 114132050804394743
+    assert list(db) == [114130123456789012, 114130744626893259, 114132050804394743]
+    assert store.load_posts() == json_store.load_posts()
+
+    # 同一ID的记录被覆盖而不是重复
+    store.append_posts([dict(SNAPSHOT_POSTS[1], replies_count=42, tags=["tariffs"])])
+    assert len(db) == 3
+    assert store.load_posts()[2]["replies_count"] == 42 and store.load_posts()[2]["tags"] == ["tariffs"]
+
+    assert [post.id for post in store.posts_newer_than(114130123456789012)] == [114132050804394743, 114130744626893259]
+    assert [post.id for post in store.posts_newer_than(None, limit=1)] == [114132050804394743]
+    assert store.posts_newer_than(114132050804394743) == []
+    assert json_store.posts_newer_than(114130123456789012, limit=1)[0].id == 114132050804394743
+
+    since = datetime(2025, 3, 9, 5, tzinfo=timezone.utc)
+    assert [post.id for post in db.iter_posts(since=since)] == [114132050804394743, 114130744626893259]
+
+    # 合并时从数据库导出快照和CSV，分段文件不再需要
+    store.compact()
+    assert not os.path.exists(store.segment_file)
+    with open(store.snapshot_file, "r", encoding="utf-8") as f:
+        assert json.load(f) == store.load_posts()
+    with open(store.csv_file, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert [row[0] for row in rows[1:]] == [
+        "114132050804394743", "114130744626893259", "114130123456789012"
+    ]
+    assert rows[3][5] == "42"
+
+    # 重新打开时不会再次导入
+    reopened = SqliteArchiveStore(store.db_file, store.snapshot_file, store.segment_file)
+    assert len(reopened.load_index()) == 3
+    db.close()
+    reopened.load_index().close()
+
+def cleanup():
+    """清理测试环境"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    logger.info("测试环境已清理")
+
+def main():
+    parser = argparse.ArgumentParser(description="存档存储测试工具")
+    parser.add_argument('--test', choices=['all', 'append', 'compact', 'truncated', 'index', 'csv', 'merge', 'stream', 'post', 'columns', 'sqlite'],
+                      default='all', help='测试类型: append=追加写入, compact=分段合并, truncated=中断容错, index=ID索引, csv=增量CSV, merge=合并插入')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
+
+    args = parser.parse_args()
+
+    logger.info("开始存档存储测试")
+    try:
+        if args.test in ['all', 'append']:
+            test_append_only_writes_new_posts()
+
+        if args.test in ['all', 'compact']:
+            test_compaction()
+
+        if args.test in ['all', 'truncated']:
+            test_truncated_segment()
+
+        if args.test in ['all', 'index']:
+            test_id_index()
+
+        if args.test in ['all', 'csv']:
+            test_incremental_csv()
+
+        if args.test in ['all', 'merge']:
+            test_merge_posts()
+
+        if args.test in ['all', 'stream']:
+            test_streaming_read()
+
+        if args.test in ['all', 'post']:
+            test_post_records()
+
+        if args.test in ['all', 'columns']:
+            test_columnar_export()
+
+        if args.test in ['all', 'sqlite']:
+            test_sqlite_store()
+
+    finally:
+        logger.info("存档存储测试完成")
+        if not args.keep:
+            cleanup()
+        else:
+            logger.info("保留测试数据")
+
+if __name__ == "__main__":
+    main()
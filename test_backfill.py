@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+"""
+回填测试脚本 - 测试 archive/async_pager.py 的并发分页引擎和回填脚本
+
+这个脚本可以:
+1. 测试按ID范围分段并发抓取完整时间线，没有重复请求和重复帖子
+2. 测试中断后从已提交的游标继续抓取
+3. 测试请求失败退避时不占用并发名额
+4. 测试回填脚本的并发数设置、Ctrl+C 中断与 --resume 恢复
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import random
+import asyncio
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+
+# 回填脚本位于 archive/ 子目录
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+from async_pager import PaginationEngine, Lane
+import fetch_full_archive_concurrency as backfill
+from id_index import datetime_to_snowflake
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('backfill_test')
+
+TEST_DIR = "./test_data/backfill"
+
+START_ID = datetime_to_snowflake(datetime(2025, 1, 1, tzinfo=timezone.utc))
+FLOOR_ID = datetime_to_snowflake(datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+def make_post_ids(count=600, seed=7):
+    """生成 (FLOOR_ID, START_ID) 之间的帖子ID，较早的一半时间里帖子更密集，分段会提前结束"""
+    rng = random.Random(seed)
+    middle = FLOOR_ID + (START_ID - FLOOR_ID) // 2
+    ids = {rng.randrange(FLOOR_ID + 1, middle) for _ in range(count * 3 // 4)}
+    ids |= {rng.randrange(middle, START_ID) for _ in range(count // 4)}
+    return sorted(ids, reverse=True)
+
+POST_IDS = make_post_ids()
+
+class FakeTimeline:
+    """
+    模拟带 max_id/since_id 的时间线接口：记录每个请求，统计同时进行的请求数，
+    可以让指定游标的请求失败，或在第 interrupt_at 个请求时向本进程发送 SIGINT（Ctrl+C）
+    """
+
+    def __init__(self, post_ids=POST_IDS, page_size=20, delay=0.002, failures=None, interrupt_at=None):
+        self.post_ids = post_ids
+        self.page_size = page_size
+        self.delay = delay
+        self.failures = dict(failures or {})
+        self.interrupt_at = interrupt_at
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, max_id, since_id):
+        with self._lock:
+            self.requests.append((max_id, since_id))
+            if len(self.requests) == self.interrupt_at:
+                os.kill(os.getpid(), signal.SIGINT)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            with self._lock:
+                if self.failures.get(max_id):
+                    self.failures[max_id] -= 1
+                    raise ConnectionError(f"proxy timeout for max_id={max_id}")
+            page = [post_id for post_id in self.post_ids if since_id < post_id < max_id][:self.page_size]
+            return [self.status(post_id) for post_id in page]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    @staticmethod
+    def status(post_id):
+        return {
+            "id": str(post_id),
+            "created_at": "2024-06-01T12:00:00.000Z",
+            "content": f"<p>帖子 {post_id}</p>",
+            "url": f"https://truthsocial.com/@realDonaldTrump/{post_id}",
+            "media_attachments": [],
+            "replies_count": 0,
+            "reblogs_count": 0,
+            "favourites_count": 0
+        }
+
+def crawl(engine, lanes):
+    """运行引擎，返回消费者按到达顺序收到的帖子ID"""
+    received = []
+    asyncio.run(engine.run(lanes, lambda page: received.extend(int(post["id"]) for post in page)))
+    return received
+
+def test_full_crawl():
+    """测试分段并发抓取完整时间线"""
+    logger.info("===== 测试完整抓取 =====")
+    timeline = FakeTimeline()
+    engine = PaginationEngine(timeline, concurrency=3)
+    received = crawl(engine, PaginationEngine.make_lanes(START_ID, FLOOR_ID, 3))
+    logger.info(f"{engine.requests_made} 个请求抓取了 {len(received)} 条帖子，共 {len(engine.lane_state())} 个分段")
+
+    # 每条帖子只交给消费者一次，没有遗漏
+    assert len(received) == len(set(received))
+    assert sorted(received, reverse=True) == POST_IDS
+    # 每个游标只请求一次，并发不超过上限
+    assert len({max_id for max_id, _ in timeline.requests}) == len(timeline.requests) == engine.requests_made
+    assert timeline.max_active <= 3
+    # 较新的分段先结束，较宽的分段被拆开以保持并发
+    assert len(engine.lane_state()) > 3
+    assert all(lane["done"] for lane in engine.lane_state())
+    assert engine.failed_lanes == []
+
+def interrupt_after(engine, timeline, lanes, on_page, on_checkpoint, requests):
+    """
+    运行引擎，发出 requests 个请求后取消，与 Ctrl+C 时 asyncio.run 取消主任务相同
+    """
+    async def run():
+        task = asyncio.ensure_future(engine.run(lanes, on_page, on_checkpoint, checkpoint_every=4))
+        while len(timeline.requests) < requests and not task.done():
+            await asyncio.sleep(0.001)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+def test_interrupt_and_resume():
+    """测试中断后从检查点中已提交的游标继续"""
+    logger.info("===== 测试中断与恢复 =====")
+    saved = []
+    checkpoints = []
+    timeline = FakeTimeline()
+    engine = PaginationEngine(timeline, concurrency=3)
+    interrupt_after(engine, timeline, PaginationEngine.make_lanes(START_ID, FLOOR_ID, 3),
+                    lambda page: saved.extend(int(post["id"]) for post in page), checkpoints.append, 12)
+
+    # 检查点写成JSON后再读回，与回填脚本相同
+    state = json.loads(json.dumps(engine.lane_state()))
+    assert checkpoints and not all(lane["done"] for lane in state)
+    logger.info(f"中断前保存了 {len(saved)} 条帖子")
+    assert 0 < len(saved) < len(POST_IDS)
+
+    timeline = FakeTimeline()
+    resumed = PaginationEngine(timeline, concurrency=3)
+    saved.extend(crawl(resumed, [Lane.from_dict(lane) for lane in state]))
+
+    # 已保存的帖子不再交给消费者，也不会遗漏已请求但未保存的页
+    assert len(saved) == len(set(saved))
+    assert sorted(saved, reverse=True) == POST_IDS
+    # 只从已提交的游标向下请求，已完成的分段不再请求
+    open_lanes = [lane for lane in state if not lane["done"]]
+    assert all(
+        any(lane["floor"] <= since_id and max_id <= lane["cursor"] for lane in open_lanes)
+        for max_id, since_id in timeline.requests
+    )
+
+def test_backoff_releases_slot():
+    """测试失败的请求退避时，其他分段可以继续请求"""
+    logger.info("===== 测试退避 =====")
+    lanes = PaginationEngine.make_lanes(START_ID, FLOOR_ID, 2)
+    timeline = FakeTimeline(failures={START_ID: 1})
+    engine = PaginationEngine(timeline, concurrency=1, retry_delay=0.2)
+    received = crawl(engine, lanes)
+
+    attempts = [i for i, (max_id, _) in enumerate(timeline.requests) if max_id == START_ID]
+    assert len(attempts) == 2 and attempts[0] == 0
+    # 第一个分段退避期间，第二个分段已经在请求
+    assert attempts[1] > 1
+    assert timeline.requests[1][1] == lanes[1].floor
+    assert sorted(received, reverse=True) == POST_IDS
+    assert engine.requests_made == len(timeline.requests)
+
+    # 超过重试次数的分段记为失败，不标记为已提交完成
+    engine = PaginationEngine(FakeTimeline(failures={START_ID: 3}), concurrency=2, retry_delay=0)
+    received = crawl(engine, PaginationEngine.make_lanes(START_ID, FLOOR_ID, 2))
+    assert len(engine.failed_lanes) == 1 and engine.failed_lanes[0].cursor == START_ID
+    assert engine.lane_state()[0]["cursor"] == START_ID and not engine.lane_state()[0]["done"]
+
+def setup_backfill(timeline):
+    """把回填脚本的文件指向测试目录，用模拟时间线代替代理请求"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    os.makedirs(TEST_DIR, exist_ok=True)
+    backfill.OUTPUT_JSON_FILE = os.path.join(TEST_DIR, "truth_archive_full.json")
+    backfill.OUTPUT_CSV_FILE = os.path.join(TEST_DIR, "truth_archive_full.csv")
+    backfill.CHECKPOINT_FILE = os.path.join(TEST_DIR, "backfill_checkpoint.json")
+    backfill.PAGES_FILE = os.path.join(TEST_DIR, "backfill_pages.jsonl")
+    backfill.CHECKPOINT_EVERY = 4
+    backfill.ACCOUNT_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    backfill.fetch_page = timeline
+
+    # 存档中最早的帖子就是回填的起点
+    oldest = backfill.extract_posts([FakeTimeline.status(START_ID)])
+    backfill.save_to_json(oldest, backfill.OUTPUT_JSON_FILE)
+
+def read_archive():
+    with open(backfill.OUTPUT_JSON_FILE, 'r', encoding='utf-8') as f:
+        return [int(post["id"]) for post in json.load(f)]
+
+def test_backfill_script():
+    """测试回填脚本按并发数分段，Ctrl+C 后保存检查点，--resume 补齐剩余的帖子"""
+    logger.info("===== 测试回填脚本 =====")
+    timeline = FakeTimeline(delay=0.005, interrupt_at=15)
+    setup_backfill(timeline)
+    backfill.fetch_missing_posts(concurrency=2)
+
+    with open(backfill.CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    # 并发数决定初始分段数和同时进行的请求数
+    assert timeline.max_active <= 2
+    assert len(checkpoint["lanes"]) == 2
+    assert checkpoint["start_id"] == START_ID
+    assert read_archive() == [START_ID]
+    # 没有 --resume 时不会覆盖未完成的回填
+    backfill.fetch_missing_posts(concurrency=2)
+    assert os.path.exists(backfill.CHECKPOINT_FILE)
+
+    _, fetched = backfill.load_checkpoint()
+    logger.info(f"中断前已抓取 {len(fetched)} 条帖子")
+    resumed = FakeTimeline()
+    backfill.fetch_page = resumed
+    backfill.fetch_missing_posts(resume=True, concurrency=3)
+
+    assert read_archive() == [START_ID] + POST_IDS
+    assert resumed.max_active <= 3
+    # 连接池按实际并发数创建，高于默认并发数时也不会丢弃连接
+    assert backfill.session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"] == 3
+    backfill.fetch_missing_posts(resume=True, concurrency=backfill.CONCURRENT_REQUESTS + 3)
+    assert backfill.session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"] == \
+        backfill.CONCURRENT_REQUESTS + 3
+    # 检查点之前已保存的页不再请求
+    open_lanes = [lane for lane in checkpoint["lanes"] if not lane["done"]]
+    assert all(
+        any(lane["floor"] <= since_id and max_id <= lane["cursor"] for lane in open_lanes)
+        for max_id, since_id in resumed.requests
+    )
+    assert not os.path.exists(backfill.CHECKPOINT_FILE) and not os.path.exists(backfill.PAGES_FILE)
+
+def cleanup():
+    """清理测试环境"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    logger.info("测试环境已清理")
+
+def main():
+    parser = argparse.ArgumentParser(description="回填测试工具")
+    parser.add_argument('--test', choices=['all', 'crawl', 'resume', 'backoff', 'script'],
+                      default='all', help='测试类型: crawl=完整抓取, resume=中断与恢复, backoff=退避, script=回填脚本')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
+
+    args = parser.parse_args()
+
+    logger.info("开始回填测试")
+    try:
+        if args.test in ['all', 'crawl']:
+            test_full_crawl()
+
+        if args.test in ['all', 'resume']:
+            test_interrupt_and_resume()
+
+        if args.test in ['all', 'backoff']:
+            test_backoff_releases_slot()
+
+        if args.test in ['all', 'script']:
+            test_backfill_script()
+
+    finally:
+        logger.info("回填测试完成")
+        if not args.keep:
+            cleanup()
+        else:
+            logger.info("保留测试数据")
+
+if __name__ == "__main__":
+    main()
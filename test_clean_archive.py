@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+存档清洗测试脚本 - 测试 clean_archive.py 的流式并行清洗
+
+这个脚本可以:
+1. 测试流式读取JSON数组存档
+2. 测试多进程清洗后输出顺序和格式与单进程一致
+3. 测试原地清洗，以及读取失败时不破坏已有输出
+"""
+
+import os
+import json
+import shutil
+import logging
+import argparse
+
+from clean_archive import scrub_archive
+from archive_store import iter_json_array, write_csv
+from normalize import clean_posts
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('clean_archive_test')
+
+TEST_DIR = "./test_data/clean_archive"
+
+def make_archive(count):
+    """生成带HTML和乱码内容的测试存档"""
+    os.makedirs(TEST_DIR, exist_ok=True)
+    posts = [
+        {
+            "id": str(114132050804394743 - i),
+            "created_at": "2025-03-09T10:41:28.605Z",
+            "content": f"<p>测试帖子 {i} &amp; Itâ€™s</p>",
+            "url": f"https://truthsocial.com/@realDonaldTrump/{114132050804394743 - i}",
+            "media": [],
+            "replies_count": i,
+            "reblogs_count": 2,
+            "favourites_count": 3
+        }
+        for i in range(count)
+    ]
+    input_file = os.path.join(TEST_DIR, "truth_archive.json")
+    with open(input_file, 'w', encoding='utf-8') as f:
+        json.dump(posts, f, indent=2)
+    return input_file, posts
+
+def read(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def test_streaming_reader():
+    """测试小缓冲区下的流式读取结果与 json.load 一致"""
+    logger.info("===== 测试流式读取 =====")
+    input_file, posts = make_archive(50)
+    assert list(iter_json_array(input_file, buffer_size=64)) == posts
+
+def test_parallel_scrub():
+    """测试多进程清洗的输出与单进程完全相同"""
+    logger.info("===== 测试并行清洗 =====")
+    input_file, posts = make_archive(250)
+    expected_json = os.path.join(TEST_DIR, "expected.json")
+    expected_csv = os.path.join(TEST_DIR, "expected.csv")
+    cleaned = clean_posts(posts)
+    with open(expected_json, 'w', encoding='utf-8') as f:
+        json.dump(cleaned, f, indent=2, ensure_ascii=False)
+    write_csv(cleaned, expected_csv)
+    assert cleaned[0]["content"] == "测试帖子 0 & It’s"
+
+    for workers in (1, 2):
+        output_json = os.path.join(TEST_DIR, f"scrubbed_{workers}.json")
+        output_csv = os.path.join(TEST_DIR, f"scrubbed_{workers}.csv")
+        count = scrub_archive(input_file, output_json, output_csv, workers=workers, chunk_size=40)
+        logger.info(f"{workers} 个进程清洗了 {count} 条帖子")
+        assert count == 250
+        assert read(output_json) == read(expected_json)
+        assert read(output_csv) == read(expected_csv)
+
+def test_scrub_in_place():
+    """测试输出替换输入时结果正确，读取失败时保留之前的输出"""
+    logger.info("===== 测试原地清洗 =====")
+    input_file, posts = make_archive(30)
+    output_csv = os.path.join(TEST_DIR, "scrubbed.csv")
+    assert scrub_archive(input_file, input_file, output_csv, workers=1, chunk_size=8) == 30
+    assert list(iter_json_array(input_file)) == clean_posts(posts)
+    scrubbed_json, scrubbed_csv = read(input_file), read(output_csv)
+
+    # 输入损坏时抛出错误，已有的输出不被截断，也不留下临时文件
+    broken_file = os.path.join(TEST_DIR, "broken.json")
+    with open(broken_file, 'w', encoding='utf-8') as f:
+        f.write(scrubbed_json[:len(scrubbed_json) // 2])
+    try:
+        scrub_archive(broken_file, input_file, output_csv, workers=1, chunk_size=8)
+        assert False, "a truncated archive should fail"
+    except ValueError:
+        pass
+    assert read(input_file) == scrubbed_json
+    assert read(output_csv) == scrubbed_csv
+    assert not [name for name in os.listdir(TEST_DIR) if name.endswith(".tmp")]
+
+def cleanup():
+    """清理测试环境"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    logger.info("测试环境已清理")
+
+def main():
+    parser = argparse.ArgumentParser(description="存档清洗测试工具")
+    parser.add_argument('--test', choices=['all', 'stream', 'parallel', 'inplace'],
+                      default='all', help='测试类型')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
+
+    args = parser.parse_args()
+
+    logger.info("开始存档清洗测试")
+    try:
+        if args.test in ['all', 'stream']:
+            test_streaming_reader()
+
+        if args.test in ['all', 'parallel']:
+            test_parallel_scrub()
+
+        if args.test in ['all', 'inplace']:
+            test_scrub_in_place()
+
+    finally:
+        logger.info("存档清洗测试完成")
+        if not args.keep:
+            cleanup()
+        else:
+            logger.info("保留测试数据")
+
+if __name__ == "__main__":
+    main()
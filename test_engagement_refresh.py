@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+互动数刷新测试脚本 - 测试按衰减频率重新抓取近期帖子的计数
+
+这个脚本可以:
+1. 测试按帖子年龄衰减的刷新间隔
+2. 测试一页请求覆盖多条到期帖子，并只写回变化的计数
+3. 测试每次运行和每天的请求预算
+4. 测试 SQLite 存储原地更新计数
+5. 测试互动数时间序列的追加与按帖子查询
+"""
+
+import os
+import json
+import shutil
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from archive_store import ArchiveStore, SqliteArchiveStore
+from engagement_refresh import EngagementRefresher, refresh_interval
+from engagement_history import EngagementHistory, RECORD
+from id_index import datetime_to_snowflake
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('engagement_refresh_test')
+
+TEST_DIR = "./test_data/engagement_refresh"
+
+NOW = datetime(2025, 3, 10, 12, tzinfo=timezone.utc)
+
+def make_post(age_hours, replies=1):
+    """生成发布于 age_hours 小时前的存档帖子"""
+    created = NOW - timedelta(hours=age_hours)
+    post_id = datetime_to_snowflake(created)
+    return {
+        "id": str(post_id),
+        "created_at": created.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "content": f"帖子 {age_hours} 小时前",
+        "url": f"https://truthsocial.com/@realDonaldTrump/{post_id}",
+        "media": [],
+        "replies_count": replies,
+        "reblogs_count": 2,
+        "favourites_count": 3
+    }
+
+# 最新优先：1小时、3小时、30小时、10天前
+ARCHIVE = [make_post(age) for age in (1, 3, 30, 240)]
+
+class FakeTimeline:
+    """模拟时间线接口：按 max_id 返回更早的帖子，计数比存档多"""
+
+    def __init__(self, posts, page_size=2, fail_after=None):
+        self.posts = [dict(post, replies_count=post["replies_count"] + 10) for post in posts]
+        self.page_size = page_size
+        self.fail_after = fail_after
+        self.requests = []
+
+    def fetch_page(self, max_id):
+        self.requests.append(max_id)
+        if self.fail_after is not None and len(self.requests) > self.fail_after:
+            raise ConnectionError("proxy timeout")
+        return [post for post in self.posts if int(post["id"]) < max_id][:self.page_size]
+
+def make_store():
+    """在干净的测试目录中创建JSON存档"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    os.makedirs(TEST_DIR, exist_ok=True)
+    snapshot_file = os.path.join(TEST_DIR, "truth_archive.json")
+    with open(snapshot_file, "w", encoding="utf-8") as f:
+        json.dump(ARCHIVE, f, indent=2)
+    return ArchiveStore(snapshot_file, os.path.join(TEST_DIR, "truth_archive.jsonl"))
+
+def make_refresher(timeline, **kwargs):
+    return EngagementRefresher(os.path.join(TEST_DIR, "engagement_refresh.json"), timeline.fetch_page, **kwargs)
+
+def test_refresh_interval():
+    """测试刷新间隔随帖子年龄变长，一周后停止"""
+    logger.info("===== 测试刷新间隔 =====")
+    assert refresh_interval(600) == 15 * 60
+    assert refresh_interval(12 * 3600) == 2 * 3600
+    assert refresh_interval(3 * 24 * 3600) == 12 * 3600
+    assert refresh_interval(8 * 24 * 3600) is None
+
+def test_refresh_updates_counts():
+    """测试到期帖子按页刷新，计数写入分段而不重写快照"""
+    logger.info("===== 测试刷新计数 =====")
+    store = make_store()
+    snapshot_mtime = os.path.getmtime(store.snapshot_file)
+    timeline = FakeTimeline(ARCHIVE)
+    refresher = make_refresher(timeline)
+
+    requests_made, updated = refresher.run(store, now=NOW)
+    logger.info(f"请求 {requests_made} 次，更新 {len(updated)} 条帖子")
+    # 10天前的帖子不再刷新；两页覆盖三条到期帖子
+    assert requests_made == 2
+    assert [post.id for post in updated] == [int(post["id"]) for post in ARCHIVE[:3]]
+    assert os.path.getmtime(store.snapshot_file) == snapshot_mtime
+
+    posts = store.load_posts()
+    assert [post["replies_count"] for post in posts] == [11, 11, 11, 1]
+    assert posts[0]["content"] == ARCHIVE[0]["content"]
+
+    # 刚刷新过的帖子不会立即再次请求
+    assert refresher.run(store, now=NOW + timedelta(minutes=5)) == (0, [])
+    # 15分钟后只有最近6小时内的帖子到期，计数未变化则不写回
+    requests_made, updated = make_refresher(timeline).run(store, now=NOW + timedelta(minutes=16))
+    assert requests_made == 1 and updated == []
+    assert store.segment_count() == 3
+
+def test_request_budget():
+    """测试每次运行与每天的请求上限"""
+    logger.info("===== 测试请求预算 =====")
+    store = make_store()
+    timeline = FakeTimeline(ARCHIVE, page_size=1)
+
+    requests_made, _ = make_refresher(timeline, max_pages_per_run=1).run(store, now=NOW)
+    assert requests_made == 1
+
+    refresher = make_refresher(timeline, max_requests_per_day=2)
+    requests_made, _ = refresher.run(store, now=NOW)
+    assert requests_made == 1
+    assert refresher.run(store, now=NOW) == (0, [])
+
+    # 第二天预算重置
+    requests_made, _ = refresher.run(store, now=NOW + timedelta(days=1))
+    assert requests_made > 0
+
+    # 中途失败时已发出的请求仍计入预算，反复失败不会超出每日上限；到期的帖子保持到期
+    store = make_store()
+    failing = FakeTimeline(ARCHIVE, page_size=1, fail_after=1)
+    refresher = make_refresher(failing, max_requests_per_day=4)
+    for _ in range(3):
+        try:
+            refresher.run(store, now=NOW)
+        except ConnectionError:
+            pass
+    assert len(failing.requests) == 4
+    assert refresher.run(store, now=NOW) == (0, [])
+    assert len(refresher.due_posts(store.load_posts(as_records=True), NOW)) == 3
+
+def test_sqlite_update_counts():
+    """测试 SQLite 存储只更新计数列"""
+    logger.info("===== 测试 SQLite 原地更新 =====")
+    json_store = make_store()
+    store = SqliteArchiveStore(os.path.join(TEST_DIR, "truth_archive.db"), json_store.snapshot_file,
+                               json_store.segment_file)
+    requests_made, updated = make_refresher(FakeTimeline(ARCHIVE)).run(store, now=NOW)
+    assert len(updated) == 3
+    assert [post["replies_count"] for post in store.load_posts()] == [11, 11, 11, 1]
+    assert not os.path.exists(json_store.segment_file)
+    store.load_index().close()
+
+def test_engagement_history():
+    """测试时间序列按月分区追加，并按帖子查询"""
+    logger.info("===== 测试互动数时间序列 =====")
+    make_store()
+    history = EngagementHistory(os.path.join(TEST_DIR, "engagement"))
+    assert history.series(ARCHIVE[0]["id"]) == []
+
+    observed_at = int(NOW.timestamp())
+    assert history.record(ARCHIVE, observed_at=observed_at) == 4
+    assert history.record([dict(ARCHIVE[0], replies_count=50)], observed_at=observed_at + 60) == 1
+    assert history.series(ARCHIVE[0]["id"]) == [(observed_at, 1, 2, 3), (observed_at + 60, 50, 2, 3)]
+    assert history.series(ARCHIVE[3]["id"]) == [(observed_at, 1, 2, 3)]
+
+    # 10天前的帖子属于上个月的分区
+    partition = history.partition_file(ARCHIVE[0]["id"])
+    assert partition.endswith("2025-03.bin")
+    assert history.partition_file(ARCHIVE[3]["id"]).endswith("2025-02.bin")
+    assert os.path.getsize(partition) == 4 * RECORD.size
+
+    # 中断写入留下的半条记录在查询时忽略，下次追加前截掉
+    with open(partition, "ab") as f:
+        f.write(b"\x01\x02")
+    assert len(history.series(ARCHIVE[0]["id"])) == 2
+    history.record([ARCHIVE[1]], observed_at=observed_at + 120)
+    assert os.path.getsize(partition) == 5 * RECORD.size
+    assert history.series(ARCHIVE[1]["id"])[-1] == (observed_at + 120, 1, 2, 3)
+
+    # 刷新时记录每次抓取到的计数，不论是否变化
+    history = EngagementHistory(os.path.join(TEST_DIR, "refresh_history"))
+    make_refresher(FakeTimeline(ARCHIVE), history=history).run(make_store(), now=NOW)
+    assert history.series(ARCHIVE[0]["id"]) == [(int(NOW.timestamp()), 11, 2, 3)]
+    assert history.series(ARCHIVE[3]["id"]) == []
+
+def cleanup():
+    """清理测试环境"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    logger.info("测试环境已清理")
+
+def main():
+    parser = argparse.ArgumentParser(description="互动数刷新测试工具")
+    parser.add_argument('--test', choices=['all', 'interval', 'refresh', 'budget', 'sqlite', 'history'],
+                      default='all', help='测试类型: interval=刷新间隔, refresh=刷新计数, budget=请求预算, sqlite=SQLite更新')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
+
+    args = parser.parse_args()
+
+    logger.info("开始互动数刷新测试")
+    try:
+        if args.test in ['all', 'interval']:
+            test_refresh_interval()
+
+        if args.test in ['all', 'refresh']:
+            test_refresh_updates_counts()
+
+        if args.test in ['all', 'budget']:
+            test_request_budget()
+
+        if args.test in ['all', 'sqlite']:
+            test_sqlite_update_counts()
+
+        if args.test in ['all', 'history']:
+            test_engagement_history()
+
+    finally:
+        logger.info("互动数刷新测试完成")
+        if not args.keep:
+            cleanup()
+        else:
+            logger.info("保留测试数据")
+
+if __name__ == "__main__":
+    main()
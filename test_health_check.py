@@ -6,6 +6,7 @@
 1. 测试错误计数机制
 2. 测试健康告警发送逻辑
 3. 测试每日告警限制功能
+4. 测试导入健康检查和回填脚本时不创建 data/ 目录或配置文件
 """
 
 import os
@@ -13,6 +14,8 @@ import sys
 import json
 import time
 import logging
+import tempfile
+import subprocess
 from datetime import datetime
 import argparse
 
@@ -153,6 +156,16 @@ def test_error_threshold():
     
     logger.info("错误阈值测试完成")
 
+def test_import_side_effects():
+    """测试健康检查和回填脚本只读取环境变量，导入时不创建 data/ 或写入 data/config.json"""
+    logger.info("测试导入无副作用")
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.path.join(root, "archive")]))
+    with tempfile.TemporaryDirectory() as workdir:
+        for module in ["health_check", "fetch_full_archive", "fetch_full_archive_concurrency"]:
+            subprocess.run([sys.executable, "-c", f"import {module}"], cwd=workdir, env=env, check=True)
+            assert os.listdir(workdir) == [], f"importing {module} created {os.listdir(workdir)}"
+
 def cleanup():
     """清理测试环境"""
     # 恢复原始函数
@@ -168,8 +181,8 @@ def cleanup():
 
 def main():
     parser = argparse.ArgumentParser(description="健康检查测试工具")
-    parser.add_argument('--test', choices=['all', 'count', 'limit', 'threshold'], 
-                      default='all', help='测试类型: count=错误计数, limit=每日告警限制, threshold=错误阈值')
+    parser.add_argument('--test', choices=['all', 'count', 'limit', 'threshold', 'imports'], 
+                      default='all', help='测试类型: count=错误计数, limit=每日告警限制, threshold=错误阈值, imports=导入无副作用')
     parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
     
     args = parser.parse_args()
@@ -186,6 +199,9 @@ def main():
             
         if args.test in ['all', 'threshold']:
             test_error_threshold()
+
+        if args.test in ['all', 'imports']:
+            test_import_side_effects()
     
     finally:
         logger.info("健康检查测试完成")
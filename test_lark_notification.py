@@ -7,17 +7,26 @@ Lark通知测试脚本 - 专门测试Lark通知功能
 2. 测试带有媒体文件的通知
 3. 测试批量通知功能
 4. 测试通知去重机制
+5. 测试多条帖子合并成一张卡片（不发送请求）
+6. 测试令牌桶限流
+7. 测试通知队列的去重、确认与重试（不发送请求）
+8. 测试从抓取结果中选出未通知的新帖子
 """
 
 import os
-import json
 import time
 import logging
 from datetime import datetime, timedelta
 import argparse
 
 # 导入我们自己的模块
-from send_lark_notification import send_lark_notification, check_and_notify
+import send_lark_notification as notifier
+from send_lark_notification import (
+    send_lark_notification, check_and_notify, build_post_card, build_batch_card, build_watchlist_card, TokenBucket
+)
+from notification_outbox import NotificationOutbox, select_unnotified
+from watchlist import Watchlist, load_watchlist, watchlist_matches
+from post import Post
 
 # 设置日志
 logging.basicConfig(
@@ -29,6 +38,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger('lark_test')
 
+TEST_OUTBOX_FILE = "./test_data/notification_outbox.db"
+TEST_LAST_ID_FILE = "./test_data/last_notified_id.txt"
+
 # 测试数据
 TEST_POSTS = [
     {
@@ -73,14 +85,10 @@ def setup_test_environment():
     os.makedirs("./test_data", exist_ok=True)
     os.makedirs("./test_data/logs", exist_ok=True)
     
-    # 创建测试存档文件
-    with open("./test_data/truth_archive.json", "w", encoding="utf-8") as f:
-        json.dump(TEST_POSTS, f, indent=2)
-    
-    # 设置模块变量
-    from send_lark_notification import check_and_notify
-    check_and_notify.__globals__["last_id_file"] = "./test_data/last_notified_id.txt"
-    check_and_notify.__globals__["archive_file"] = "./test_data/truth_archive.json"
+    # 把测试帖子放入通知队列，抓取程序会对新帖子做同样的事
+    outbox = NotificationOutbox(TEST_OUTBOX_FILE)
+    outbox.enqueue(TEST_POSTS)
+    outbox.close()
 
 def test_single_notification():
     """测试单条Lark通知"""
@@ -135,14 +143,14 @@ def test_batch_notification():
     logger.info("===== 测试批量通知功能 =====")
     
     # 确保没有以前的通知记录
-    last_id_file = "./test_data/last_notified_id.txt"
+    last_id_file = TEST_LAST_ID_FILE
     if os.path.exists(last_id_file):
         os.remove(last_id_file)
         logger.info("清除通知历史记录")
     
     # 运行批量通知检查
     logger.info("运行批量通知检查")
-    check_and_notify()
+    check_and_notify(TEST_OUTBOX_FILE, last_id_file)
     
     # 验证最后通知ID是否已设置
     if os.path.exists(last_id_file):
@@ -160,19 +168,187 @@ def test_deduplication():
     
     # 第一次运行，应该发送通知
     logger.info("第一次运行批量通知检查")
-    check_and_notify()
+    check_and_notify(TEST_OUTBOX_FILE, TEST_LAST_ID_FILE)
     
     # 短暂暂停
     time.sleep(2)
     
     # 第二次运行，应该不再发送通知
     logger.info("第二次运行批量通知检查 (应该跳过已通知的帖子)")
-    check_and_notify()
+    check_and_notify(TEST_OUTBOX_FILE, TEST_LAST_ID_FILE)
     
     # 验证是否已跳过重复通知
     logger.info("通知去重测试完成，请查看日志确认是否正确跳过了已通知的帖子")
     return True
 
+def test_batch_card():
+    """测试多条帖子合并成一张卡片"""
+    logger.info("===== 测试合并卡片 =====")
+    card = build_batch_card(TEST_POSTS)["card"]
+    logger.info(f"卡片标题: {card['header']['title']['content']}")
+    assert card["header"]["title"]["content"] == "🚨 特朗普发布了 3 条新推文"
+
+    single_elements = build_post_card(TEST_POSTS[0])["card"]["elements"]
+    # 每条帖子的内容块之间多一条分隔线
+    assert len(card["elements"]) == 3 * len(single_elements) + 2
+    buttons = [element["actions"][0]["url"] for element in card["elements"] if element["tag"] == "action"]
+    assert buttons == [post["url"] for post in TEST_POSTS]
+    assert TEST_POSTS[1]["media"][0] in card["elements"][len(single_elements) + 1]["text"]["content"]
+
+    assert build_batch_card(TEST_POSTS[:1]) == build_post_card(TEST_POSTS[0])
+
+def test_token_bucket():
+    """测试令牌桶允许突发请求，超出后按速率等待"""
+    logger.info("===== 测试令牌桶限流 =====")
+    bucket = TokenBucket(rate=20, capacity=3)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+def test_outbox():
+    """测试通知队列：重复入队被忽略，失败后退避重试，成功后不再发送"""
+    logger.info("===== 测试通知队列 =====")
+    os.makedirs("./test_data", exist_ok=True)
+    outbox_file = "./test_data/outbox_test.db"
+    last_id_file = "./test_data/outbox_last_id.txt"
+    for path in (outbox_file, last_id_file):
+        if os.path.exists(path):
+            os.remove(path)
+
+    outbox = NotificationOutbox(outbox_file, max_attempts=2, base_delay=60)
+    now = time.time()
+    assert outbox.enqueue(TEST_POSTS, now=now) == 3
+    assert outbox.enqueue(TEST_POSTS[:1], now=now) == 0
+    assert [post["id"] for post in outbox.due(now=now)] == [post["id"] for post in TEST_POSTS]
+
+    outbox.fail([TEST_POSTS[0]["id"]], "timeout", now=now)
+    assert len(outbox.due(now=now)) == 2
+    assert len(outbox.due(now=now + 60)) == 3
+    # 达到最大次数后放弃
+    outbox.fail([TEST_POSTS[0]["id"]], "timeout", now=now + 60)
+    assert len(outbox.due(now=now + 3600)) == 2
+    outbox.close()
+
+    # 第二条发送失败：其余帖子确认送达，失败的帖子留在队列中重试
+    sent = []
+    original_post = notifier.post_lark_message
+
+    def fake_post(message, description):
+        sent.append(description)
+        return TEST_POSTS[1]["id"] not in description
+
+    notifier.post_lark_message = fake_post
+    try:
+        check_and_notify(outbox_file, last_id_file)
+        assert len(sent) == 2
+        with open(last_id_file, "r") as f:
+            assert f.read() == TEST_POSTS[2]["id"]
+
+        sent.clear()
+        check_and_notify(outbox_file, last_id_file)
+        assert sent == []
+    finally:
+        notifier.post_lark_message = original_post
+
+    outbox = NotificationOutbox(outbox_file)
+    assert outbox.pending_count() == 1
+    assert outbox.due(now=time.time() + 60)[0]["id"] == TEST_POSTS[1]["id"]
+    outbox.close()
+
+def test_select_unnotified():
+    """测试按数字ID选出比上次通知更新的帖子，遇到已通知的帖子即停止"""
+    logger.info("===== 测试选择未通知的帖子 =====")
+    posts = [Post.from_dict(post) for post in TEST_POSTS]
+    assert select_unnotified(posts, None) == posts
+    assert select_unnotified(posts, None, limit=2) == posts[:2]
+    assert select_unnotified(posts, TEST_POSTS[1]["id"]) == posts[:1]
+    assert select_unnotified(posts, int(TEST_POSTS[0]["id"])) == []
+    # 按数字比较：字符串比较会认为 "99" 比任何18位ID都大
+    assert select_unnotified(TEST_POSTS, "99") == TEST_POSTS
+
+    # 之后出现在抓取结果中的较旧帖子不会再次入队
+    outbox_file = "./test_data/select_test.db"
+    os.makedirs("./test_data", exist_ok=True)
+    if os.path.exists(outbox_file):
+        os.remove(outbox_file)
+    outbox = NotificationOutbox(outbox_file)
+    assert outbox.newest_id() is None
+    outbox.enqueue(select_unnotified(posts[1:], outbox.newest_id()))
+    assert outbox.newest_id() == posts[1].id
+    assert select_unnotified(posts, outbox.newest_id()) == posts[:1]
+    outbox.close()
+
+def test_watchlist():
+    """测试关注列表匹配、标记，以及命中帖子单独优先发送"""
+    logger.info("===== 测试关注列表 =====")
+    watchlist = Watchlist({
+        "tickers": ["$DJT", "/\\bTSLA\\b/"],
+        "countries": ["China", "Mexico"],
+        "people": ["Elon Musk"]
+    })
+    assert len(watchlist) == 5
+    assert watchlist.match("CHINA and mexico, and china again. $DJT!") == {
+        "countries": ["China", "Mexico"], "tickers": ["$DJT"]
+    }
+    # 关键词按整词匹配，正则按原样匹配
+    assert watchlist.match("Chinatown DJT") == {}
+    assert watchlist.match("Buy tsla, says Elon Musk") == {"tickers": ["/\\bTSLA\\b/"], "people": ["Elon Musk"]}
+    assert Watchlist({}).match("China") == {}
+    assert len(load_watchlist({"bad": ["/(/"]})) == 0
+
+    # 重叠的命中都要报告：较长关键词中的关键词、正则命中范围内的关键词
+    overlapping = Watchlist({"people": ["Trump"], "tickers": ["Trump Media", "Trump Media Group"]})
+    assert overlapping.match("Trump Media stock is up") == {"people": ["Trump"], "tickers": ["Trump Media"]}
+    assert overlapping.match("Trump Medias") == {"people": ["Trump"]}
+    trade = Watchlist({"countries": ["China"], "trade": ["/tariffs? on china/"]})
+    assert trade.match("New tariffs on China today") == {"trade": ["/tariffs? on china/"], "countries": ["China"]}
+    # 每条正则单独编译，分组和反向引用不受其他规则影响
+    repeated = Watchlist({"words": ["/\\b(\\w+) \\1\\b/"], "countries": ["China"]})
+    assert repeated.match("China China") == {"countries": ["China"], "words": ["/\\b(\\w+) \\1\\b/"]}
+    assert repeated.match("China Mexico") == {"countries": ["China"]}
+
+    posts = [Post.from_dict(dict(post, content=f"{post['content']} China" if i == 1 else post["content"]))
+             for i, post in enumerate(TEST_POSTS)]
+    assert watchlist.tag(posts) == [posts[1]]
+    assert watchlist_matches(posts[1]) == {"countries": ["China"]}
+    assert watchlist_matches(posts[0]) == {}
+    # 命中结果随帖子保存，从队列取出后仍然保留
+    assert Post.from_dict(posts[1].to_dict())["watchlist"] == {"countries": ["China"]}
+
+    card = build_watchlist_card(posts[1])
+    assert card["card"]["header"]["template"] == "red"
+    assert "China" in card["card"]["header"]["title"]["content"]
+
+    os.makedirs("./test_data", exist_ok=True)
+    outbox_file = "./test_data/watchlist_outbox.db"
+    last_id_file = "./test_data/watchlist_last_id.txt"
+    for path in (outbox_file, last_id_file):
+        if os.path.exists(path):
+            os.remove(path)
+    outbox = NotificationOutbox(outbox_file)
+    outbox.enqueue(posts)
+    outbox.close()
+
+    sent = []
+    original_post = notifier.post_lark_message
+
+    def fake_post(message, description, webhook_url=None):
+        sent.append((message["card"]["header"]["template"], description))
+        return True
+
+    notifier.post_lark_message = fake_post
+    try:
+        check_and_notify(outbox_file, last_id_file)
+    finally:
+        notifier.post_lark_message = original_post
+    # 命中的帖子最先发送，使用高优先级卡片
+    assert sent[0] == ("red", f"watchlist post {TEST_POSTS[1]['id']}")
+    assert [template for template, _ in sent[1:]] == ["blue", "blue"]
+
 def cleanup():
     """清理测试环境"""
     try:
@@ -184,12 +360,31 @@ def cleanup():
 
 def main():
     parser = argparse.ArgumentParser(description="Lark通知测试工具")
-    parser.add_argument('--test', choices=['all', 'single', 'media', 'batch', 'dedup'], 
+    parser.add_argument('--test', choices=['all', 'single', 'media', 'batch', 'dedup', 'card', 'ratelimit', 'outbox', 'select', 'watchlist'], 
                       default='all', help='测试类型: single=单条通知, media=带媒体通知, batch=批量通知, dedup=去重机制')
     parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
     
     args = parser.parse_args()
     
+    # 不需要发送请求的测试
+    if args.test in ['all', 'card']:
+        test_batch_card()
+
+    if args.test in ['all', 'ratelimit']:
+        test_token_bucket()
+
+    if args.test in ['all', 'outbox']:
+        test_outbox()
+
+    if args.test in ['all', 'select']:
+        test_select_unnotified()
+
+    if args.test in ['all', 'watchlist']:
+        test_watchlist()
+
+    if args.test in ['card', 'ratelimit', 'outbox', 'select', 'watchlist']:
+        return
+
     # 检查环境变量
     if not os.environ.get("LARK_WEBHOOK_URL"):
         logger.error("未设置LARK_WEBHOOK_URL环境变量")
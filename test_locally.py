@@ -7,6 +7,10 @@
 2. 测试Lark通知功能
 3. 模拟错误并测试健康检查
 4. 验证日志系统是否正常工作
+5. 测试基于 since_id 的增量分页
+6. 测试存档之后的步骤失败时不影响通知，疑似重复索引在通知之后建立
+7. 测试本地索引加载失败时跳过抓取并在下次轮询重试
+8. 测试存档之后、通知之前进程退出时不会漏发通知
 """
 
 import os
@@ -14,12 +18,16 @@ import sys
 import json
 import time
 import shutil
+import signal
 import logging
 from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
 import argparse
 
 # 导入我们自己的模块
 import scrape
+from notification_outbox import NotificationOutbox
+from near_duplicates import NearDuplicateIndex
 from send_lark_notification import check_and_notify, send_lark_notification
 
 # 设置日志
@@ -84,7 +92,18 @@ def setup_test_environment():
     scrape.DATA_DIR = "./test_data"
     scrape.LOG_DIR = "./test_data/logs"
     scrape.OUTPUT_JSON_FILE = "./test_data/truth_archive.json"
+    scrape.OUTPUT_SEGMENT_FILE = "./test_data/truth_archive.jsonl"
+    scrape.OUTPUT_INDEX_FILE = "./test_data/truth_archive.ids"
     scrape.OUTPUT_CSV_FILE = "./test_data/truth_archive.csv"
+    scrape.OUTPUT_CSV_SEGMENT_FILE = "./test_data/truth_archive_incremental.csv"
+    scrape.OUTPUT_COLUMNS_DIR = "./test_data/truth_archive_columns"
+    scrape.OUTPUT_DB_FILE = "./test_data/truth_archive.db"
+    scrape.REFRESH_STATE_FILE = "./test_data/engagement_refresh.json"
+    scrape.OUTPUT_ENGAGEMENT_DIR = "./test_data/engagement"
+    scrape.NOTIFICATION_OUTBOX_FILE = "./test_data/notification_outbox.db"
+    scrape.OUTPUT_SEARCH_DIR = "./test_data/search_index"
+    scrape.OUTPUT_NEAR_DUPLICATES_DB = "./test_data/near_duplicates.db"
+    scrape.OUTPUT_MEDIA_DIR = "./test_data/media"
     scrape.ERROR_COUNT_FILE = "./test_data/error_count.txt"
     scrape.LAST_ALERT_FILE = "./test_data/last_alert.txt"
     
@@ -196,15 +215,15 @@ def test_full_workflow():
     mock_scrape_request("success")
     
     # 2. 检查是否创建了JSON和CSV文件
-    json_exists = os.path.exists(scrape.OUTPUT_JSON_FILE)
+    store = scrape.get_archive_store()
+    json_exists = store.exists()
     csv_exists = os.path.exists(scrape.OUTPUT_CSV_FILE)
-    logger.info(f"JSON文件存在: {json_exists}, CSV文件存在: {csv_exists}")
+    logger.info(f"JSON存档存在: {json_exists}, CSV文件存在: {csv_exists}")
     
     if json_exists:
-        # 读取JSON文件内容
-        with open(scrape.OUTPUT_JSON_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            logger.info(f"抓取到 {len(data)} 条帖子")
+        # 通过存档存储读取（快照 + 追加分段）
+        data = store.load_posts()
+        logger.info(f"抓取到 {len(data)} 条帖子")
     
     # 3. 手动运行通知逻辑
     if os.environ.get("LARK_WEBHOOK_URL"):
@@ -213,10 +232,223 @@ def test_full_workflow():
     else:
         logger.info("跳过通知测试 (未设置LARK_WEBHOOK_URL)")
 
+def test_since_id_pagination():
+    """测试用最新存档ID作为 since_id，追上存档后立即停止分页"""
+    logger.info("测试 since_id 增量分页")
+    setup_test_environment()
+
+    base_id = 114132050804394743
+    timeline = [str(base_id + i) for i in range(45, 0, -1)]  # 最新优先
+    existing_posts = {post_id: {} for post_id in timeline[25:]}
+    requested = []
+
+    def mock_scrape(url, headers=None):
+        query = {k: int(v[0]) for k, v in parse_qs(urlsplit(url).query).items() if k in ("since_id", "max_id")}
+        requested.append(query)
+        page = [
+            post_id for post_id in timeline
+            if int(post_id) > query.get("since_id", 0) and int(post_id) < query.get("max_id", base_id * 2)
+        ]
+        return [dict(SAMPLE_POSTS[0], id=post_id) for post_id in page[:20]]
+
+    original_scrape = scrape.scrape
+    scrape.scrape = mock_scrape
+    try:
+        requests_made = scrape.fetch_posts(max_pages=5, existing_posts=existing_posts)
+        logger.info(f"有25条新帖子时的请求: {requested}")
+        assert requests_made == 2
+        assert all(query["since_id"] == int(timeline[25]) for query in requested)
+        assert requested[1]["max_id"] == int(timeline[19])
+
+        # 没有新帖子时只需要一次请求，响应为空
+        requested.clear()
+        existing_posts = {post_id: {} for post_id in timeline}
+        assert scrape.fetch_posts(max_pages=5, existing_posts=existing_posts) == 1
+        assert requested == [{"since_id": int(timeline[0])}]
+    finally:
+        scrape.scrape = original_scrape
+
+def test_failures_after_archiving():
+    """测试存档之后的附加步骤失败时，新帖子仍然被通知，抓取仍算成功"""
+    logger.info("测试存档后步骤失败不影响通知")
+    setup_test_environment()
+    notified = []
+
+    class BrokenHistory:
+        def record(self, posts):
+            raise IOError("disk full")
+
+    class BrokenIndex:
+        def __init__(self, *args, **kwargs):
+            raise IOError("disk full")
+
+    queued = []
+    originals = (scrape.scrape, scrape.queue_notifications, scrape.send_notifications, scrape.get_engagement_history,
+                 scrape.TextIndex, scrape.NearDuplicateIndex, scrape.MediaMirror, scrape.SEARCH_INDEX,
+                 scrape.NEAR_DUPLICATES, scrape.MEDIA_MIRROR, scrape.USE_LOCAL_ARCHIVE)
+    scrape.scrape = lambda url, headers=None: [dict(post, id=str(int(post["id"]) + 1000)) for post in SAMPLE_POSTS]
+    scrape.queue_notifications = lambda posts: queued.extend(post["id"] for post in posts)
+    scrape.send_notifications = lambda: notified.extend(queued)
+    scrape.get_engagement_history = BrokenHistory
+    scrape.TextIndex = scrape.NearDuplicateIndex = scrape.MediaMirror = BrokenIndex
+    scrape.SEARCH_INDEX = scrape.NEAR_DUPLICATES = scrape.MEDIA_MIRROR = scrape.USE_LOCAL_ARCHIVE = True
+    try:
+        scrape.fetch_posts(max_pages=1, existing_posts={})
+        assert notified == [str(int(post["id"]) + 1000) for post in SAMPLE_POSTS]
+        assert scrape.get_error_count() == 0
+    finally:
+        (scrape.scrape, scrape.queue_notifications, scrape.send_notifications, scrape.get_engagement_history,
+         scrape.TextIndex, scrape.NearDuplicateIndex, scrape.MediaMirror, scrape.SEARCH_INDEX,
+         scrape.NEAR_DUPLICATES, scrape.MEDIA_MIRROR, scrape.USE_LOCAL_ARCHIVE) = originals
+
+def test_near_duplicate_index_after_notifying():
+    """测试首次运行时签名索引在通知之后才由完整存档建立，之后的运行照常标记"""
+    logger.info("测试疑似重复索引在通知之后建立")
+    setup_test_environment()
+    if os.path.exists(scrape.OUTPUT_NEAR_DUPLICATES_DB):
+        os.remove(scrape.OUTPUT_NEAR_DUPLICATES_DB)
+    statement = "The fake news media refuses to report the incredible numbers on jobs and the economy today"
+    indexed_at_notify = []
+
+    def count_signatures():
+        index = NearDuplicateIndex(scrape.OUTPUT_NEAR_DUPLICATES_DB)
+        indexed_at_notify.append(len(index))
+        index.close()
+
+    originals = (scrape.scrape, scrape.queue_notifications, scrape.send_notifications,
+                 scrape.NEAR_DUPLICATES, scrape.USE_LOCAL_ARCHIVE)
+    scrape.queue_notifications = lambda posts: None
+    scrape.send_notifications = count_signatures
+    scrape.NEAR_DUPLICATES = scrape.USE_LOCAL_ARCHIVE = True
+    try:
+        # 已有存档、索引为空：通知时还没有建索引，运行结束时已包含存档和新帖子
+        scrape.get_archive_store().append_posts([dict(SAMPLE_POSTS[0], id="114000000000000001", content=statement)])
+        scrape.scrape = lambda url, headers=None: [dict(SAMPLE_POSTS[0], id="114000000000000002", content=statement)]
+        scrape.fetch_posts(max_pages=1, existing_posts={})
+        index = NearDuplicateIndex(scrape.OUTPUT_NEAR_DUPLICATES_DB)
+        assert indexed_at_notify == [0]
+        assert index.signature("114000000000000001") is not None
+        assert index.signature("114000000000000002") is not None
+        index.close()
+
+        # 索引建立之后，新帖子在存档前被标记
+        scrape.scrape = lambda url, headers=None: [dict(SAMPLE_POSTS[0], id="114000000000000003", content=statement + "!")]
+        scrape.fetch_posts(max_pages=1, existing_posts={})
+        archived = {post["id"]: post for post in scrape.get_archive_store().load_posts()}
+        assert archived["114000000000000003"]["near_duplicate"]["id"] == "114000000000000002"
+        assert "near_duplicate" not in archived["114000000000000002"]
+    finally:
+        (scrape.scrape, scrape.queue_notifications, scrape.send_notifications,
+         scrape.NEAR_DUPLICATES, scrape.USE_LOCAL_ARCHIVE) = originals
+
+def test_index_load_failure():
+    """测试本地索引加载失败时跳过本次抓取，不会把整页帖子当作新帖子重复存档"""
+    logger.info("测试索引加载失败")
+    setup_test_environment()
+    if os.path.exists(scrape.ERROR_COUNT_FILE):
+        os.remove(scrape.ERROR_COUNT_FILE)
+
+    class BrokenStore:
+        def exists(self):
+            return True
+
+        def load_index(self):
+            raise IOError("index unreadable")
+
+    requested = []
+    polled = []
+    loads = []
+
+    def load_once_broken():
+        loads.append(len(loads))
+        if len(loads) == 1:
+            raise IOError("index unreadable")
+        return {SAMPLE_POSTS[0]["id"]: SAMPLE_POSTS[0]}
+
+    def poll(max_pages=3, existing_posts=None):
+        polled.append(existing_posts)
+        os.kill(os.getpid(), signal.SIGINT)
+        return 0
+
+    originals = (scrape.scrape, scrape.get_archive_store, scrape.load_existing_posts, scrape.fetch_posts,
+                 scrape.USE_LOCAL_ARCHIVE)
+    scrape.scrape = lambda url, headers=None: requested.append(url) or SAMPLE_POSTS
+    scrape.get_archive_store = BrokenStore
+    scrape.USE_LOCAL_ARCHIVE = True
+    try:
+        # 单次运行：不抓取，计为一次错误
+        assert scrape.fetch_posts(max_pages=1) == 0
+        assert requested == [] and scrape.get_error_count() == 1
+
+        # 常驻进程：下次轮询重新加载索引，而不是用空字典一直运行下去
+        scrape.load_existing_posts = load_once_broken
+        scrape.fetch_posts = poll
+        scrape.run_daemon(interval=0.01, adaptive=False, refresh=False)
+        assert len(loads) == 2
+        assert polled == [{SAMPLE_POSTS[0]["id"]: SAMPLE_POSTS[0]}]
+    finally:
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        (scrape.scrape, scrape.get_archive_store, scrape.load_existing_posts, scrape.fetch_posts,
+         scrape.USE_LOCAL_ARCHIVE) = originals
+        scrape.update_error_count(success=True)
+
+def test_crash_after_archiving():
+    """测试帖子存档之后、通知发出之前进程退出时，下次运行仍会发送这些帖子"""
+    logger.info("测试存档与通知之间进程退出")
+    setup_test_environment()
+    scrape.NOTIFICATION_OUTBOX_FILE = "./test_data/crash_outbox.db"
+    if os.path.exists(scrape.NOTIFICATION_OUTBOX_FILE):
+        os.remove(scrape.NOTIFICATION_OUTBOX_FILE)
+    new_ids = [str(int(post["id"]) + 2000) for post in SAMPLE_POSTS]
+    sent = []
+
+    class Crash(BaseException):
+        """进程在存档之后被杀掉"""
+
+    real_store = scrape.get_archive_store
+
+    class CrashingStore:
+        def append_posts(self, posts):
+            real_store().append_posts(posts)
+            raise Crash()
+
+    def send_due(outbox_file):
+        outbox = NotificationOutbox(outbox_file)
+        posts = outbox.due()
+        sent.extend(str(post.id) for post in posts)
+        outbox.ack([post.id for post in posts])
+        outbox.close()
+
+    originals = (scrape.scrape, scrape.get_archive_store, scrape.check_and_notify, scrape.read_last_notified_id,
+                 scrape.USE_LOCAL_ARCHIVE, scrape.NEAR_DUPLICATES)
+    scrape.scrape = lambda url, headers=None: [dict(post, id=new_id) for post, new_id in zip(SAMPLE_POSTS, new_ids)]
+    scrape.get_archive_store = CrashingStore
+    scrape.check_and_notify = send_due
+    scrape.read_last_notified_id = lambda: None
+    scrape.USE_LOCAL_ARCHIVE = True
+    scrape.NEAR_DUPLICATES = False
+    try:
+        try:
+            scrape.fetch_posts(max_pages=1, existing_posts={})
+            assert False, "expected the simulated crash"
+        except Crash:
+            pass
+        assert sent == []
+
+        # 下次运行：帖子已在存档中，不再是新帖子，但已在队列里等待发送
+        scrape.scrape = lambda url, headers=None: []
+        scrape.get_archive_store = real_store
+        scrape.fetch_posts(max_pages=1, existing_posts=set(new_ids))
+        assert sent == new_ids
+    finally:
+        (scrape.scrape, scrape.get_archive_store, scrape.check_and_notify, scrape.read_last_notified_id,
+         scrape.USE_LOCAL_ARCHIVE, scrape.NEAR_DUPLICATES) = originals
+
 def main():
     parser = argparse.ArgumentParser(description="Trump Truth Social 爬虫本地测试工具")
-    parser.add_argument('--mode', choices=['full', 'scrape', 'notify', 'error'], 
-                      default='full', help='测试模式: full=完整测试, scrape=仅爬虫, notify=仅通知, error=错误处理')
+    parser.add_argument('--mode', choices=['full', 'scrape', 'notify', 'error', 'since', 'failures'], 
+                      default='full', help='测试模式: full=完整测试, scrape=仅爬虫, notify=仅通知, error=错误处理, since=增量分页, failures=存档后步骤失败')
     parser.add_argument('--clean', action='store_true', help='测试后清理测试数据')
     
     args = parser.parse_args()
@@ -234,6 +466,15 @@ def main():
         if args.mode in ['full', 'error']:
             test_error_handling()
             
+        if args.mode in ['full', 'since']:
+            test_since_id_pagination()
+
+        if args.mode in ['full', 'failures']:
+            test_failures_after_archiving()
+            test_near_duplicate_index_after_notifying()
+            test_index_load_failure()
+            test_crash_after_archiving()
+
         if args.mode == 'full':
             test_full_workflow()
             
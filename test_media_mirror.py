@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""
+媒体镜像测试脚本 - 测试按 SHA-256 存放的媒体下载
+
+这个脚本可以:
+1. 测试并发下载、按内容去重并在帖子上记录本地路径
+2. 测试中断后用 Range 请求续传
+3. 测试下载失败后重试，已下载的URL不再请求
+4. 测试为存档中的帖子补全媒体并写回存档
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+
+from archive_store import ArchiveStore
+from media_mirror import MediaMirror, needs_mirroring, backfill
+from post import Post
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('media_mirror_test')
+
+TEST_DIR = "./test_data/media_mirror"
+MEDIA_DIR = os.path.join(TEST_DIR, "media")
+
+CDN = "https://static-assets-1.truthsocial.com/media_attachments/files"
+IMAGE = b"\x89PNG fake image data" * 100
+VIDEO = b"fake video data" * 1000
+
+class FakeResponse:
+    """模拟流式响应，支持 Range 请求"""
+
+    def __init__(self, body, status_code=200, start=0, headers=None):
+        self.body = body[start:]
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP Error: {self.status_code}")
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+class FakeSession:
+    """模拟CDN：记录请求，统计同时进行的下载数"""
+
+    def __init__(self, files, failing=(), support_range=True):
+        self.files = files
+        self.failing = set(failing)
+        self.support_range = support_range
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        with self._lock:
+            self.requests.append((url, dict(headers or {})))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self._lock:
+            self.active -= 1
+        if url in self.failing or url not in self.files:
+            return FakeResponse(b"", status_code=503)
+        body = self.files[url]
+        range_header = (headers or {}).get("Range")
+        if range_header and self.support_range:
+            start = int(range_header[len("bytes="):-1])
+            if start >= len(body):
+                return FakeResponse(b"", status_code=416, headers={"Content-Range": f"bytes */{len(body)}"})
+            return FakeResponse(body, status_code=206, start=start)
+        return FakeResponse(body)
+
+FILES = {
+    f"{CDN}/a/original/image.png": IMAGE,
+    f"{CDN}/b/original/copy.jpeg": IMAGE,  # 同一张图片的另一个URL和扩展名
+    f"{CDN}/c/original/video.mp4": VIDEO,
+}
+URLS = list(FILES)
+
+def make_post(post_id, media):
+    return {
+        "id": str(post_id),
+        "created_at": "2025-03-09T10:41:28.605Z",
+        "content": f"帖子 {post_id}",
+        "url": f"https://truthsocial.com/@realDonaldTrump/{post_id}",
+        "media": media,
+        "replies_count": 0,
+        "reblogs_count": 0,
+        "favourites_count": 0
+    }
+
+def reset():
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    os.makedirs(TEST_DIR, exist_ok=True)
+
+def test_mirror_and_dedup():
+    """测试并发下载、按内容去重，并记录本地路径"""
+    logger.info("===== 测试下载与去重 =====")
+    reset()
+    session = FakeSession(FILES)
+    mirror = MediaMirror(MEDIA_DIR, workers=2, session=session)
+    posts = [
+        make_post(3, [URLS[0], URLS[2]]),
+        Post.from_dict(make_post(2, [URLS[1]])),
+        make_post(1, []),
+    ]
+    updated = mirror.mirror(posts)
+    assert updated == posts[:2]
+    assert len(session.requests) == 3
+    assert session.max_active <= 2
+
+    image_path, video_path = posts[0]["media_files"]
+    assert os.path.splitext(image_path)[0].endswith(hashlib.sha256(IMAGE).hexdigest())
+    assert os.path.basename(os.path.dirname(os.path.dirname(image_path))) == hashlib.sha256(IMAGE).hexdigest()[:2]
+    with open(video_path, "rb") as f:
+        assert f.read() == VIDEO
+    # 不同URL的相同内容只保存一份
+    assert posts[1]["media_files"] == [image_path]
+    assert len(os.listdir(os.path.dirname(image_path))) == 1
+    assert "media_files" not in posts[2]
+    assert os.listdir(mirror.partial_dir) == []
+
+    # 已下载的URL不再请求，路径不变的帖子不返回
+    session.requests.clear()
+    assert mirror.mirror([make_post(4, [URLS[2]])])[0]["media_files"] == [video_path]
+    assert mirror.mirror(posts) == []
+    assert session.requests == []
+    mirror.close()
+
+def test_resume():
+    """测试中断的下载用 Range 请求续传"""
+    logger.info("===== 测试断点续传 =====")
+    reset()
+    session = FakeSession(FILES)
+    mirror = MediaMirror(MEDIA_DIR, session=session)
+    part_file = os.path.join(mirror.partial_dir, hashlib.sha256(URLS[2].encode("utf-8")).hexdigest() + ".part")
+    with open(part_file, "wb") as f:
+        f.write(VIDEO[:4000])
+
+    digest, path, size = mirror.download(URLS[2])
+    assert session.requests == [(URLS[2], {"Range": "bytes=4000-"})]
+    assert digest == hashlib.sha256(VIDEO).hexdigest() and size == len(VIDEO)
+    assert not os.path.exists(part_file)
+
+    # 服务器不支持 Range 时从头下载
+    with open(part_file, "wb") as f:
+        f.write(b"stale")
+    mirror.session = FakeSession(FILES, support_range=False)
+    assert mirror.download(URLS[2])[0] == hashlib.sha256(VIDEO).hexdigest()
+
+    # 分段文件已完整时服务器返回 416
+    with open(part_file, "wb") as f:
+        f.write(VIDEO)
+    mirror.session = FakeSession(FILES)
+    assert mirror.download(URLS[2]) == (digest, path, len(VIDEO))
+    assert mirror.session.requests == [(URLS[2], {"Range": f"bytes={len(VIDEO)}-"})]
+
+    # 分段文件比服务器上的文件大（文件已被替换）时也返回 416，需要重新下载
+    with open(part_file, "wb") as f:
+        f.write(VIDEO + b"stale")
+    mirror.session = FakeSession(FILES)
+    assert mirror.download(URLS[2]) == (digest, path, len(VIDEO))
+    assert mirror.session.requests == [(URLS[2], {"Range": f"bytes={len(VIDEO) + 5}-"}), (URLS[2], {})]
+    assert not os.path.exists(part_file)
+    mirror.close()
+
+def test_failed_download():
+    """测试下载失败时记录 None，下次重试"""
+    logger.info("===== 测试下载失败 =====")
+    reset()
+    mirror = MediaMirror(MEDIA_DIR, session=FakeSession(FILES, failing=[URLS[2]]))
+    post = make_post(5, [URLS[0], URLS[2]])
+    mirror.mirror([post])
+    assert post["media_files"][1] is None
+    assert needs_mirroring(post)
+
+    mirror.session = FakeSession(FILES)
+    assert mirror.mirror([post]) == [post]
+    assert None not in post["media_files"]
+    assert not needs_mirroring(post)
+    mirror.close()
+
+def test_backfill():
+    """测试为存档中的帖子补全媒体，并写回存档"""
+    logger.info("===== 测试存档补全 =====")
+    reset()
+    snapshot_file = os.path.join(TEST_DIR, "truth_archive.json")
+    with open(snapshot_file, "w", encoding="utf-8") as f:
+        json.dump([make_post(3, [URLS[0]]), make_post(2, []), make_post(1, [URLS[2]])], f, indent=2)
+    store = ArchiveStore(snapshot_file, os.path.join(TEST_DIR, "truth_archive.jsonl"))
+
+    mirror = MediaMirror(MEDIA_DIR, session=FakeSession(FILES))
+    assert backfill(mirror, store) == 2
+    posts = store.load_posts()
+    assert [len(post.get("media_files", [])) for post in posts] == [1, 0, 1]
+    assert backfill(mirror, store) == 0
+    mirror.close()
+
+def cleanup():
+    """清理测试环境"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    logger.info("测试环境已清理")
+
+def main():
+    parser = argparse.ArgumentParser(description="媒体镜像测试工具")
+    parser.add_argument('--test', choices=['all', 'mirror', 'resume', 'failure', 'backfill'],
+                      default='all', help='测试类型: mirror=下载与去重, resume=断点续传, failure=下载失败, backfill=存档补全')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
+
+    args = parser.parse_args()
+
+    logger.info("开始媒体镜像测试")
+    try:
+        if args.test in ['all', 'mirror']:
+            test_mirror_and_dedup()
+
+        if args.test in ['all', 'resume']:
+            test_resume()
+
+        if args.test in ['all', 'failure']:
+            test_failed_download()
+
+        if args.test in ['all', 'backfill']:
+            test_backfill()
+
+    finally:
+        logger.info("媒体镜像测试完成")
+        if not args.keep:
+            cleanup()
+        else:
+            logger.info("保留测试数据")
+
+if __name__ == "__main__":
+    main()
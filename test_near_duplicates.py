@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+疑似重复检测测试脚本 - 测试 MinHash 签名与 LSH 查找
+
+这个脚本可以:
+1. 测试几乎相同与不同内容的签名相似度
+2. 测试新帖子与旧帖子、同一批帖子之间的重复标记
+3. 测试从存档重建签名索引并导出疑似重复帖子
+4. 测试通知卡片中的重复提示
+"""
+
+import os
+import sys
+import csv
+import json
+import shutil
+import logging
+import subprocess
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from archive_store import ArchiveStore
+from near_duplicates import (
+    NearDuplicateIndex, minhash_signature, similarity, near_duplicate_of, export_pairs, NUM_HASHES
+)
+from send_lark_notification import build_post_card
+from id_index import datetime_to_snowflake
+from post import Post
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('near_duplicates_test')
+
+TEST_DIR = "./test_data/near_duplicates"
+DB_FILE = os.path.join(TEST_DIR, "near_duplicates.db")
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+STATEMENT = ("The Radical Left Democrats have done everything possible to destroy our Country, "
+             "but we will never let them get away with it. Make America Great Again!")
+
+def make_post(day, content):
+    """生成发布于 START 之后第 day 天的帖子"""
+    created = START + timedelta(days=day)
+    post_id = datetime_to_snowflake(created)
+    return {
+        "id": str(post_id),
+        "created_at": created.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "content": content,
+        "url": f"https://truthsocial.com/@realDonaldTrump/{post_id}",
+        "media": [],
+        "replies_count": 0,
+        "reblogs_count": 0,
+        "favourites_count": 0
+    }
+
+# 最旧优先
+ARCHIVE = [
+    make_post(1, STATEMENT),
+    make_post(2, "Tariffs are bringing jobs and factories back to the United States at a record pace, "
+                 "and the Fake News refuses to report it."),
+    make_post(3, "Thank you!"),
+]
+
+def reset():
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    os.makedirs(TEST_DIR, exist_ok=True)
+
+def test_signatures():
+    """测试签名相似度：几乎相同的内容接近1，不同内容接近0"""
+    logger.info("===== 测试签名 =====")
+    original = minhash_signature(STATEMENT)
+    assert len(original) == NUM_HASHES
+    assert minhash_signature(STATEMENT) == original
+    assert similarity(original, minhash_signature(STATEMENT.upper())) == 1.0
+
+    repost = minhash_signature(STATEMENT.replace("Make America Great Again!", "MAGA!"))
+    assert similarity(original, repost) >= 0.7
+    assert similarity(original, minhash_signature(ARCHIVE[1]["content"])) < 0.2
+
+    # 太短的帖子不计算签名
+    assert minhash_signature("Thank you!") is None
+    assert minhash_signature("") is None
+
+def test_tag_new_posts():
+    """测试新帖子与旧帖子、同一批内的帖子匹配，并记录在帖子上"""
+    logger.info("===== 测试重复标记 =====")
+    reset()
+    index = NearDuplicateIndex(DB_FILE, threshold=0.6)
+    assert index.add(ARCHIVE) == 2
+    assert index.add(ARCHIVE) == 0
+
+    repost = Post.from_dict(make_post(10, "Repost: " + STATEMENT))
+    unrelated = Post.from_dict(make_post(11, "Just had a great meeting with the Prime Minister of Japan "
+                                             "at the White House about trade and security."))
+    # 同一批中的后一条帖子与前一条几乎相同（批次按最新优先传入）
+    follow_up = make_post(12, "Just had a great meeting with the Prime Minister of Japan "
+                              "at the White House about trade and security!!")
+    flagged = index.tag([follow_up, unrelated, repost])
+    assert flagged == [repost, follow_up]
+    assert near_duplicate_of(repost)["id"] == ARCHIVE[0]["id"]
+    assert near_duplicate_of(follow_up) == {"id": unrelated["id"], "similarity": 1.0}
+    assert near_duplicate_of(unrelated) is None
+    assert len(index) == 5
+
+    # 标记随帖子保存
+    assert Post.from_dict(repost.to_dict())["near_duplicate"]["id"] == ARCHIVE[0]["id"]
+
+    # 只与更早的帖子比较
+    assert index.find(minhash_signature(STATEMENT), before=int(ARCHIVE[0]["id"])) is None
+    index.close()
+
+    # 相似度阈值
+    index = NearDuplicateIndex(DB_FILE, threshold=1.0)
+    post = make_post(20, STATEMENT.replace("never", "not"))
+    assert index.tag([post]) == []
+    index.close()
+
+def test_rebuild_and_export():
+    """测试从存档重建索引，并导出疑似重复的帖子"""
+    logger.info("===== 测试重建与导出 =====")
+    reset()
+    repost = make_post(10, "Repost: " + STATEMENT)
+    snapshot_file = os.path.join(TEST_DIR, "truth_archive.json")
+    with open(snapshot_file, "w", encoding="utf-8") as f:
+        json.dump([repost] + ARCHIVE[::-1], f, indent=2)
+    store = ArchiveStore(snapshot_file, os.path.join(TEST_DIR, "truth_archive.jsonl"))
+
+    index = NearDuplicateIndex(DB_FILE, threshold=0.6)
+    index.add([make_post(30, STATEMENT)])
+    assert index.rebuild(store.iter_posts(as_records=True)) == 3
+    assert len(index) == 3
+
+    export_file = os.path.join(TEST_DIR, "near_duplicates.csv")
+    assert export_pairs(index, store.iter_posts(as_records=True), export_file) == 1
+    with open(export_file, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]["id"] == repost["id"]
+    assert rows[0]["near_duplicate_of"] == ARCHIVE[0]["id"]
+    index.close()
+
+def test_notification_card():
+    """测试通知卡片中注明疑似重复的原帖"""
+    logger.info("===== 测试通知卡片 =====")
+    post = dict(make_post(10, STATEMENT), near_duplicate={"id": ARCHIVE[0]["id"], "similarity": 0.94})
+    content = build_post_card(post)["card"]["elements"][0]["text"]["content"]
+    assert "疑似重复" in content and ARCHIVE[0]["id"] in content and "94%" in content
+    assert "疑似重复" not in build_post_card(ARCHIVE[0])["card"]["elements"][0]["text"]["content"]
+
+    # 通知模块直接读取标记，不加载签名计算；签名模块本身也只在用到时才加载 numpy
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, send_lark_notification, near_duplicates; "
+         "print(sorted({'numpy', 'archive_store', 'columnar'} & set(sys.modules)))"],
+        capture_output=True, text=True, check=True
+    ).stdout.strip()
+    assert loaded == "[]", loaded
+
+def cleanup():
+    """清理测试环境"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    logger.info("测试环境已清理")
+
+def main():
+    parser = argparse.ArgumentParser(description="疑似重复检测测试工具")
+    parser.add_argument('--test', choices=['all', 'signature', 'tag', 'export', 'card'],
+                      default='all', help='测试类型: signature=签名, tag=重复标记, export=重建与导出, card=通知卡片')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
+
+    args = parser.parse_args()
+
+    logger.info("开始疑似重复检测测试")
+    try:
+        if args.test in ['all', 'signature']:
+            test_signatures()
+
+        if args.test in ['all', 'tag']:
+            test_tag_new_posts()
+
+        if args.test in ['all', 'export']:
+            test_rebuild_and_export()
+
+        if args.test in ['all', 'card']:
+            test_notification_card()
+
+    finally:
+        logger.info("疑似重复检测测试完成")
+        if not args.keep:
+            cleanup()
+        else:
+            logger.info("保留测试数据")
+
+if __name__ == "__main__":
+    main()
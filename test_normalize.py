@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+内容规范化测试脚本 - 测试 scrape.py 与 clean_archive.py 共用的清洗流程
+
+这个脚本可以:
+1. 测试HTML标签与实体的处理，以及重复规范化结果不变
+2. 测试转义与乱码Unicode的修复
+3. 测试链接与提及的提取
+4. 测试批量规范化接口，以及链接与提及记录在帖子中
+"""
+
+import random
+import logging
+import argparse
+
+from normalize import (
+    clean_html,
+    fix_unicode,
+    normalize_text,
+    extract_links,
+    extract_mentions,
+    normalize_posts,
+    clean_posts
+)
+from post import Post
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('normalize_test')
+
+SAMPLE_HTML = (
+    '<p>Great &amp; &quot;big&quot; news '
+    '<span class="h-card"><a href="https://truthsocial.com/@WhiteHouse" class="u-url mention">@<span>WhiteHouse</span></a></span> '
+    '<a href="https://www.foxnews.com/story?a=1&amp;b=2" rel="nofollow noopener" target="_blank">foxnews.com</a> '
+    '<a href="https://truthsocial.com/tags/MAGA" class="mention hashtag" rel="tag">#<span>MAGA</span></a></p>'
+)
+
+def make_status(post_id, content):
+    """生成接口返回格式的测试帖子"""
+    return {
+        "id": str(post_id),
+        "created_at": "2025-03-09T10:41:28.605Z",
+        "content": content,
+        "url": f"https://truthsocial.com/@realDonaldTrump/{post_id}",
+        "media_attachments": [{"url": "https://static-assets-1.truthsocial.com/a.jpg"}],
+        "replies_count": 1,
+        "reblogs_count": 2,
+        "favourites_count": 3
+    }
+
+def test_html():
+    """测试去除标签并解码HTML实体"""
+    logger.info("===== 测试HTML处理 =====")
+    text = normalize_text(SAMPLE_HTML)
+    logger.info(f"清洗结果: {text}")
+    assert text == 'Great & "big" news @WhiteHouse foxnews.com #MAGA'
+    assert clean_html("It&#39;s <b>bold</b>") == "It's bold"
+    assert normalize_text(None) == ""
+
+    # 解码后像标签或实体的文本保持转义，其他字符正常解码
+    assert normalize_text("<p>x &lt;b&gt; y</p>") == "x &lt;b&gt; y"
+    assert normalize_text("<p>a &lt; b &amp;&amp; AT&amp;T</p>") == "a < b && AT&T"
+    assert normalize_text("<p>&amp;lt; is written &amp;amp;lt;</p>") == "&amp;lt; is written &amp;amp;lt;"
+
+def test_idempotent():
+    """测试再次规范化已规范化的内容不改变结果（clean_archive.py 会重新清洗存档）"""
+    logger.info("===== 测试幂等 =====")
+    samples = [
+        SAMPLE_HTML, "x &lt;b&gt; y", "<p>x &lt;b&gt; y</p>", "a < b > c", "&amp;lt;", "&amp;amp;",
+        "AT&T &ampx &gt> <&gt>", "Tom &amp; Jerry", "Itâ€™s cafÃ©", "CAFÉ”", "Ü°", "Wait\\u2026 \\u003cb\\u003e", "这是一条测试推文"
+    ]
+    # 再加上由标签、实体和普通字符随机组成的文本
+    rng = random.Random(11)
+    pieces = ["<", ">", "&", ";", "#", "lt", "gt", "amp", "x3c", "60", "b", " ", "<p>", "&lt;", "&amp;", "&#60;"]
+    samples += ["".join(rng.choice(pieces) for _ in range(rng.randrange(1, 12))) for _ in range(2000)]
+    for raw in samples:
+        text = normalize_text(raw)
+        assert normalize_text(text) == text, (raw, text, normalize_text(text))
+
+def test_unicode():
+    """测试转义序列与乱码的修复，不破坏正常的非ASCII文本"""
+    logger.info("===== 测试Unicode修复 =====")
+    assert fix_unicode("Wait\\u2026 \\ud83d\\ude00") == "Wait… 😀"
+    assert fix_unicode("Itâ€™s cafÃ©") == "It’s café"
+    for text in ["naïve résumé — “quoted”", "这是一条测试推文", "é… 😀"]:
+        assert fix_unicode(text) == text
+
+    # 大写字母后紧跟 cp1252 标点的正常文本不是乱码
+    for text in ["CAFÉ”", "Ü°", "“ÉCOLE” ÀŠ", "MÜNCHEN° and CAFÉ™"]:
+        assert normalize_text(text) == text, (text, normalize_text(text))
+    # 整段一起修复；混有无法还原的字符时保持原样，被错误解码两次的文本修复到底
+    assert fix_unicode("Ã©tÃ© â€” ä¸­æ–‡") == "été — 中文"
+    assert fix_unicode("测试 Itâ€™s 中文 cafÃ©") == "测试 It’s 中文 café"
+    assert fix_unicode("Itâ€™s cafÃ© ’") == "Itâ€™s cafÃ© ’"
+    twice = "café".encode("utf-8").decode("cp1252").encode("utf-8").decode("cp1252")
+    assert fix_unicode(twice) == "café" and fix_unicode(fix_unicode(twice)) == "café"
+
+def test_extraction():
+    """测试链接与提及的提取"""
+    logger.info("===== 测试链接与提及提取 =====")
+    links = extract_links(SAMPLE_HTML)
+    mentions = extract_mentions(normalize_text(SAMPLE_HTML))
+    logger.info(f"链接: {links}, 提及: {mentions}")
+    assert links == ["https://www.foxnews.com/story?a=1&b=2"]
+    assert mentions == ["WhiteHouse"]
+    assert extract_mentions("mail me at a@b.com") == []
+
+def test_batch():
+    """测试批量规范化跳过已存档的帖子，并保持存档字段不变"""
+    logger.info("===== 测试批量接口 =====")
+    statuses = [make_status(3, "<p>three</p>"), make_status(2, "<p>two</p>"), make_status(1, "<p>one</p>")]
+    posts = normalize_posts(statuses, skip_ids={"2"})
+    assert [post["id"] for post in posts] == ["3", "1"]
+    assert list(posts[0]) == ["id", "created_at", "content", "url", "media",
+                              "replies_count", "reblogs_count", "favourites_count"]
+
+    # 有链接或提及的帖子额外记录 links/mentions，存为 Post 记录后保留
+    record = normalize_posts([make_status(4, SAMPLE_HTML)])[0]
+    assert record["links"] == ["https://www.foxnews.com/story?a=1&b=2"]
+    assert record["mentions"] == ["WhiteHouse"]
+    assert Post.from_dict(record).to_dict() == record
+    assert posts[0]["content"] == "three"
+    assert posts[0]["media"] == ["https://static-assets-1.truthsocial.com/a.jpg"]
+
+    archived = [{"id": "1", "content": "<p>Tom &amp; Jerry</p>"}]
+    assert clean_posts(archived)[0]["content"] == "Tom & Jerry"
+
+def main():
+    parser = argparse.ArgumentParser(description="内容规范化测试工具")
+    parser.add_argument('--test', choices=['all', 'html', 'idempotent', 'unicode', 'extract', 'batch'],
+                      default='all', help='测试类型')
+
+    args = parser.parse_args()
+
+    logger.info("开始内容规范化测试")
+    if args.test in ['all', 'html']:
+        test_html()
+
+    if args.test in ['all', 'idempotent']:
+        test_idempotent()
+
+    if args.test in ['all', 'unicode']:
+        test_unicode()
+
+    if args.test in ['all', 'extract']:
+        test_extraction()
+
+    if args.test in ['all', 'batch']:
+        test_batch()
+    logger.info("内容规范化测试完成")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+自适应轮询测试脚本 - 测试根据发帖时段调整轮询间隔
+
+这个脚本可以:
+1. 测试发帖频率模型的拟合
+2. 测试活跃时段与深夜的轮询间隔
+3. 测试每日代理请求预算
+4. 测试 cron 模式下的到期判断
+"""
+
+import os
+import shutil
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from poll_scheduler import AdaptivePollScheduler, PostingRateModel, hour_of_week
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('poll_scheduler_test')
+
+TEST_DIR = "./test_data/poll_scheduler"
+
+# 2025-03-10 是周一
+MONDAY = datetime(2025, 3, 10, tzinfo=timezone.utc)
+BUSY = MONDAY.replace(hour=14, minute=5)
+QUIET = MONDAY.replace(hour=4, minute=5)
+
+def make_created_times(weeks=8, posts_per_busy_hour=6):
+    """每天14点集中发帖，其他时段没有帖子"""
+    times = []
+    for day in range(weeks * 7):
+        start = MONDAY - timedelta(days=day) + timedelta(hours=14)
+        for i in range(posts_per_busy_hour):
+            times.append(start + timedelta(minutes=i * 10))
+    return times
+
+def make_scheduler(**kwargs):
+    """在干净的测试目录中创建调度器并拟合模型"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    os.makedirs(TEST_DIR, exist_ok=True)
+    scheduler = AdaptivePollScheduler(os.path.join(TEST_DIR, "poll_scheduler.json"), **kwargs)
+    scheduler.ensure_model(make_created_times)
+    return scheduler
+
+def test_model_fit():
+    """测试模型按每周小时统计发帖频率"""
+    logger.info("===== 测试发帖频率模型 =====")
+    model = PostingRateModel.fit(make_created_times())
+    logger.info(f"14点频率: {model.rate_at(BUSY):.2f}, 4点频率: {model.rate_at(QUIET):.2f}")
+    assert model.post_count == 8 * 7 * 6
+    assert model.rate_at(BUSY) > 10 * model.rate_at(QUIET)
+    assert hour_of_week(BUSY) == 14
+
+    restored = PostingRateModel.from_dict(model.to_dict())
+    assert restored.rates == model.rates
+
+def test_intervals():
+    """测试活跃时段间隔短，深夜间隔长，并限制在上下限内"""
+    logger.info("===== 测试轮询间隔 =====")
+    scheduler = make_scheduler(min_interval=60, max_interval=1800, max_requests_per_day=100000)
+    busy = scheduler.next_interval(BUSY)
+    quiet = scheduler.next_interval(QUIET)
+    logger.info(f"活跃时段间隔: {busy:.0f}s, 深夜间隔: {quiet:.0f}s")
+    assert busy == 60
+    assert quiet == 1800
+
+    # 模型已保存，新实例不需要重新拟合
+    reloaded = AdaptivePollScheduler(scheduler.state_file)
+    reloaded.ensure_model(lambda: [])
+    assert reloaded.model.post_count == scheduler.model.post_count
+
+def test_daily_budget():
+    """测试预算不足时拉长间隔，预算用完后等到第二天"""
+    logger.info("===== 测试每日请求预算 =====")
+    scheduler = make_scheduler(min_interval=60, max_interval=1800, max_requests_per_day=100)
+    stretched = scheduler.next_interval(BUSY)
+    logger.info(f"预算受限的间隔: {stretched:.0f}s")
+    assert stretched > 60
+
+    scheduler.record_poll(100, now=BUSY)
+    wait = scheduler.next_interval(BUSY)
+    assert wait == (MONDAY + timedelta(days=1) - BUSY).total_seconds()
+
+    # 第二天预算重置
+    assert scheduler._requests_today(BUSY + timedelta(days=1)) == 0
+
+def test_should_poll():
+    """测试 cron 模式下只在到期时轮询"""
+    logger.info("===== 测试到期判断 =====")
+    scheduler = make_scheduler(min_interval=60, max_interval=1800, max_requests_per_day=100000)
+    assert scheduler.should_poll(QUIET)
+
+    scheduler.record_poll(1, now=QUIET)
+    assert not scheduler.should_poll(QUIET + timedelta(minutes=1))
+    assert scheduler.should_poll(QUIET + timedelta(minutes=30))
+
+    scheduler.record_poll(1, now=BUSY)
+    assert scheduler.should_poll(BUSY + timedelta(minutes=1))
+
+def cleanup():
+    """清理测试环境"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    logger.info("测试环境已清理")
+
+def main():
+    parser = argparse.ArgumentParser(description="自适应轮询测试工具")
+    parser.add_argument('--test', choices=['all', 'model', 'interval', 'budget', 'due'],
+                      default='all', help='测试类型')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
+
+    args = parser.parse_args()
+
+    logger.info("开始自适应轮询测试")
+    try:
+        if args.test in ['all', 'model']:
+            test_model_fit()
+
+        if args.test in ['all', 'interval']:
+            test_intervals()
+
+        if args.test in ['all', 'budget']:
+            test_daily_budget()
+
+        if args.test in ['all', 'due']:
+            test_should_poll()
+
+    finally:
+        logger.info("自适应轮询测试完成")
+        if not args.keep:
+            cleanup()
+        else:
+            logger.info("保留测试数据")
+
+if __name__ == "__main__":
+    main()
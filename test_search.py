@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+全文检索测试脚本 - 测试倒排索引的构建、增量更新和查询
+
+这个脚本可以:
+1. 测试分词和查询解析
+2. 测试词语、短语和日期范围查询
+3. 测试增量分段、帖子内容更新覆盖旧词条以及分段合并
+4. 测试从存档重建索引并读取匹配帖子
+"""
+
+import os
+import json
+import shutil
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from archive_store import ArchiveStore
+from text_index import TextIndex, tokenize, _encode_postings, _decode_postings
+from search import parse_query, search, load_posts, rebuild_index
+from id_index import datetime_to_snowflake
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 只输出到控制台
+    ]
+)
+logger = logging.getLogger('search_test')
+
+TEST_DIR = "./test_data/search"
+INDEX_DIR = os.path.join(TEST_DIR, "search_index")
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+def make_post(day, content):
+    """生成发布于 START 之后第 day 天的帖子"""
+    created = START + timedelta(days=day)
+    post_id = datetime_to_snowflake(created)
+    return {
+        "id": str(post_id),
+        "created_at": created.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "content": content,
+        "url": f"https://truthsocial.com/@realDonaldTrump/{post_id}",
+        "media": [],
+        "replies_count": 0,
+        "reblogs_count": 0,
+        "favourites_count": 0
+    }
+
+# 最新优先
+POSTS = [
+    make_post(40, "The Fake News Media is at it again!"),
+    make_post(30, "Tariffs are working. Don’t believe the fake polls."),
+    make_post(20, "News from the border: the border is closed."),
+    make_post(10, "Fake news, fake polls, fake everything."),
+]
+
+def post_id(i):
+    return int(POSTS[i]["id"])
+
+def reset():
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    os.makedirs(TEST_DIR, exist_ok=True)
+
+def test_tokenize():
+    """测试分词与查询解析"""
+    logger.info("===== 测试分词 =====")
+    assert tokenize("Don’t believe the FAKE News!") == ["don't", "believe", "the", "fake", "news"]
+    assert parse_query('tariffs "Fake News" covid-19') == [["tariffs"], ["fake", "news"], ["covid", "19"]]
+    assert parse_query('"" !!') == []
+
+    postings = {post_id(3): [0, 5, 9], post_id(0): [1]}
+    assert _decode_postings(_encode_postings(postings)) == postings
+
+def test_queries():
+    """测试词语、短语、日期范围查询，结果最新优先"""
+    logger.info("===== 测试查询 =====")
+    reset()
+    TextIndex(INDEX_DIR).add(POSTS)
+
+    assert search("fake", index_dir=INDEX_DIR) == [post_id(0), post_id(1), post_id(3)]
+    assert search("FAKE news", index_dir=INDEX_DIR) == [post_id(0), post_id(3)]
+    assert search('"fake news"', index_dir=INDEX_DIR) == [post_id(0), post_id(3)]
+    assert search('"media fake"', index_dir=INDEX_DIR) == []
+    assert search('"fake polls" tariffs', index_dir=INDEX_DIR) == [post_id(1)]
+    assert search("don't", index_dir=INDEX_DIR) == [post_id(1)]
+    assert search("border", index_dir=INDEX_DIR) == [post_id(2)]
+    assert search("nonexistent", index_dir=INDEX_DIR) == []
+
+    since, until = START + timedelta(days=15), START + timedelta(days=35)
+    assert search("fake", since=since, until=until, index_dir=INDEX_DIR) == [post_id(1)]
+    assert search("fake", since=datetime(2025, 1, 11), index_dir=INDEX_DIR) == [post_id(0), post_id(1), post_id(3)]
+    assert search("fake", limit=1, index_dir=INDEX_DIR) == [post_id(0)]
+
+def test_incremental_segments():
+    """测试增量分段、内容更新覆盖旧词条以及合并"""
+    logger.info("===== 测试增量分段 =====")
+    reset()
+    index = TextIndex(INDEX_DIR, max_segments=3)
+    index.add(POSTS[2:])
+    index.add(POSTS[1:2])
+    index.add([])
+    assert len(index.segments()) == 2
+    assert index.search([["fake"]]) == [post_id(1), post_id(3)]
+
+    # 同一帖子在新分段中重新索引后，旧分段里的词条不再匹配
+    index.add([dict(POSTS[3], content="Cleaned content")])
+    assert index.search([["fake"]]) == [post_id(1)]
+    assert index.search([["cleaned"]]) == [post_id(3)]
+
+    # 超过 max_segments 时合并成一个分段，结果不变
+    index.add(POSTS[:1])
+    assert len(index.segments()) == 1
+    assert index.search([["fake"]]) == [post_id(0), post_id(1)]
+    assert index.search([["cleaned", "content"]]) == [post_id(3)]
+    assert index.search([["border"]]) == [post_id(2)]
+
+    # 未写完词典的分段会被忽略
+    with open(os.path.join(INDEX_DIR, "part-000099.postings"), "wb") as f:
+        f.write(b"\x01")
+    assert len(index.segments()) == 1
+
+def test_rebuild_from_archive():
+    """测试从存档重建索引，并按结果读取帖子内容"""
+    logger.info("===== 测试从存档重建 =====")
+    reset()
+    snapshot_file = os.path.join(TEST_DIR, "truth_archive.json")
+    with open(snapshot_file, "w", encoding="utf-8") as f:
+        json.dump(POSTS, f, indent=2)
+    store = ArchiveStore(snapshot_file, os.path.join(TEST_DIR, "truth_archive.jsonl"))
+
+    TextIndex(INDEX_DIR).add(POSTS[:1])
+    rebuild_index(INDEX_DIR, store=store)
+    assert len(TextIndex(INDEX_DIR).segments()) == 1
+
+    matches = search('"fake polls"', index_dir=INDEX_DIR)
+    posts = load_posts(matches, store=store)
+    assert [post["content"] for post in posts] == [POSTS[1]["content"], POSTS[3]["content"]]
+
+def cleanup():
+    """清理测试环境"""
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+    logger.info("测试环境已清理")
+
+def main():
+    parser = argparse.ArgumentParser(description="全文检索测试工具")
+    parser.add_argument('--test', choices=['all', 'tokenize', 'query', 'segments', 'rebuild'],
+                      default='all', help='测试类型: tokenize=分词, query=查询, segments=增量分段, rebuild=重建索引')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据文件')
+
+    args = parser.parse_args()
+
+    logger.info("开始全文检索测试")
+    try:
+        if args.test in ['all', 'tokenize']:
+            test_tokenize()
+
+        if args.test in ['all', 'query']:
+            test_queries()
+
+        if args.test in ['all', 'segments']:
+            test_incremental_segments()
+
+        if args.test in ['all', 'rebuild']:
+            test_rebuild_from_archive()
+
+    finally:
+        logger.info("全文检索测试完成")
+        if not args.keep:
+            cleanup()
+        else:
+            logger.info("保留测试数据")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import mmap
+import logging
+from array import array
+from collections import defaultdict
+
+logger = logging.getLogger('text_index')
+
+_TOKEN_RE = re.compile(r"\w+(?:'\w+)*")
+_SEGMENT_RE = re.compile(r'^part-(\d+)\.terms\.json$')
+
+def tokenize(text):
+    """Lowercased word tokens of text, keeping inner apostrophes (don't)."""
+    return _TOKEN_RE.findall((text or "").replace("’", "'").lower())
+
+def _encode_varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _decode_varints(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+def _encode_postings(postings):
+    """
+    Encodes {post_id: [positions]} as varints: for each post in ascending
+    ID order the ID delta, the number of positions and the position deltas.
+    """
+    out = bytearray()
+    previous = 0
+    for post_id in sorted(postings):
+        positions = postings[post_id]
+        _encode_varint(post_id - previous, out)
+        _encode_varint(len(positions), out)
+        last = 0
+        for position in positions:
+            _encode_varint(position - last, out)
+            last = position
+        previous = post_id
+    return out
+
+def _decode_postings(data):
+    values = _decode_varints(data)
+    postings = {}
+    post_id = i = 0
+    while i < len(values):
+        post_id += values[i]
+        count = values[i + 1]
+        i += 2
+        positions = []
+        position = 0
+        for delta in values[i:i + count]:
+            position += delta
+            positions.append(position)
+        i += count
+        postings[post_id] = positions
+    return postings
+
+class _Segment:
+    """
+    One immutable index segment: part-N.postings (concatenated posting
+    lists), part-N.docs (sorted post IDs, uint64) and part-N.terms.json
+    (term -> [offset, length]). The terms file is written last, so a
+    segment without it is incomplete and ignored.
+    """
+
+    def __init__(self, directory, number):
+        self.number = number
+        self.base = os.path.join(directory, f"part-{number:06d}")
+        with open(f"{self.base}.terms.json", 'r', encoding='utf-8') as f:
+            self.terms = json.load(f)
+        self._docs = None
+
+    def files(self):
+        return [f"{self.base}.postings", f"{self.base}.docs", f"{self.base}.terms.json"]
+
+    def docs(self):
+        """Set of post IDs indexed in this segment."""
+        if self._docs is None:
+            ids = array('Q')
+            with open(f"{self.base}.docs", 'rb') as f:
+                ids.frombytes(f.read())
+            self._docs = set(ids)
+        return self._docs
+
+    def postings(self, term):
+        entry = self.terms.get(term)
+        if entry is None:
+            return {}
+        offset, length = entry
+        with open(f"{self.base}.postings", 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _decode_postings(data[offset:offset + length])
+
+    def all_postings(self):
+        return {term: self.postings(term) for term in self.terms}
+
+class TextIndex:
+    """
+    On-disk inverted index over post content.
+
+    Each term maps to a posting list of the posts containing it, stored as
+    varint-compressed ID deltas plus token positions (for phrase queries).
+    Like the archive store, the index is a set of immutable segments: each
+    add() writes the new posts as a small segment, and once there are more
+    than max_segments they are merged into one. A post indexed again in a
+    later segment (e.g. after its content was cleaned) supersedes its
+    earlier entries.
+
+    Snowflake IDs encode the creation time, so date ranges are ID ranges
+    and need no extra data.
+    """
+
+    def __init__(self, directory, max_segments=16):
+        self.directory = directory
+        self.max_segments = max_segments
+
+    def segments(self):
+        """Complete segments, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        numbers = sorted(
+            int(match.group(1)) for match in map(_SEGMENT_RE.match, os.listdir(self.directory)) if match
+        )
+        return [_Segment(self.directory, number) for number in numbers]
+
+    def _write_segment(self, index, post_ids, number=None):
+        os.makedirs(self.directory, exist_ok=True)
+        if number is None:
+            segments = self.segments()
+            number = segments[-1].number + 1 if segments else 0
+        base = os.path.join(self.directory, f"part-{number:06d}")
+
+        terms = {}
+        with open(f"{base}.postings", 'wb') as f:
+            offset = 0
+            for term in sorted(index):
+                data = _encode_postings(index[term])
+                f.write(data)
+                terms[term] = [offset, len(data)]
+                offset += len(data)
+        with open(f"{base}.docs", 'wb') as f:
+            f.write(array('Q', sorted(post_ids)).tobytes())
+        tmp_file = f"{base}.terms.json.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, f"{base}.terms.json")
+        return number
+
+    @staticmethod
+    def _build(posts):
+        index = defaultdict(dict)
+        post_ids = set()
+        for post in posts:
+            post_id = int(post["id"])
+            post_ids.add(post_id)
+            positions = defaultdict(list)
+            for position, token in enumerate(tokenize(post.get("content"))):
+                positions[token].append(position)
+            for token, token_positions in positions.items():
+                index[token][post_id] = token_positions
+        return index, post_ids
+
+    def add(self, posts):
+        """Indexes posts (dicts or Post records) as a new segment."""
+        index, post_ids = self._build(posts)
+        if not post_ids:
+            return
+        number = self._write_segment(index, post_ids)
+        logger.info(f"Indexed {len(post_ids)} posts in search segment {number}")
+        if len(self.segments()) > self.max_segments:
+            self.compact()
+
+    def rebuild(self, posts):
+        """Replaces the index with a single segment built from posts."""
+        old_segments = self.segments()
+        index, post_ids = self._build(posts)
+        number = self._write_segment(index, post_ids)
+        self._remove(old_segments)
+        logger.info(f"Built search index for {len(post_ids)} posts")
+        return number
+
+    @staticmethod
+    def _remove(segments):
+        for segment in segments:
+            # 先删除词典文件，这样中断时残留的分段会被忽略
+            for path in reversed(segment.files()):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def compact(self):
+        """Merges all segments into one."""
+        segments = self.segments()
+        if len(segments) <= 1:
+            return
+        index = defaultdict(dict)
+        post_ids = set()
+        for segment in segments:
+            # 较新的分段覆盖同一帖子在旧分段中的全部词条
+            superseded = segment.docs()
+            for postings in index.values():
+                for post_id in superseded & postings.keys():
+                    del postings[post_id]
+            for term, postings in segment.all_postings().items():
+                index[term].update(postings)
+            post_ids |= superseded
+        index = {term: postings for term, postings in index.items() if postings}
+        number = self._write_segment(index, post_ids)
+        self._remove(segments)
+        logger.info(f"Compacted {len(segments)} search segments into segment {number}")
+
+    def postings(self, term, segments=None):
+        """{post_id: [positions]} for term across all segments."""
+        segments = self.segments() if segments is None else segments
+        merged = {}
+        superseded = set()
+        for segment in reversed(segments):
+            for post_id, positions in segment.postings(term).items():
+                if post_id not in superseded and post_id not in merged:
+                    merged[post_id] = positions
+            if segment is not segments[0]:
+                superseded |= segment.docs()
+        return merged
+
+    def search(self, phrases, min_id=None, max_id=None):
+        """
+        Returns the IDs of posts containing every phrase, newest first.
+        phrases is a list of token lists (a single-token list is a term).
+        min_id/max_id bound the IDs (inclusive/exclusive).
+        """
+        phrases = [phrase for phrase in phrases if phrase]
+        if not phrases:
+            return []
+        segments = self.segments()
+        cache = {}
+
+        def term_postings(term):
+            if term not in cache:
+                cache[term] = self.postings(term, segments)
+            return cache[term]
+
+        candidates = None
+        for phrase in sorted(phrases, key=lambda phrase: min(len(term_postings(term)) for term in phrase)):
+            lists = [term_postings(term) for term in phrase]
+            matched = set.intersection(*(set(postings) for postings in lists))
+            if candidates is not None:
+                matched &= candidates
+            if len(phrase) > 1:
+                matched = {post_id for post_id in matched if _phrase_at(post_id, lists)}
+            candidates = matched
+            if not candidates:
+                return []
+
+        return sorted(
+            (post_id for post_id in candidates
+             if (min_id is None or post_id >= min_id) and (max_id is None or post_id < max_id)),
+            reverse=True
+        )
+
+def _phrase_at(post_id, lists):
+    # 第 i 个词出现在第一个词之后第 i 个位置
+    following = [set(postings[post_id]) for postings in lists[1:]]
+    return any(
+        all(start + i + 1 in positions for i, positions in enumerate(following))
+        for start in lists[0][post_id]
+    )
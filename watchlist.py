@@ -0,0 +1,128 @@
+import re
+import logging
+
+logger = logging.getLogger('watchlist')
+
+# 帖子中记录命中结果的字段，只在有命中时出现
+WATCHLIST_FIELD = "watchlist"
+
+_WORD_CHAR = re.compile(r"\w")
+
+def _trie_regex(trie):
+    """Regular expression matching the words of a character trie, longest first."""
+    alternatives = [re.escape(char) + _trie_regex(child) for char, child in sorted(trie.items()) if char]
+    if not alternatives:
+        return ""
+    expression = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    # "" 标记单词在此结束，更长的词优先匹配
+    return f"(?:{expression})?" if "" in trie else expression
+
+class Watchlist:
+    """
+    Keyword/regex watchlist.
+
+    The configuration maps a group name (e.g. "tickers", "countries",
+    "people") to a list of patterns. A pattern written as /.../ is a
+    regular expression; anything else is a keyword, matched as a whole
+    word. Matching ignores case. Every pattern that matches is reported,
+    including overlapping ones ("Trump" inside "Trump Media").
+
+    All keywords are folded into one character trie, compiled as a
+    regular expression inside a lookahead, so at each position of a post
+    the expression follows a single branch rather than trying every
+    keyword. The lookahead finds the longest keyword starting there; the
+    shorter keywords it begins with are read off the trie. Each regular
+    expression is compiled and searched on its own, so its groups and
+    backreferences keep their meaning.
+    """
+
+    def __init__(self, groups):
+        self._keywords = {}
+        self._regexes = []
+        self._trie = {}
+        for group, patterns in (groups or {}).items():
+            for pattern in patterns:
+                if len(pattern) > 2 and pattern.startswith("/") and pattern.endswith("/"):
+                    self._regexes.append((group, pattern, re.compile(pattern[1:-1], re.IGNORECASE)))
+                    continue
+                keyword = pattern.lower()
+                self._keywords.setdefault(keyword, []).append((group, pattern))
+                node = self._trie
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                node[""] = {}
+
+        # 零宽匹配：每个位置都尝试一次，重叠的关键词不会被跳过
+        self._regex = re.compile(rf"(?<!\w)(?=({_trie_regex(self._trie)})(?!\w))",
+                                 re.IGNORECASE) if self._trie else None
+
+    def __len__(self):
+        return sum(map(len, self._keywords.values())) + len(self._regexes)
+
+    def _prefix_keywords(self, word):
+        """The keywords that word starts with and that end at a word boundary, word itself included."""
+        keywords = []
+        node = self._trie
+        for i, char in enumerate(word):
+            node = node.get(char)
+            if node is None:
+                break
+            if "" in node and (i + 1 == len(word) or not _WORD_CHAR.match(word[i + 1])):
+                keywords.append(word[:i + 1])
+        return keywords
+
+    def match(self, text):
+        """
+        Returns {group: [patterns]} for the patterns found in text, in the
+        order of first appearance, or {} when nothing matches.
+        """
+        if not text:
+            return {}
+        found = []
+        if self._regex is not None:
+            for i, keyword_match in enumerate(self._regex.finditer(text)):
+                for keyword in self._prefix_keywords(keyword_match.group(1).lower()):
+                    found.extend((keyword_match.start(), i, group, pattern)
+                                 for group, pattern in self._keywords.get(keyword, []))
+        for group, pattern, regex in self._regexes:
+            regex_match = regex.search(text)
+            if regex_match:
+                found.append((regex_match.start(), -1, group, pattern))
+
+        matches = {}
+        for _, _, group, pattern in sorted(found, key=lambda hit: hit[:2]):
+            hits = matches.setdefault(group, [])
+            if pattern not in hits:
+                hits.append(pattern)
+        return matches
+
+    def tag(self, posts):
+        """
+        Records the matches of each post (dict or Post record) in its
+        "watchlist" field. Returns the posts that matched.
+        """
+        matched = []
+        for post in posts:
+            matches = self.match(post.get("content"))
+            if not matches:
+                continue
+            post[WATCHLIST_FIELD] = matches
+            matched.append(post)
+        if matched:
+            logger.info(f"{len(matched)} posts matched the watchlist")
+        return matched
+
+def watchlist_matches(post):
+    """The watchlist matches recorded on a post, or {}."""
+    return post.get(WATCHLIST_FIELD) or {}
+
+def load_watchlist(groups):
+    """
+    Compiles the configured watchlist. An invalid regular expression is
+    logged and disables the watchlist rather than stopping the scraper.
+    """
+    try:
+        return Watchlist(groups)
+    except re.error as e:
+        logger.error(f"Invalid watchlist pattern, watchlist disabled: {e}")
+        return Watchlist({})